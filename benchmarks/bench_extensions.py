@@ -0,0 +1,97 @@
+"""
+cost of deciding whether an uri is cacheable by its extension, with __WEB__ + __PKG__ + __PIP__
+
+    python benchmarks/bench_extensions.py [-n URIS] [-r REPEAT]
+
+compares the unordered alternation nginx.conf used to get, a plain sorted alternation and the
+trie-optimized one nginx.conf and the python tools use now (python's re standing in for pcre), with a
+hash lookup of the last suffix like a map on it would do
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lhc'))
+
+from consts import COMMON_EXTENSIONS  # noqa: E402
+from matcher import ExtensionMatcher, split_extensions, file_extension  # noqa: E402
+
+SPEC = '__WEB__,__PKG__,__PIP__'
+OTHER_EXTENSIONS = ('html', 'json', 'xml', 'txt', 'php', 'asc', 'sig', 'sha256')
+
+
+def make_uris(n):
+    """half with a cached extension, a third with another one, the rest without"""
+    rnd = random.Random(42)
+    cached = split_extensions(SPEC)[0]
+    uris = []
+    for i in range(n):
+        path = '/'.join('d%d' % rnd.randint(0, 999) for _ in range(rnd.randint(1, 6)))
+        r = rnd.random()
+        if r < 0.5:
+            name = 'file-%d.%s' % (i, rnd.choice(cached))
+        elif r < 0.8:
+            name = 'file-%d.%s' % (i, rnd.choice(OTHER_EXTENSIONS))
+        else:
+            name = 'file-%d' % i
+        uris.append('/%s/%s' % (path, name))
+    return uris
+
+
+def old_regex():
+    exts = []
+    for item in SPEC.split(','):
+        exts.extend(COMMON_EXTENSIONS[item])
+    return r'\.(%s)' % '|'.join(set(exts))
+
+
+def measure(fn, uris, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        for uri in uris:
+            fn(uri)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1e9 / len(uris)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--uris', type=int, default=100000, help='number of generated uris')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='runs of every matcher, the best is reported')
+    args = parser.parse_args()
+
+    uris = make_uris(args.uris)
+    matcher = ExtensionMatcher(SPEC)
+    old = re.compile(old_regex())
+    plain = re.compile(r'\.(?:%s)$' % '|'.join(re.escape(ext) for ext in matcher.extensions))
+    exts = frozenset(matcher.extensions)
+    candidates = (
+        ('unordered alternation, unanchored', lambda uri: old.search(uri) is not None),
+        ('sorted alternation, anchored', lambda uri: plain.search(uri) is not None),
+        ('trie, anchored (ExtensionMatcher)', matcher.match),
+        ('set of the last suffix', lambda uri: file_extension(uri) in exts),
+    )
+
+    print('%d uris, %d extensions' % (len(uris), len(matcher.extensions)))
+    print('regex before (%d chars): %s' % (len(old.pattern), old.pattern))
+    print('regex now    (%d chars): %s' % (len(matcher.regex), matcher.regex))
+    print()
+    print('%-36s %10s %10s' % ('MATCHER', 'ns/uri', 'MATCHED'))
+    for name, fn in candidates:
+        matched = sum(1 for uri in uris if fn(uri))
+        print('%-36s %10.0f %10d' % (name, measure(fn, uris, args.repeat), matched))
+    # the old regex is unanchored: .json matches js, .sha256 matches sh... anywhere in the uri
+    differ = sum(1 for uri in uris if (old.search(uri) is not None) != matcher.match(uri))
+    print()
+    print('%d uris matched differently by the unanchored regex' % differ)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
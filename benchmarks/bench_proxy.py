@@ -0,0 +1,85 @@
+"""
+cold, warm and mixed throughput and latency of the native engine over a few corpus profiles and concurrencies
+
+    python benchmarks/bench_proxy.py [-n FILES] [-c CONCURRENCY,...] [-p PROFILE,...] [-o RESULTS.json]
+                                     [--compare OLD.json]
+
+every case is one `lhc bench` run: a local origin serves the synthetic corpus, a temporary host points at
+it and the clients go through the engine. the same settings give the same requests, so results written
+with -o on one revision can be compared with --compare on another, on the same machine
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lhc'))
+
+from bench import run_bench, save_results  # noqa: E402
+
+PROFILES = {
+    # package mirrors: mostly small metadata and packages
+    'small': '4k:50,64k:40,512k:10',
+    # what `lhc bench` uses by default
+    'mixed': '16k:60,256k:30,4m:9,32m:1',
+    # iso and image downloads
+    'large': '8m:50,64m:50',
+}
+METRICS = (('requests_per_second', 'REQ/S'), ('mib_per_second', 'MIB/S'), ('p50', 'P50 MS'), ('p99', 'P99 MS'),
+           ('p999', 'P999 MS'))
+
+
+def metric(run, name):
+    return run['latency_ms'][name] if name in run['latency_ms'] else run[name]
+
+
+def case_name(profile, concurrency):
+    return '%s/c%d' % (profile, concurrency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--files', type=int, default=60, help='files of the cold and warm runs of every case')
+    parser.add_argument('-c', '--concurrency', default='1,16', help='client counts, separated by commas')
+    parser.add_argument('-p', '--profiles', default='small,mixed', help='size profiles: %s' % ', '.join(PROFILES))
+    parser.add_argument('-d', '--origin-delay', type=int, default=0, help='milliseconds the origin waits')
+    parser.add_argument('--proxy-ip', default='127.0.0.2', help='loopback address of the engine')
+    parser.add_argument('-o', '--output', help='write the results of every case as json to this file')
+    parser.add_argument('--compare', help='results of an earlier run to print the changes against')
+    args = parser.parse_args()
+    logging.getLogger('lhc').addHandler(logging.NullHandler())
+
+    cases = {}
+    for profile in args.profiles.split(','):
+        for concurrency in [int(c) for c in args.concurrency.split(',')]:
+            name = case_name(profile, concurrency)
+            print('%s ...' % name, file=sys.stderr)
+            cases[name] = run_bench(files=args.files, sizes=PROFILES[profile], concurrency=concurrency,
+                                    origin_delay=args.origin_delay, proxy_ip=args.proxy_ip)
+    old = {}
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)['cases']
+
+    print('%-12s %-6s' % ('CASE', 'RUN') + ''.join('%14s' % title for _, title in METRICS))
+    for name in sorted(cases):
+        for run_name, run in cases[name]['runs'].items():
+            row = '%-12s %-6s' % (name, run_name)
+            for key, _ in METRICS:
+                value = metric(run, key)
+                before = old.get(name, {}).get('runs', {}).get(run_name)
+                if before and metric(before, key):
+                    change = 100.0 * (value - metric(before, key)) / metric(before, key)
+                    row += '%14s' % ('%.1f %+.0f%%' % (value, change))
+                else:
+                    row += '%14.1f' % value
+            print(row)
+    if args.output:
+        save_results({'cases': cases}, args.output)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+startup time of the lhc cli against a throw-away config with many hosts
+
+    python benchmarks/bench_startup.py [-n HOSTS] [-r REPEAT] [--max-help-ms MS]
+
+every command runs in a fresh interpreter, like it does from a shell or a monitoring script,
+the mode is native so neither docker nor nginx is needed
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = (
+    ('--help', ['--help']),
+    ('info', ['info']),
+    ('ls', ['ls']),
+    ('df', ['df']),
+)
+
+
+def make_conf(path, hosts):
+    os.makedirs(os.path.join(path, 'hosts'))
+    with open(os.path.join(path, 'lhc.conf'), 'w') as f:
+        f.write('[global]\nmode = native\ncache_path = %s\n' % os.path.join(path, 'cache'))
+    for i in range(hosts):
+        name = 'mirror%d.example.com' % i
+        with open(os.path.join(path, 'hosts', name), 'w') as f:
+            f.write('[%s]\nextensions = __PKG__\n' % name)
+
+
+def run(args, env, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-m', 'lhc.lhc'] + args, env=env,
+                              stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+        times.append((time.time() - start) * 1000)
+    times.sort()
+    return times[0], times[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--hosts', type=int, default=1000, help='number of host files')
+    parser.add_argument('-r', '--repeat', type=int, default=10, help='runs of every command')
+    parser.add_argument('--max-help-ms', type=float, help='exit 1 when the median of --help is slower than this')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='lhc-bench-')
+    try:
+        conf = os.path.join(tmp, 'conf')
+        make_conf(conf, args.hosts)
+        env = dict(os.environ, CONF_PATH=conf, LOG_PATH=os.path.join(tmp, 'log'), DEBUG='true',
+                   NATIVE_PID_FILE=os.path.join(tmp, 'native.pid'), PYTHONPATH=ROOT)
+        print('%-8s %10s %10s   (%d hosts, %d runs)' % ('COMMAND', 'MIN ms', 'MEDIAN ms', args.hosts, args.repeat))
+        results = {}
+        for name, cmd in COMMANDS:
+            results[name] = run(cmd, env, args.repeat)
+            print('%-8s %10.1f %10.1f' % ((name,) + results[name]))
+    finally:
+        shutil.rmtree(tmp)
+    if args.max_help_ms and results['--help'][1] > args.max_help_ms:
+        print('--help took %.1fms, more than %.1fms' % (results['--help'][1], args.max_help_ms))
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
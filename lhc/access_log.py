@@ -0,0 +1,167 @@
+# parsing of the per-host access logs written in `log_format main`
+import calendar
+import glob
+import gzip
+import heapq
+import mmap
+import os
+import re
+from collections import namedtuple
+
+from matcher import file_extension
+
+# '$http_x_forwarded_for - $remote_user [$time_local] "$request" '
+# '$status $body_bytes_sent "$http_referer" '
+# '"$http_user_agent" "$upstream_cache_status" $remote_addr '
+# '$request_length $bytes_sent $request_time "$upstream_response_time"'
+# the last four fields are missing in logs written before they were added
+LOG_REG = re.compile(
+    r'^(?P<forwarded_for>\S+) - (?P<remote_user>\S+) \[(?P<time_local>[^\]]*)\] "(?P<request>(?:[^"\\]|\\.)*)" '
+    r'(?P<status>\d{3}) (?P<body_bytes_sent>\d+) "(?P<referer>(?:[^"\\]|\\.)*)" '
+    r'"(?P<user_agent>(?:[^"\\]|\\.)*)" "(?P<cache_status>[^"]*)" (?P<remote_addr>\S+)'
+    r'(?: (?P<request_length>\d+) (?P<bytes_sent>\d+) (?P<request_time>[\d.]+) "(?P<upstream_response_time>[^"]*)")?')
+
+MONTHS = dict((m, i) for i, m in enumerate(('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct',
+                                            'Nov', 'Dec'), 1))
+
+Record = namedtuple('Record', 'time_local method uri status body_bytes_sent cache_status remote_addr '
+                              'request_length bytes_sent request_time upstream_response_time')
+
+# upstream cache statuses served from the cache, everything else came from the origin;
+# HOT is a hit of the hot tier, HIT one of the disk zone behind it
+CACHE_SERVED = {'HOT', 'HIT', 'STALE', 'UPDATING', 'REVALIDATED'}
+CACHE_STATUSES = ('HOT', 'HIT', 'MISS', 'EXPIRED', 'STALE', 'UPDATING', 'REVALIDATED', 'BYPASS')
+
+
+def log_files(path):
+    """the log file and its rotations (path.1, path.2.gz, ...), oldest first"""
+    files = [p for p in glob.glob(path + '.*') if p[len(path) + 1:].split('.')[0].isdigit()]
+    files.sort(key=lambda p: int(p[len(path) + 1:].split('.')[0]), reverse=True)
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def iter_lines(path):
+    """yields the lines of a log file without reading it into memory"""
+    if path.endswith('.gz'):
+        with gzip.open(path, 'rb') as f:
+            for line in f:
+                yield line.rstrip('\n')
+        return
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return
+        m = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        try:
+            start = 0
+            while start < size:
+                end = m.find('\n', start)
+                if end < 0:
+                    # a partially written last line
+                    break
+                yield m[start:end]
+                start = end + 1
+        finally:
+            m.close()
+
+
+def parse(line):
+    m = LOG_REG.match(line)
+    if not m:
+        return
+    request = m.group('request').split(' ')
+    method, uri = (request[0], request[1]) if len(request) > 1 else ('', request[0])
+    cache_status = m.group('cache_status')
+    body_bytes_sent = int(m.group('body_bytes_sent'))
+    if m.group('request_length'):
+        request_length, bytes_sent = int(m.group('request_length')), int(m.group('bytes_sent'))
+        request_time = float(m.group('request_time'))
+        upstream_response_time = parse_upstream_time(m.group('upstream_response_time'))
+    else:
+        request_length, bytes_sent, request_time, upstream_response_time = 0, body_bytes_sent, None, None
+    return Record(m.group('time_local'), method, uri, int(m.group('status')), body_bytes_sent,
+                  '' if cache_status == '-' else cache_status, m.group('remote_addr'),
+                  request_length, bytes_sent, request_time, upstream_response_time)
+
+
+def parse_time_local(v):
+    """unix time of a $time_local like 18/Oct/2026:11:40:11 +0800"""
+    t = calendar.timegm((int(v[7:11]), MONTHS[v[3:6]], int(v[:2]), int(v[12:14]), int(v[15:17]), int(v[18:20])))
+    offset = int(v[22:24]) * 3600 + int(v[24:26]) * 60
+    return t + offset if v[21] == '-' else t - offset
+
+
+def parse_upstream_time(v):
+    """'0.012', '0.004, 0.010' or '0.001 : 0.020' when several upstreams were tried, '-' for none"""
+    times = [float(t) for t in re.split(r'[\s,:]+', v) if t and t != '-']
+    return sum(times) if times else None
+
+
+def iter_records(paths):
+    for path in paths:
+        for line in iter_lines(path):
+            record = parse(line)
+            if record:
+                yield record
+
+
+class TopCounter(object):
+    """approximate top-k counting in bounded memory, the least frequent keys are dropped when full"""
+
+    def __init__(self, k):
+        self.k = k
+        self.counts = {}
+
+    def add(self, key, n=1):
+        self.counts[key] = self.counts.get(key, 0) + n
+        if len(self.counts) > self.k * 4:
+            self.counts = dict(heapq.nlargest(self.k * 2, self.counts.iteritems(), key=lambda i: i[1]))
+
+    def top(self, n=None):
+        return heapq.nlargest(n or self.k, self.counts.iteritems(), key=lambda i: i[1])
+
+
+class HostStats(object):
+    def __init__(self, name, top=10, matcher=None):
+        self.name = name
+        self.matcher = matcher
+        self.requests = 0
+        self.statuses = dict.fromkeys(CACHE_STATUSES, 0)
+        self.bytes_cache = 0
+        self.bytes_origin = 0
+        self.missed = TopCounter(max(top, 100))
+        # origin bytes by file extension of the uris the host's extensions do not cover
+        self.uncached = TopCounter(max(top, 100))
+        self.unparsed = 0
+
+    def add(self, record):
+        self.requests += 1
+        if record.cache_status:
+            self.statuses[record.cache_status] = self.statuses.get(record.cache_status, 0) + 1
+        if record.cache_status in CACHE_SERVED:
+            self.bytes_cache += record.body_bytes_sent
+        else:
+            self.bytes_origin += record.body_bytes_sent
+            if record.cache_status in ('MISS', 'EXPIRED'):
+                self.missed.add(record.uri)
+            elif not record.cache_status and self.matcher:
+                path = record.uri.partition('?')[0]
+                ext = file_extension(path)
+                if ext and not self.matcher.match(path):
+                    self.uncached.add(ext, record.body_bytes_sent)
+
+    def feed(self, paths):
+        for path in paths:
+            for line in iter_lines(path):
+                record = parse(line)
+                if record:
+                    self.add(record)
+                else:
+                    self.unparsed += 1
+        return self
+
+    def ratio(self, status):
+        cacheable = sum(self.statuses.values())
+        return 100.0 * self.statuses.get(status, 0) / cacheable if cacheable else 0.0
@@ -0,0 +1,327 @@
+# cold, warm and mixed runs of the native engine against a local origin serving a synthetic corpus, every
+# run of the same settings on the same machine does the same requests so results can be compared over time
+import BaseHTTPServer
+import SocketServer
+import bisect
+import httplib
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from configuration import Config, Host
+from errors import LHCError
+from native import NativeEngine, ThreadingHTTPServer, CachingHandler
+from utils import parse_size
+
+log = logging.getLogger('lhc')
+
+RESULTS_VERSION = 1
+BENCH_HOST = 'bench.lhc.test'
+BENCH_EXTENSION = 'bin'
+DEFAULT_SIZES = '16k:60,256k:30,4m:9,32m:1'
+# what the origin repeats to make up the bodies, random so compression or dedup can not help
+BLOCK = os.urandom(1024 * 1024)
+READ_SIZE = 256 * 1024
+READY_TIMEOUT = 10
+PERCENTILES = (('p50', 0.5), ('p99', 0.99), ('p999', 0.999))
+
+
+class BenchError(LHCError):
+    pass
+
+
+def parse_sizes(spec):
+    """[(bytes, weight)] of a distribution like 16k:60,4m:9, a size without a weight counts 1"""
+    sizes = []
+    for item in spec.split(','):
+        size, _, weight = item.strip().partition(':')
+        try:
+            sizes.append((parse_size(size), float(weight or 1)))
+        except ValueError:
+            raise BenchError("invalid size distribution item '%s', should be SIZE[:WEIGHT]" % item)
+    return sizes
+
+
+def make_corpus(count, sizes, seed):
+    """the sizes of count files, drawn from the distribution and spread by +-50% around its sizes"""
+    rnd = random.Random(seed)
+    total = sum(w for _, w in sizes)
+    corpus = []
+    for _ in range(count):
+        r = rnd.uniform(0, total)
+        for size, weight in sizes:
+            r -= weight
+            if r <= 0:
+                break
+        corpus.append(max(1, int(size * rnd.uniform(0.5, 1.5))))
+    return corpus
+
+
+def file_path(i):
+    return '/corpus/%d.%s' % (i, BENCH_EXTENSION)
+
+
+class OriginHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        try:
+            size = self.server.corpus[int(self.path.rsplit('/', 1)[1].split('.')[0])]
+        except (IndexError, ValueError):
+            return self.send_error(404)
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(size))
+        self.send_header('Last-Modified', 'Thu, 01 Jan 2015 00:00:00 GMT')
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        while size > 0:
+            n = min(size, len(BLOCK))
+            self.wfile.write(BLOCK if n == len(BLOCK) else BLOCK[:n])
+            size -= n
+
+    do_HEAD = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+class OriginServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class BenchEngine(NativeEngine):
+    """a native engine whose host is resolved to the bench origin and that logs to the bench directory"""
+
+    def __init__(self, config, origin_ip, log_path):
+        super(BenchEngine, self).__init__(config)
+        self.resolver.resolve = lambda name, server: origin_ip
+        self._log_fd = os.open(log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+
+    def access_log(self, host, line):
+        os.write(self._log_fd, line + '\n')
+
+
+def serve_origin(address, corpus, delay, ready):
+    server = OriginServer(address, OriginHandler)
+    server.corpus = corpus
+    server.delay = delay
+    ready.set()
+    server.serve_forever()
+
+
+def serve_engine(config, address, origin_ip, log_path, ready):
+    CachingHandler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(BenchEngine(config, origin_ip, log_path), address, 'http')
+    ready.set()
+    server.serve_forever()
+
+
+def free_port(ips):
+    """a port free on all of ips"""
+    for _ in range(20):
+        s = socket.socket()
+        s.bind((ips[0], 0))
+        port = s.getsockname()[1]
+        s.close()
+        try:
+            for ip in ips[1:]:
+                s = socket.socket()
+                s.bind((ip, port))
+                s.close()
+        except socket.error:
+            continue
+        return port
+    raise BenchError('no port free on %s' % ', '.join(ips))
+
+
+def percentile(ordered, p):
+    """nearest-rank percentile of sorted values"""
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, max(0, int(round(p * len(ordered))) - 1))]
+
+
+class Clients(object):
+    """concurrency threads, each with a keep-alive connection, taking paths from one list in order"""
+
+    def __init__(self, address, concurrency):
+        self.address = address
+        self.concurrency = concurrency
+
+    def run(self, paths, sizes):
+        paths = iter(paths)
+        lock = threading.Lock()
+        latencies = []
+        statuses = Counter()
+        errors = []
+        received = [0]
+
+        def work():
+            conn = None
+            while True:
+                with lock:
+                    path = next(paths, None)
+                if path is None:
+                    break
+                start = time.time()
+                try:
+                    if conn is None:
+                        conn = httplib.HTTPConnection(self.address[0], self.address[1], timeout=120)
+                    conn.request('GET', path, headers={'Host': BENCH_HOST})
+                    resp = conn.getresponse()
+                    n = 0
+                    while True:
+                        chunk = resp.read(READ_SIZE)
+                        if not chunk:
+                            break
+                        n += len(chunk)
+                    status = resp.getheader('Nginx-Cache') or str(resp.status)
+                except (socket.error, httplib.HTTPException) as e:
+                    errors.append('%s: %s' % (path, e))
+                    conn and conn.close()
+                    conn = None
+                    continue
+                elapsed = time.time() - start
+                with lock:
+                    if resp.status != 200 or n != sizes[path]:
+                        errors.append('%s: %s, %d of %d bytes' % (path, resp.status, n, sizes[path]))
+                        continue
+                    latencies.append(elapsed)
+                    statuses[status] += 1
+                    received[0] += n
+            conn and conn.close()
+
+        threads = [threading.Thread(target=work) for _ in range(self.concurrency)]
+        start = time.time()
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.time() - start
+        latencies.sort()
+        result = OrderedDict([
+            ('requests', len(latencies)),
+            ('errors', len(errors)),
+            ('bytes', received[0]),
+            ('seconds', round(elapsed, 3)),
+            ('requests_per_second', round(len(latencies) / elapsed, 1) if elapsed else 0),
+            ('mib_per_second', round(received[0] / elapsed / 1048576, 1) if elapsed else 0),
+            ('latency_ms', OrderedDict([(name, round(percentile(latencies, p) * 1000, 2)) for name, p in PERCENTILES] +
+                                       [('max', round(latencies[-1] * 1000, 2) if latencies else 0)])),
+            ('cache_status', OrderedDict(sorted(statuses.items()))),
+        ])
+        for e in errors[:5]:
+            log.warn(e)
+        return result
+
+
+def mixed_paths(cached, new, requests, miss_ratio, rnd):
+    """requests paths: miss_ratio of them to files never requested, the rest zipf-distributed over cached"""
+    weights = []
+    total = 0.0
+    for rank in range(1, cached + 1):
+        total += 1.0 / rank
+        weights.append(total)
+    order = range(cached)
+    rnd.shuffle(order)
+    paths = []
+    for _ in range(requests):
+        if new and rnd.random() < miss_ratio:
+            paths.append(file_path(new.pop()))
+        else:
+            paths.append(file_path(order[bisect.bisect_left(weights, rnd.uniform(0, total))]))
+    return paths
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=open(os.devnull, 'w'),
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_bench(files=100, sizes=DEFAULT_SIZES, concurrency=16, requests=None, miss_ratio=0.1, origin_delay=0,
+              slice_size=None, origin_ip='127.0.0.1', proxy_ip='127.0.0.2', seed=42, keep=None):
+    """runs cold, warm and mixed, returns the results"""
+    requests = requests or files * 4
+    new = int(requests * miss_ratio * 1.5) + 1
+    corpus = make_corpus(files + new, parse_sizes(sizes), seed)
+    path_sizes = dict((file_path(i), size) for i, size in enumerate(corpus))
+    work_dir = keep or tempfile.mkdtemp(prefix='lhc-bench-')
+    config = Config(extensions=BENCH_EXTENSION, cache_path=os.path.join(work_dir, 'cache'),
+                    cache_size_limit=str(sum(corpus) * 2), cache_expire='1d', cache_key='$host$uri$is_args$args',
+                    mode='native', proxy_ip=proxy_ip, dns_resolver=origin_ip, ssl=False, peers='')
+    config.hosts[BENCH_HOST] = host = Host(BENCH_HOST, slice_size=slice_size, g=config)
+    port = free_port([origin_ip, proxy_ip])
+    processes = []
+    try:
+        access_log = os.path.join(work_dir, 'access.log')
+        for target, args in ((serve_origin, ((origin_ip, port), corpus, origin_delay / 1000.0)),
+                             (serve_engine, (config, (proxy_ip, port), origin_ip, access_log))):
+            ready = multiprocessing.Event()
+            p = multiprocessing.Process(target=target, args=args + (ready,))
+            p.daemon = True
+            p.start()
+            processes.append(p)
+            if not ready.wait(READY_TIMEOUT):
+                raise BenchError('%s did not start' % target.__name__)
+        clients = Clients((proxy_ip, port), concurrency)
+        rnd = random.Random(seed)
+        cold = [file_path(i) for i in range(files)]
+        rnd.shuffle(cold)
+        runs = OrderedDict()
+        log.info('cold: %d files, %.1f MiB' % (files, sum(corpus[:files]) / 1048576.0))
+        runs['cold'] = clients.run(cold, path_sizes)
+        warm = list(cold)
+        rnd.shuffle(warm)
+        log.info('warm: the same files again')
+        runs['warm'] = clients.run(warm, path_sizes)
+        log.info('mixed: %d requests, %.0f%% to new files' % (requests, miss_ratio * 100))
+        runs['mixed'] = clients.run(mixed_paths(files, range(files, len(corpus)), requests, miss_ratio, rnd),
+                                    path_sizes)
+    finally:
+        for p in processes:
+            p.terminate()
+            p.join()
+        if not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return OrderedDict([
+        ('version', RESULTS_VERSION),
+        ('created', int(time.time())),
+        ('revision', git_revision()),
+        ('engine', 'native'),
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('cpus', multiprocessing.cpu_count()),
+        ('settings', OrderedDict([
+            ('files', files), ('sizes', sizes), ('corpus_bytes', sum(corpus[:files])), ('concurrency', concurrency),
+            ('requests', requests), ('miss_ratio', miss_ratio), ('origin_delay_ms', origin_delay),
+            ('slice_size', host.slice_size or None), ('seed', seed),
+        ])),
+        ('runs', runs),
+    ])
+
+
+def save_results(results, path):
+    with open(path, 'wb') as f:
+        json.dump(results, f, indent=2, separators=(',', ': '))
+        f.write('\n')
@@ -0,0 +1,401 @@
+# cache bundles: the cached objects of hosts in one tar stream, to seed the cache of another machine
+import gzip
+import hashlib
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+from StringIO import StringIO
+from collections import OrderedDict, deque
+from multiprocessing.pool import ThreadPool
+
+from cache_index import CacheIndex
+from cachefile import cache_file_path, read_entry, CacheFileError
+from disk_usage import DEFAULT_WORKERS
+from errors import LHCError
+from matcher import get_matcher
+from utils import find_executable, mkdirs, sendfile
+
+log = logging.getLogger('lhc')
+
+BUNDLE_VERSION = 1
+# first member: the exporting node and the settings of its hosts
+HEADER_NAME = 'lhc-bundle.json'
+# last member: [host, key, size, sha256] of every object, only written when the stream is complete
+MANIFEST_NAME = 'lhc-manifest.json'
+# pax header of every object member
+SHA256_PAX = 'LHC.sha256'
+CHUNK_SIZE = 1024 * 1024
+
+# external compressors that use every core, `auto` takes the first one installed and gzip otherwise
+COMPRESSORS = OrderedDict([
+    ('zstd', (['zstd', '-q', '-T0', '-c'], ['zstd', '-q', '-d', '-c'])),
+    ('pigz', (['pigz', '-c'], ['pigz', '-d', '-c'])),
+])
+COMPRESS_CHOICES = ('auto',) + tuple(COMPRESSORS) + ('gzip', 'none')
+ZSTD_MAGIC = '\x28\xb5\x2f\xfd'
+GZIP_MAGIC = '\x1f\x8b'
+
+
+class BundleError(LHCError):
+    pass
+
+
+def select_entries(host, max_age=None, min_size=None, max_size=None, extensions=None, update=True):
+    """(key, size, path) of the cache files of host passing the filters, from its cache index"""
+    where, params = [], []
+    if max_age:
+        where.append('atime >= ?')
+        params.append(time.time() - max_age)
+    if min_size:
+        where.append('size >= ?')
+        params.append(min_size)
+    if max_size:
+        where.append('size <= ?')
+        params.append(max_size)
+    matcher = get_matcher(extensions) if extensions else None
+    index = CacheIndex.for_host(host)
+    try:
+        if update:
+            index.update()
+        entries = []
+        for key, size, _, _, _, name, d in index.query(' AND '.join(where), params):
+            # slices are matched by the uri of the whole object
+            uri = key.partition('?')[0]
+            if host.slice_bytes:
+                uri = uri.rsplit('bytes=', 1)[0]
+            if matcher and not matcher.match(uri):
+                continue
+            entries.append((key, size, os.path.join(host.cache_path, d, name)))
+        return entries
+    finally:
+        index.close()
+
+
+class _Sink(object):
+    """what utils.sendfile writes to, a file or pipe instead of a socket"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def fileno(self):
+        return self.f.fileno()
+
+    def sendall(self, data):
+        self.f.write(data)
+
+
+class BundleWriter(object):
+    """a tar stream of pax members, bodies are sent zero-copy when out is a plain file or pipe"""
+
+    def __init__(self, out, zero_copy):
+        self.out = out
+        self.zero_copy = zero_copy
+        self.bytes = 0
+
+    def _write(self, data):
+        self.out.write(data)
+        self.bytes += len(data)
+
+    def _header(self, name, size, pax=None):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(time.time())
+        info.mode = 0600
+        if pax:
+            info.pax_headers = pax
+        self._write(info.tobuf(tarfile.PAX_FORMAT))
+
+    def _pad(self, size):
+        if size % tarfile.BLOCKSIZE:
+            self._write(tarfile.NUL * (tarfile.BLOCKSIZE - size % tarfile.BLOCKSIZE))
+
+    def add_data(self, name, data):
+        self._header(name, len(data))
+        self._write(data)
+        self._pad(len(data))
+
+    def add_file(self, name, f, size, pax=None):
+        self._header(name, size, pax)
+        if self.zero_copy:
+            self.out.flush()
+            sendfile(_Sink(self.out), f, 0, size)
+            self.bytes += size
+        else:
+            f.seek(0)
+            left = size
+            while left > 0:
+                chunk = f.read(min(CHUNK_SIZE, left))
+                if not chunk:
+                    raise BundleError('%s was truncated while exported' % name)
+                self._write(chunk)
+                left -= len(chunk)
+        self._pad(size)
+
+    def close(self):
+        self._write(tarfile.NUL * tarfile.BLOCKSIZE * 2)
+        self.out.flush()
+
+
+def _prepare(item):
+    """opens and hashes a cache file ahead of the writer, which sends the same open file so both agree"""
+    try:
+        f = open(item[-1], 'rb')
+    except IOError:
+        return item, None, 0, None
+    sha = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        sha.update(chunk)
+        size += len(chunk)
+    return item, f, size, sha.hexdigest()
+
+
+def read_ahead(items, jobs):
+    """yields _prepare(item) in order, with up to jobs * 2 files being read in parallel"""
+    pool = ThreadPool(jobs)
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(pool.apply_async(_prepare, (item,)))
+            if len(pending) >= jobs * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        for result in pending:
+            f = result.get()[1]
+            f and f.close()
+        pool.close()
+        pool.join()
+
+
+def open_output(path, compress):
+    """(writable stream, compressor process or None, whether bodies can be sent with sendfile)"""
+    if path == '-':
+        if sys.stdout.isatty():
+            raise BundleError('refusing to write a bundle to a terminal')
+        out = sys.stdout
+    else:
+        out = open(path, 'wb')
+    if compress == 'auto':
+        compress = next((name for name in COMPRESSORS if find_executable(name)), 'gzip')
+    if compress in COMPRESSORS:
+        if not find_executable(compress):
+            raise BundleError('%s is not installed' % compress)
+        proc = subprocess.Popen(COMPRESSORS[compress][0], stdin=subprocess.PIPE, stdout=out)
+        return proc.stdin, proc, True
+    if compress == 'gzip':
+        return gzip.GzipFile(fileobj=out, mode='wb', compresslevel=6), None, False
+    return out, None, True
+
+
+def export_bundle(hosts, path, compress='auto', jobs=DEFAULT_WORKERS, **filters):
+    """writes the selected objects of hosts to path, returns (objects, body bytes)"""
+    items = []
+    paths = set()
+    for host in hosts:
+        for key, _, p in select_entries(host, **filters):
+            # hosts of a mirror group list the same files
+            if p not in paths:
+                paths.add(p)
+                items.append((host, key, p))
+    out, proc, zero_copy = open_output(path, compress)
+    writer = BundleWriter(out, zero_copy)
+    manifest = []
+    total = 0
+    try:
+        writer.add_data(HEADER_NAME, json.dumps({
+            'version': BUNDLE_VERSION,
+            'created': int(time.time()),
+            'node': socket.gethostname(),
+            'hosts': dict((h.name, {'cache_key': h.cache_key, 'slice_size': h.slice_size}) for h in hosts),
+        }))
+        for (host, key, p), f, size, sha256 in read_ahead(items, jobs):
+            if f is None:
+                # evicted since the index was updated
+                continue
+            with f:
+                writer.add_file('%s/%s' % (host.name, os.path.relpath(p, host.cache_path)), f, size,
+                                {SHA256_PAX: sha256})
+            manifest.append((host.name, key, size, sha256))
+            total += size
+        writer.add_data(MANIFEST_NAME, json.dumps({'entries': manifest, 'bytes': total}))
+        writer.close()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if proc and proc.wait():
+            raise BundleError('compressor exited with %d' % proc.returncode)
+    return len(manifest), total
+
+
+class _Replay(object):
+    """a stream with the bytes already read from it put back in front"""
+
+    def __init__(self, head, f):
+        self.head = head
+        self.f = f
+
+    def read(self, size=-1):
+        if not self.head:
+            return self.f.read(size)
+        if size < 0:
+            data, self.head = self.head + self.f.read(), ''
+            return data
+        data, self.head = self.head[:size], self.head[size:]
+        return data + (self.f.read(size - len(data)) if size > len(data) else '')
+
+
+def _pump(src, dst):
+    try:
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            dst.write(chunk)
+    except IOError:
+        pass
+    finally:
+        dst.close()
+
+
+def open_input(path):
+    """(tar stream, decompressor process or None) of a bundle, the compression is told by its magic"""
+    f = sys.stdin if path == '-' else open(path, 'rb')
+    head = f.read(4)
+    tool = None
+    if head.startswith(ZSTD_MAGIC):
+        tool = 'zstd'
+    elif head.startswith(GZIP_MAGIC) and find_executable('pigz'):
+        tool = 'pigz'
+    if not tool:
+        # python's gzip is fine for reading, tarfile detects it
+        return tarfile.open(fileobj=_Replay(head, f), mode='r|*'), None
+    if not find_executable(tool):
+        raise BundleError('%s is needed to read %s' % (tool, path))
+    proc = subprocess.Popen(COMPRESSORS[tool][1], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    t = threading.Thread(target=_pump, args=(_Replay(head, f), proc.stdin))
+    t.daemon = True
+    t.start()
+    return tarfile.open(fileobj=proc.stdout, mode='r|'), proc
+
+
+class BundleImporter(object):
+    """streams a bundle into the cache directories of the configured hosts, verifying every object"""
+
+    def __init__(self, config, hostnames=None, check=False):
+        self.config = config
+        self.hostnames = hostnames
+        self.check = check
+        self.stats = OrderedDict((k, 0) for k in ('imported', 'present', 'skipped', 'invalid', 'bytes'))
+        self._targets = {}
+
+    def target(self, name, exported):
+        """the local host objects of name go to, None when they are not imported"""
+        if name not in self._targets:
+            host = self.config.hosts.get(name)
+            if self.hostnames and name not in self.hostnames:
+                host = None
+            elif not host:
+                log.warn('%s: not configured here, skipping its objects' % name)
+            elif exported and exported.get('cache_key') != host.cache_key:
+                log.warn('%s: exported with cache_key %s, here %s, its objects would never be hit, skipping' % (
+                    name, exported.get('cache_key'), host.cache_key))
+                host = None
+            self._targets[name] = host
+        return self._targets[name]
+
+    def import_member(self, host, member, src):
+        """verifies one object, then puts it where the local host looks it up"""
+        expected = member.pax_headers.get(SHA256_PAX)
+        sha = hashlib.sha256()
+        out = tmp = None
+        if not self.check:
+            mkdirs(host.cache_path, 0700)
+            fd, tmp = tempfile.mkstemp(prefix='.lhc-import-', dir=host.cache_path)
+            out = os.fdopen(fd, 'wb')
+        head = ''
+        size = 0
+        try:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if len(head) < CHUNK_SIZE:
+                    head += chunk[:CHUNK_SIZE - len(head)]
+                sha.update(chunk)
+                size += len(chunk)
+                out and out.write(chunk)
+        finally:
+            out and out.close()
+        try:
+            if size != member.size or sha.hexdigest() != expected:
+                raise CacheFileError('checksum mismatch')
+            key = read_entry(StringIO(head)).key
+        except CacheFileError as e:
+            log.warn('%s: %s' % (member.name, e))
+            self.stats['invalid'] += 1
+            tmp and os.unlink(tmp)
+            return
+        if self.check:
+            self.stats['imported'] += 1
+            self.stats['bytes'] += size
+            return
+        path = cache_file_path(host.cache_path, key)
+        if os.path.exists(path):
+            # what this machine fetched itself is kept
+            os.unlink(tmp)
+            self.stats['present'] += 1
+            return
+        mkdirs(os.path.dirname(path), 0700)
+        os.rename(tmp, path)
+        self.stats['imported'] += 1
+        self.stats['bytes'] += size
+
+    def run(self, path):
+        tar = proc = header = manifest = None
+        members = 0
+        try:
+            tar, proc = open_input(path)
+            for member in tar:
+                if member.name == HEADER_NAME:
+                    header = json.load(tar.extractfile(member))
+                    if header.get('version') != BUNDLE_VERSION:
+                        raise BundleError('unsupported bundle version %s' % header.get('version'))
+                    continue
+                if member.name == MANIFEST_NAME:
+                    manifest = json.load(tar.extractfile(member))
+                    continue
+                if header is None:
+                    raise BundleError('%s is not an lhc bundle' % path)
+                if not member.isfile():
+                    continue
+                members += 1
+                name = member.name.split('/', 1)[0]
+                host = self.target(name, header['hosts'].get(name))
+                if host is None:
+                    self.stats['skipped'] += 1
+                    continue
+                self.import_member(host, member, tar.extractfile(member))
+        except (tarfile.TarError, IOError, ValueError) as e:
+            raise BundleError('reading %s: %s' % (path, e))
+        finally:
+            tar and tar.close()
+            if proc:
+                proc.stdout.close()
+                proc.wait()
+        if manifest is None:
+            raise BundleError('%s is truncated, %d objects were read before its end' % (path, members))
+        if len(manifest['entries']) != members:
+            raise BundleError('%s lists %d objects but holds %d' % (path, len(manifest['entries']), members))
+        return self.stats
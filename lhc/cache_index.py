@@ -0,0 +1,173 @@
+# persistent inventory of a host's proxy_cache directory
+import logging
+import os
+import re
+import sqlite3
+import time
+
+from cachefile import is_cache_file_name, read_entry_at, host_key_regex, CacheFileError
+from consts import CACHE_INDEX_PATH
+from utils import mkdirs
+
+log = logging.getLogger('lhc')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    name TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    key TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    atime REAL NOT NULL,
+    expire INTEGER NOT NULL,
+    status INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_dir ON entries (dir);
+CREATE INDEX IF NOT EXISTS entries_size ON entries (size);
+CREATE INDEX IF NOT EXISTS entries_atime ON entries (atime);
+CREATE TABLE IF NOT EXISTS dirs (
+    dir TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+'''
+
+COLUMNS = ('key', 'size', 'atime', 'expire', 'status', 'name', 'dir')
+SORTS = {
+    'size': 'size DESC',
+    'atime': 'atime DESC',
+    'expire': 'expire',
+    'key': 'key',
+}
+
+
+def _regexp(pattern, value):
+    return re.search(pattern, value) is not None
+
+
+class CacheIndex(object):
+    def __init__(self, cache_path, db_path, key_regex=None):
+        self.cache_path = cache_path
+        self.db_path = db_path
+        # restricts queries to the keys of one host when the directory is a shared zone
+        self.key_regex = key_regex
+        mkdirs(os.path.dirname(db_path))
+        self.db = sqlite3.connect(db_path)
+        self.db.text_factory = str
+        self.db.create_function('REGEXP', 2, _regexp)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+    @classmethod
+    def for_host(cls, host):
+        return cls(host.cache_path, os.path.join(CACHE_INDEX_PATH, host.cache_name + '.sqlite'),
+                   host_key_regex(host) if host.shared else None)
+
+    def close(self):
+        self.db.close()
+
+    def update(self, full=False):
+        """
+        re-scan the level-1 directories whose mtime changed and stat the known files of the others: hits and
+        revalidations change atime and mtime of a file but not of its directory. returns (added, updated, removed)
+        """
+        stats = [0, 0, 0]
+        known = dict(self.db.execute('SELECT dir, mtime FROM dirs'))
+        present = set()
+        with self.db:
+            if os.path.isdir(self.cache_path):
+                for d in os.listdir(self.cache_path):
+                    path = os.path.join(self.cache_path, d)
+                    try:
+                        mtime = os.stat(path).st_mtime
+                    except OSError:
+                        continue
+                    if not os.path.isdir(path):
+                        continue
+                    present.add(d)
+                    if not full and known.get(d) == mtime:
+                        self._refresh_dir(d, path, stats)
+                        continue
+                    self._scan_dir(d, path, stats)
+                    self.db.execute('INSERT OR REPLACE INTO dirs (dir, mtime) VALUES (?, ?)', (d, mtime))
+            for d in set(known) - present:
+                stats[2] += self.db.execute('DELETE FROM entries WHERE dir = ?', (d,)).rowcount
+                self.db.execute('DELETE FROM dirs WHERE dir = ?', (d,))
+        return tuple(stats)
+
+    def _scan_dir(self, d, path, stats):
+        indexed = dict(self.db.execute('SELECT name, mtime FROM entries WHERE dir = ?', (d,)))
+        seen = set()
+        for name in os.listdir(path):
+            if not is_cache_file_name(name):
+                continue
+            fp = os.path.join(path, name)
+            try:
+                st = os.stat(fp)
+            except OSError:
+                continue
+            seen.add(name)
+            if indexed.get(name) == st.st_mtime:
+                self.db.execute('UPDATE entries SET atime = ? WHERE name = ?', (st.st_atime, name))
+                continue
+            if self._index_file(d, name, fp, st):
+                stats[1 if name in indexed else 0] += 1
+        gone = [(n,) for n in set(indexed) - seen]
+        self.db.executemany('DELETE FROM entries WHERE name = ?', gone)
+        stats[2] += len(gone)
+
+    def _refresh_dir(self, d, path, stats):
+        """the names of an unchanged directory are known, only atime and files rewritten in place can differ"""
+        gone = []
+        for name, mtime, atime in self.db.execute('SELECT name, mtime, atime FROM entries WHERE dir = ?',
+                                                  (d,)).fetchall():
+            fp = os.path.join(path, name)
+            try:
+                st = os.stat(fp)
+            except OSError:
+                gone.append((name,))
+                continue
+            if st.st_mtime != mtime:
+                if self._index_file(d, name, fp, st):
+                    stats[1] += 1
+            elif st.st_atime != atime:
+                self.db.execute('UPDATE entries SET atime = ? WHERE name = ?', (st.st_atime, name))
+        self.db.executemany('DELETE FROM entries WHERE name = ?', gone)
+        stats[2] += len(gone)
+
+    def _index_file(self, d, name, fp, st):
+        try:
+            entry = read_entry_at(fp)
+        except (IOError, CacheFileError) as e:
+            log.debug('skip %s: %s' % (fp, e))
+            return False
+        self.db.execute('INSERT OR REPLACE INTO entries (name, dir, key, size, mtime, atime, expire, status) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        (name, d, entry.key, st.st_size, st.st_mtime, st.st_atime, entry.valid_sec, entry.status))
+        return True
+
+    def remove(self, names):
+        with self.db:
+            self.db.executemany('DELETE FROM entries WHERE name = ?', [(n,) for n in names])
+
+    def query(self, where='', params=(), sort='key', limit=None):
+        sql = 'SELECT %s FROM entries' % ', '.join(COLUMNS)
+        if self.key_regex:
+            where = 'key REGEXP ?' + (' AND (%s)' % where if where else '')
+            params = (self.key_regex,) + tuple(params)
+        if where:
+            sql += ' WHERE ' + where
+        sql += ' ORDER BY ' + SORTS[sort]
+        if limit:
+            sql += ' LIMIT %d' % int(limit)
+        return self.db.execute(sql, params)
+
+    def find(self, pattern, regex=False, sort='key', limit=None):
+        if regex:
+            return self.query('key REGEXP ?', (pattern,), sort, limit)
+        return self.query('key GLOB ?', (pattern,), sort, limit)
+
+    def summary(self):
+        count, size = self.db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        expired = self.db.execute('SELECT COUNT(*) FROM entries WHERE expire < ?', (int(time.time()),)).fetchone()[0]
+        return count, size, expired
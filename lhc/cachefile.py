@@ -0,0 +1,183 @@
+# nginx proxy_cache on-disk format, see ngx_http_file_cache_header_t in ngx_http_cache.h
+import hashlib
+import os
+import re
+import struct
+import urllib
+import urlparse
+import zlib
+from collections import namedtuple
+
+from errors import LHCError
+
+NGX_HTTP_FILE_CACHE_VERSION = 5
+
+# layout of the header on 64-bit platforms, trailing padding included
+HEADER_STRUCT = struct.Struct('<QqqqqqIHHHB128sB128s16s4x')
+KEY_PREFIX = '\nKEY: '
+
+# proxy_cache_path ... levels=2
+CACHE_LEVELS = (2,)
+
+CACHE_FILE_NAME_REG = re.compile(r'^[0-9a-f]{32}$')
+
+KEY_VAR_REG = re.compile(r'\$(?:\{(\w+)\}|(\w+))')
+# what the variables of a cache key can expand to, anything else is matched by .*
+KEY_VAR_PATTERNS = {
+    'scheme': 'https?',
+    'uri': '/.*',
+    'request_uri': '/.*',
+    'is_args': r'\??',
+    'server_port': r'\d+',
+}
+
+CacheEntry = namedtuple('CacheEntry', 'key status reason valid_sec date last_modified header_start body_start')
+
+
+class CacheFileError(LHCError):
+    pass
+
+
+def cache_file_name(key):
+    return hashlib.md5(key).hexdigest()
+
+
+def cache_file_path(cache_path, key, levels=CACHE_LEVELS):
+    name = cache_file_name(key)
+    parts = [cache_path]
+    end = len(name)
+    for level in levels:
+        parts.append(name[end - level:end])
+        end -= level
+    parts.append(name)
+    return '/'.join(parts)
+
+
+def is_cache_file_name(name):
+    return CACHE_FILE_NAME_REG.match(name) is not None
+
+
+def render_cache_key(tmpl, variables):
+    """render a proxy_cache_key template like $host$uri$is_args$args"""
+    return KEY_VAR_REG.sub(lambda m: variables.get(m.group(1) or m.group(2), ''), tmpl)
+
+
+def host_key_regex(host):
+    """anchored regex of the keys the cache_key of host produces, to tell them apart in a shared zone"""
+    parts = []
+    pos = 0
+    for m in KEY_VAR_REG.finditer(host.cache_key):
+        parts.append(re.escape(host.cache_key[pos:m.start()]))
+        var = m.group(1) or m.group(2)
+        parts.append(re.escape(host.name) if var == 'host' else KEY_VAR_PATTERNS.get(var, '.*'))
+        pos = m.end()
+    parts.append(re.escape(host.cache_key[pos:]))
+    return '^%s$' % ''.join(parts)
+
+
+def url_variables(url, port=None):
+    """the nginx variables a request for url would see"""
+    if '://' not in url:
+        url = 'http://' + url
+    u = urlparse.urlsplit(url)
+    scheme = u.scheme.lower()
+    path = u.path or '/'
+    return {
+        'scheme': scheme,
+        'host': (u.hostname or '').lower(),
+        'uri': urllib.unquote(path),
+        'args': u.query,
+        'is_args': '?' if u.query else '',
+        'request_uri': path + ('?' + u.query if u.query else ''),
+        'server_port': str(port or u.port or (443 if scheme == 'https' else 80)),
+    }
+
+
+def key_crc32(key):
+    """crc32 nginx keeps in the header of an entry, ngx_crc32 is the common crc-32"""
+    return zlib.crc32(key) & 0xffffffff
+
+
+def pack_header(key, raw_headers, valid_sec, date, last_modified=0, etag=''):
+    """everything in front of the body: binary header, KEY line and the upstream response header"""
+    header_start = HEADER_STRUCT.size + len(KEY_PREFIX) + len(key) + 1
+    body_start = header_start + len(raw_headers)
+    if body_start > 0xffff:
+        raise CacheFileError('cache header too large')
+    etag = etag[:128]
+    # nginx takes an entry whose crc32 is not the one of its key for an md5 collision and never serves it
+    header = HEADER_STRUCT.pack(NGX_HTTP_FILE_CACHE_VERSION, valid_sec, 0, 0, last_modified, date, key_crc32(key), 0,
+                                header_start, body_start, len(etag), etag, 0, '', '')
+    return header + KEY_PREFIX + key + '\n' + raw_headers
+
+
+def read_entry(f):
+    """parse the header of an open cache file"""
+    data = f.read(HEADER_STRUCT.size)
+    if len(data) < HEADER_STRUCT.size:
+        raise CacheFileError('cache file too small')
+    fields = HEADER_STRUCT.unpack(data)
+    version, valid_sec, _, _, last_modified, date = fields[:6]
+    header_start, body_start = fields[8], fields[9]
+    if version != NGX_HTTP_FILE_CACHE_VERSION:
+        raise CacheFileError('unsupported cache file version %s' % version)
+    if not HEADER_STRUCT.size < header_start <= body_start:
+        raise CacheFileError('corrupted cache file header')
+    data = f.read(body_start - HEADER_STRUCT.size)
+    if len(data) < body_start - HEADER_STRUCT.size:
+        raise CacheFileError('truncated cache file')
+    key_end = header_start - HEADER_STRUCT.size - 1
+    if not data.startswith(KEY_PREFIX):
+        raise CacheFileError('cache file has no KEY line')
+    key = data[len(KEY_PREFIX):key_end]
+    status_line = data[key_end + 1:data.find('\n', key_end + 1)].strip()
+    parts = status_line.split(' ', 2)
+    try:
+        status = int(parts[1])
+    except (IndexError, ValueError):
+        status = 0
+    reason = parts[2] if len(parts) > 2 else ''
+    return CacheEntry(key, status, reason, valid_sec, date, last_modified, header_start, body_start)
+
+
+def read_entry_at(path):
+    with open(path, 'rb') as f:
+        return read_entry(f)
+
+
+def read_raw_headers(f, entry):
+    """the upstream response header lines stored in the cache file, without the status line"""
+    f.seek(entry.header_start)
+    raw = f.read(entry.body_start - entry.header_start)
+    lines = raw.split('\r\n')[1:]
+    return [l for l in lines if l]
+
+
+def slice_range(start, slice_size):
+    """$slice_range of the slice starting at byte start"""
+    return 'bytes=%d-%d' % (start, start + slice_size - 1)
+
+
+def entry_length(f, entry):
+    """full length of the object a cached response belongs to, taken from Content-Range of a slice"""
+    for line in read_raw_headers(f, entry):
+        k, _, v = line.partition(':')
+        if k.strip().lower() == 'content-range':
+            total = v.strip().rpartition('/')[2]
+            if total.isdigit():
+                return int(total)
+    return os.fstat(f.fileno()).st_size - entry.body_start
+
+
+def slice_keys(cache_path, key, slice_size):
+    """
+    keys of all the slices of an object cached with `slice` (key is rendered without $slice_range),
+    the first slice tells the full length; only the first key is returned when it is not cached
+    """
+    first = key + slice_range(0, slice_size)
+    try:
+        with open(cache_file_path(cache_path, first), 'rb') as f:
+            length = entry_length(f, read_entry(f))
+    except (IOError, CacheFileError):
+        return [first]
+    return [key + slice_range(start, slice_size) for start in xrange(0, max(length, 1), slice_size)]
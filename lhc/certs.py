@@ -0,0 +1,148 @@
+# in-process minting of host certificates signed by the LHC CA
+import datetime
+import logging
+import multiprocessing
+import os
+
+from errors import SSLError
+from utils import mkdirs
+
+try:
+    from cryptography import x509
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, rsa
+    from cryptography.x509.oid import NameOID
+
+    HAS_CRYPTOGRAPHY = True
+except ImportError:
+    HAS_CRYPTOGRAPHY = False
+
+log = logging.getLogger('lhc')
+
+KEY_TYPES = ('ecdsa', 'rsa')
+CERT_DAYS = 3560
+
+# the CA loaded once per worker process, or the SSLError loading it raised
+_ca = None
+
+
+def generate_key(key_type):
+    if key_type == 'ecdsa':
+        return ec.generate_private_key(ec.SECP256R1(), default_backend())
+    if key_type == 'rsa':
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+    raise SSLError('unknown key type %s, should be one of %s' % (key_type, ', '.join(KEY_TYPES)))
+
+
+def read_ca(ca_key_path, ca_crt_path):
+    """the PEM of the CA key and cert"""
+    try:
+        with open(ca_key_path, 'rb') as f:
+            key_pem = f.read()
+        with open(ca_crt_path, 'rb') as f:
+            crt_pem = f.read()
+    except IOError as e:
+        raise SSLError('can not load ca: %s' % e)
+    return key_pem, crt_pem
+
+
+def parse_ca(key_pem, crt_pem):
+    try:
+        key = serialization.load_pem_private_key(key_pem, None, default_backend())
+        cert = x509.load_pem_x509_certificate(crt_pem, default_backend())
+    except (TypeError, ValueError) as e:
+        # TypeError: the key is encrypted, lhc does not ask for passphrases
+        raise SSLError('can not load ca: %s' % e)
+    return key, cert
+
+
+def load_ca(ca_key_path, ca_crt_path):
+    return parse_ca(*read_ca(ca_key_path, ca_crt_path))
+
+
+def _write(path, data, mode):
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+
+
+def mint_host_cert(cn, ca, key_type, key_path, crt_path):
+    """generate a key for cn and sign it with ca, a (key, cert) pair from load_ca"""
+    ca_key, ca_cert = ca
+    key = generate_key(key_type)
+    now = datetime.datetime.utcnow()
+    subject = x509.Name([
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, u'Wakanda'),
+        x509.NameAttribute(NameOID.ORGANIZATIONAL_UNIT_NAME, u'LHC'),
+        x509.NameAttribute(NameOID.COMMON_NAME, unicode(cn)),
+    ])
+    san = x509.SubjectAlternativeName([x509.DNSName(unicode(n)) for n in (cn, 'www.' + cn, '*.' + cn)])
+    cert = (x509.CertificateBuilder()
+            .subject_name(subject)
+            .issuer_name(ca_cert.subject)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=CERT_DAYS))
+            .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=False)
+            .add_extension(x509.KeyUsage(digital_signature=True, content_commitment=True,
+                                         key_encipherment=key_type == 'rsa', data_encipherment=False,
+                                         key_agreement=False, key_cert_sign=False, crl_sign=False,
+                                         encipher_only=False, decipher_only=False), critical=False)
+            .add_extension(san, critical=False)
+            .sign(ca_key, hashes.SHA256(), default_backend()))
+    mkdirs(os.path.dirname(key_path))
+    _write(key_path, key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                       serialization.NoEncryption()), 0600)
+    _write(crt_path, cert.public_bytes(serialization.Encoding.PEM), 0644)
+
+
+def _init_worker(key_pem, crt_pem):
+    global _ca
+    try:
+        _ca = parse_ca(key_pem, crt_pem)
+    except SSLError as e:
+        # raised here it would kill the worker and python 2 pools start it again forever, it fails the jobs instead
+        _ca = e
+
+
+def _mint_job(args):
+    cn, key_type, key_path, crt_path = args
+    if isinstance(_ca, SSLError):
+        return cn, str(_ca)
+    try:
+        mint_host_cert(cn, _ca, key_type, key_path, crt_path)
+    except Exception as e:
+        return cn, str(e)
+    return cn, None
+
+
+def mint_host_certs(jobs, ca_key_path, ca_crt_path, key_type='ecdsa', workers=None):
+    """
+    mint certs for [(cn, key_path, crt_path)] across a process pool, the CA is read and checked here,
+    every worker parses it once and reuses it for all of its hosts
+    """
+    if not HAS_CRYPTOGRAPHY:
+        raise SSLError('python package cryptography is not installed')
+    jobs = [(cn, key_type, key_path, crt_path) for cn, key_path, crt_path in jobs]
+    if not jobs:
+        return
+    ca_pem = read_ca(ca_key_path, ca_crt_path)
+    parse_ca(*ca_pem)
+    workers = min(workers or multiprocessing.cpu_count(), len(jobs))
+    if workers == 1:
+        _init_worker(*ca_pem)
+        results = map(_mint_job, jobs)
+    else:
+        pool = multiprocessing.Pool(workers, _init_worker, ca_pem)
+        try:
+            results = pool.map(_mint_job, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    failed = [(cn, e) for cn, e in results if e]
+    for cn, e in failed:
+        log.error('generating cert for %s: %s' % (cn, e))
+    if failed:
+        raise SSLError('failed to generate %s certs' % len(failed))
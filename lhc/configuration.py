@@ -1,15 +1,19 @@
 import ConfigParser
+import cPickle
 import logging
 import os
 import re
 import shutil
+import stat
+from collections import OrderedDict
 
-from consts import CONF_FILE_PATH, DEFAULT_CONF, DEFAULT_CONF_ITEMS, CONF_HOSTS_PATH, COMMON_EXTENSIONS
-from consts import SYS_HOSTS_PATH
+from consts import CONF_FILE_PATH, DEFAULT_CONF, DEFAULT_CONF_ITEMS, CONF_HOSTS_PATH
+from consts import SYS_HOSTS_PATH, LOG_PATH, HOSTS_SNAPSHOT_PATH
 from errors import ConfigError
-from proxy import ProxyDocker, ProxyLocal
+from peers import parse_peers, parse_peer, format_peer
+from proxy import ProxyDocker, ProxyLocal, ProxyNative
 from utils import cached_property, warp_join, b2s
-from utils import is_valid_ip, is_valid_hostname, mkdirs
+from utils import is_valid_ip, is_valid_hostname, mkdirs, parse_size, parse_duration, SIZE_REG
 
 log = logging.getLogger('lhc')
 
@@ -17,11 +21,30 @@ LHC_HOSTS_HEADER = '# ---------- BEGIN LHC HOSTS CONTENT ----------'
 LHC_HOSTS_FOOTER = '# ---------- END LHC HOSTS CONTENT ------------'
 LHC_HOSTS_CONTENT_REG = re.compile(LHC_HOSTS_HEADER + '.*' + LHC_HOSTS_FOOTER, flags=re.DOTALL)
 
+# host options that fall back to the global config when not set
+INHERITED = ('extensions', 'cache_size_limit', 'cache_expire', 'cache_key', 'dns_resolver', 'slice_size')
+HOST_OPTIONS = INHERITED + ('proxy_ip', 'mirror_group', 'mirror_prefix')
+
+SNAPSHOT_VERSION = 2
+
+# per_host: a cache zone and server block for every host, shared: hosts share zones and one server
+LAYOUTS = ('per_host', 'shared')
+# keys of a shared zone must tell the hosts apart
+HOST_KEY_REG = re.compile(r'\$(\{host\}|host\b)')
+
+# hosts of a mirror group share one zone and store an url under the same key, whichever of them it came from
+MIRROR_CACHE_KEY = 'mirror:%s$uri$is_args$args'
+MIRROR_GROUP_REG = re.compile(r'^[\w-]+$')
+# where a host serves the tree of its group, stripped from the uri in the key
+MIRROR_PREFIX_REG = re.compile(r'^(/[\w.~+-]+)+$')
+
 
 class Config(object):
     def __init__(self, extensions=None, cache_path=None, cache_size_limit=None, cache_expire=None,
                  cache_key=None, http_port=None, https_port=None, mode=None, proxy_ip=None, dns_resolver=None, ssl=None,
-                 conf=None):
+                 cert_key_type=None, metrics_port=None, tuning=None, slice_size=None, layout=None, dns_port=None,
+                 dns_wildcard=None, peers=None, hot_cache_path=None, hot_cache_size_limit=None,
+                 hot_max_object_size=None, conf=None):
         self.extensions = extensions
         if cache_path:
             cache_path = cache_path.rstrip('/')
@@ -35,6 +58,25 @@ class Config(object):
         self._proxy_ip = proxy_ip
         self.dns_resolver = dns_resolver
         self.ssl = ssl
+        self.cert_key_type = cert_key_type
+        self.metrics_port = metrics_port
+        self.tuning = tuning
+        if slice_size and not SIZE_REG.match(slice_size):
+            raise ConfigError("invalid slice_size '%s'" % slice_size)
+        self.slice_size = slice_size
+        if layout and layout not in LAYOUTS:
+            raise ConfigError("unknown layout '%s', should be one of %s" % (layout, ', '.join(LAYOUTS)))
+        self.layout = layout or 'per_host'
+        self.dns_port = dns_port
+        self.dns_wildcard = dns_wildcard
+        self.peers = parse_peers(peers)
+        for name, value in (('hot_cache_size_limit', hot_cache_size_limit),
+                            ('hot_max_object_size', hot_max_object_size)):
+            if value and not SIZE_REG.match(value):
+                raise ConfigError("invalid %s '%s'" % (name, value))
+        self.hot_cache_path = hot_cache_path and hot_cache_path.rstrip('/')
+        self.hot_cache_size_limit = hot_cache_size_limit
+        self.hot_max_object_size = hot_max_object_size
         self._conf = conf
         self._load_hosts()
 
@@ -44,9 +86,20 @@ class Config(object):
             return ProxyDocker(self)
         elif self.mode == 'local':
             return ProxyLocal(self)
+        elif self.mode == 'native':
+            return ProxyNative(self)
         else:
             raise ConfigError('unknown mode ' + self.mode)
 
+    @cached_property
+    def tuning_profile(self):
+        from tuning import get_tuning
+        return get_tuning(self.tuning)
+
+    @property
+    def proxy_ip_auto(self):
+        return self._proxy_ip == 'auto'
+
     @cached_property
     def proxy_ip(self):
         if self._proxy_ip == 'auto':
@@ -76,6 +129,17 @@ class Config(object):
             dns_resolver=cp.get('global', 'dns_resolver'),
             proxy_ip=cp.get('global', 'proxy_ip'),
             ssl=cp.getboolean('global', 'ssl'),
+            cert_key_type=cp.get('global', 'cert_key_type'),
+            metrics_port=cp.getint('global', 'metrics_port'),
+            tuning=cp.get('global', 'tuning'),
+            slice_size=cp.get('global', 'slice_size'),
+            layout=cp.get('global', 'layout'),
+            dns_port=cp.getint('global', 'dns_port'),
+            dns_wildcard=cp.getboolean('global', 'dns_wildcard'),
+            peers=cp.get('global', 'peers'),
+            hot_cache_path=cp.get('global', 'hot_cache_path'),
+            hot_cache_size_limit=cp.get('global', 'hot_cache_size_limit'),
+            hot_max_object_size=cp.get('global', 'hot_max_object_size'),
             conf=cp,
         )
 
@@ -93,6 +157,17 @@ class Config(object):
         self.mode and cp.set('global', 'mode', self.mode)
         self._proxy_ip and cp.set('global', 'proxy_ip', self._proxy_ip)
         self.ssl and b2s(cp.set('global', 'ssl', self.ssl))
+        self.cert_key_type and cp.set('global', 'cert_key_type', self.cert_key_type)
+        self.metrics_port and cp.set('global', 'metrics_port', self.metrics_port)
+        self.tuning and cp.set('global', 'tuning', self.tuning)
+        self.slice_size and cp.set('global', 'slice_size', self.slice_size)
+        self.layout and cp.set('global', 'layout', self.layout)
+        self.dns_port and cp.set('global', 'dns_port', self.dns_port)
+        self.dns_wildcard and cp.set('global', 'dns_wildcard', b2s(self.dns_wildcard))
+        self.peers and cp.set('global', 'peers', self.peers_display)
+        self.hot_cache_path and cp.set('global', 'hot_cache_path', self.hot_cache_path)
+        self.hot_cache_size_limit and cp.set('global', 'hot_cache_size_limit', self.hot_cache_size_limit)
+        self.hot_max_object_size and cp.set('global', 'hot_max_object_size', self.hot_max_object_size)
 
         with open(CONF_FILE_PATH, 'wb') as f:
             cp.write(f)
@@ -100,19 +175,112 @@ class Config(object):
         for host in self.hosts.values():
             host.save()
 
+    @property
+    def peers_display(self):
+        return ','.join(format_peer(p) for p in self.peers)
+
+    def add_peer(self, spec):
+        peer = parse_peer(spec)
+        if peer in self.peers:
+            raise ConfigError('peer %s already added' % format_peer(peer))
+        self.peers.append(peer)
+        self._save_option('peers', self.peers_display)
+        return peer
+
+    def delete_peer(self, spec):
+        peer = parse_peer(spec)
+        if peer not in self.peers:
+            # by address alone when the ports were left out
+            found = [p for p in self.peers if p.address == peer.address]
+            if len(found) != 1 or spec.strip() != peer.address:
+                raise ConfigError('peer not found')
+            peer = found[0]
+        self.peers.remove(peer)
+        self._save_option('peers', self.peers_display)
+        return peer
+
+    def _save_option(self, option, value):
+        """set a single global option in lhc.conf, keeping the comments and the rest of the file as they are"""
+        with open(CONF_FILE_PATH, 'rb') as f:
+            content = f.read()
+        line = '%s = %s' % (option, value)
+        reg = re.compile(r'^%s\s*[=:].*$' % re.escape(option), flags=re.MULTILINE)
+        if reg.search(content):
+            content = reg.sub(lambda m: line, content, count=1)
+        else:
+            content = re.sub(r'^\[global\][ \t]*$', lambda m: m.group(0) + '\n' + line, content, count=1,
+                             flags=re.MULTILINE)
+        with open(CONF_FILE_PATH, 'wb') as f:
+            f.write(content)
+
     def _load_hosts(self):
         self.hosts = {}
         if not os.path.exists(CONF_HOSTS_PATH):
             return
-        for p in os.listdir(CONF_HOSTS_PATH):
+        files = self._host_files()
+        if self._load_snapshot(files):
+            return
+        for p in files:
             path = os.path.join(CONF_HOSTS_PATH, p)
-            if not os.path.isfile(path):
-                continue
             host = Host.from_path(path, g=self)
             if host.name in self.hosts:
                 raise ConfigError(
                     "duplicate hostname '%s' of file %s and %s" % (host.name, host._path, self.hosts[host.name]._path))
             self.hosts[host.name] = host
+        self._save_snapshot(files)
+
+    @staticmethod
+    def _host_files():
+        """{file name: (mtime, size)} of the host conf files"""
+        files = {}
+        for p in os.listdir(CONF_HOSTS_PATH):
+            try:
+                st = os.stat(os.path.join(CONF_HOSTS_PATH, p))
+            except OSError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                files[p] = (st.st_mtime, st.st_size)
+        return files
+
+    def _defaults(self):
+        return tuple(getattr(self, o) for o in INHERITED)
+
+    def _load_snapshot(self, files):
+        """
+        fill self.hosts from the snapshot if it was written from exactly these host files,
+        the resolved options are reused when the global defaults are still the same
+        """
+        try:
+            with open(HOSTS_SNAPSHOT_PATH, 'rb') as f:
+                snapshot = cPickle.load(f)
+            if snapshot['version'] != SNAPSHOT_VERSION or snapshot['files'] != files:
+                return False
+            defaults = snapshot['defaults'] == self._defaults()
+            hosts = {}
+            for name, path, options, resolved in snapshot['hosts']:
+                hosts[name] = Host.from_snapshot(name, path, options, resolved if defaults else None, self)
+        except Exception as e:
+            # missing, outdated or corrupted, the host files are parsed instead
+            log.debug('hosts snapshot not used: %r' % e)
+            return False
+        self.hosts = hosts
+        return True
+
+    def _save_snapshot(self, files=None):
+        snapshot = {
+            'version': SNAPSHOT_VERSION,
+            'files': self._host_files() if files is None else files,
+            'defaults': self._defaults(),
+            'hosts': [(h.name, h._path, h.options(), h._inherited()) for h in self.hosts.values()],
+        }
+        tmp = '%s.%d.tmp' % (HOSTS_SNAPSHOT_PATH, os.getpid())
+        try:
+            with open(tmp, 'wb') as f:
+                cPickle.dump(snapshot, f, cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, HOSTS_SNAPSHOT_PATH)
+        except (IOError, OSError) as e:
+            # e.g. read-only for non-root users, the next run parses the files again
+            log.debug('can not write hosts snapshot: %s' % e)
 
     def _dumps_hosts(self):
         if not self.proxy.running():
@@ -142,6 +310,42 @@ class Config(object):
     def get_host(self, hostname):
         return self.hosts.get(hostname)
 
+    def find_host(self, name):
+        """the host serving name, with dns_wildcard also the closest host name is a parent domain of"""
+        host = self.hosts.get(name)
+        while host is None and self.dns_wildcard and '.' in name:
+            name = name.split('.', 1)[1]
+            host = self.hosts.get(name)
+        return host
+
+    def shared_zones(self):
+        """{zone name: [host]} of the hosts in shared cache zones"""
+        zones = OrderedDict()
+        for name in sorted(self.hosts):
+            host = self.hosts[name]
+            if host.shared:
+                zones.setdefault(host.cache_name, []).append(host)
+        return zones
+
+    def mirror_groups(self):
+        """{zone name: [host]} of the hosts in mirror groups, every group is one cache zone"""
+        zones = OrderedDict()
+        for name in sorted(self.hosts):
+            host = self.hosts[name]
+            if host.mirror_group:
+                zones.setdefault(host.cache_name, []).append(host)
+        return zones
+
+    @staticmethod
+    def zone_limits(members):
+        """(inactive, max_size in bytes) of a zone of several hosts: the longest cache_expire, the sum of limits"""
+        inactive = max((h.cache_expire for h in members), key=parse_duration)
+        return inactive, sum(parse_size(h.cache_size_limit) for h in members)
+
+    def hot_hosts(self):
+        """the hosts whose small objects are kept in the hot tier as well"""
+        return [self.hosts[name] for name in sorted(self.hosts) if self.hosts[name].hot]
+
     def set_host(self, hostname, host=None, **kwargs):
         if host:
             if not isinstance(host, Host):
@@ -155,6 +359,7 @@ class Config(object):
                 os.remove(host._path)
         self.hosts[hostname] = host
         host.save()
+        self._save_snapshot()
         if not os.path.exists(host.cert_path):
             log.info('generating cert for ' + host.name)
             host.gen_certs()
@@ -168,22 +373,71 @@ class Config(object):
         host = self.hosts.pop(hostname)
         if os.path.isfile(host._path):
             os.remove(host._path)
+        self._save_snapshot()
         if self.hosts_activated():
             self.activate_hosts()
         return host
 
-    def purge(self, hostname):
+    def purge(self, hostname, urls=None, glob=None, regex=None, uncacheable=False, use_index=True):
+        """
+        purge the whole cache of a host, or only the entries of urls / whose key matches glob or regex /
+        whose url does not have one of the host's extensions.
+        returns [(key, bytes)] of removed entries, or None when everything was removed
+        """
         if hostname not in self.hosts:
             raise ConfigError('hostname not found')
         host = self.hosts[hostname]
-        shutil.rmtree(host.cache_path)
+        from cachefile import host_key_regex
+        from purge import purge_urls, purge_matching, purge_hot, uncacheable_matcher
+        if host.hot:
+            # the copies in the hot tier would be served for a while longer otherwise
+            try:
+                purge_hot(host, urls=urls, glob=glob, regex=regex, match=uncacheable and uncacheable_matcher(host))
+            except re.error as e:
+                raise ConfigError('invalid regex %s: %s' % (regex, e))
+        if not (urls or glob or regex or uncacheable):
+            if host.mirror_group:
+                log.warn('%s shares its cache with mirror group %s, the objects of the whole group are purged' % (
+                    hostname, host.mirror_group))
+            if host.shared:
+                # only the entries of this host, the rest of the zone belongs to the others
+                return purge_matching(host, regex=host_key_regex(host), use_index=use_index)
+            if os.path.exists(host.cache_path):
+                shutil.rmtree(host.cache_path)
+            return
+        removed = []
+        if urls:
+            removed.extend(purge_urls(host, urls))
+        if glob or regex:
+            try:
+                removed.extend(purge_matching(host, glob=glob, regex=regex, use_index=use_index))
+            except re.error as e:
+                raise ConfigError('invalid regex %s: %s' % (regex, e))
+        if uncacheable:
+            removed.extend(purge_matching(host, match=uncacheable_matcher(host), use_index=use_index))
+        return removed
 
 
 class Host(object):
+    __slots__ = ('name', '_extensions', '_cache_size_limit', '_cache_expire', '_cache_key', '_proxy_ip',
+                 '_dns_resolver', '_slice_size', '_mirror_group', '_mirror_prefix', '_conf', '_path', '_g',
+                 '_resolved', '_certs_path')
+
     def __init__(self, name, extensions=None, cache_size_limit=None, cache_expire=None,
-                 cache_key=None, proxy_ip=None, dns_resolver=None, conf=None, path=None, g=None):
+                 cache_key=None, proxy_ip=None, dns_resolver=None, slice_size=None, mirror_group=None,
+                 mirror_prefix=None, conf=None, path=None, g=None):
         if not is_valid_hostname(name):
             raise ConfigError("invalid hostname '%s'" % (name))
+        if slice_size and not SIZE_REG.match(slice_size):
+            raise ConfigError("invalid slice_size '%s'" % slice_size)
+        if mirror_group and not MIRROR_GROUP_REG.match(mirror_group):
+            raise ConfigError("invalid mirror_group '%s', should be letters, digits, _ or -" % mirror_group)
+        if mirror_prefix:
+            mirror_prefix = mirror_prefix.rstrip('/')
+            if not mirror_group:
+                raise ConfigError('mirror_prefix needs a mirror_group')
+            if not MIRROR_PREFIX_REG.match(mirror_prefix):
+                raise ConfigError("invalid mirror_prefix '%s', should be a path like /centos" % mirror_prefix)
         self.name = name
         self._extensions = extensions
         self._cache_size_limit = cache_size_limit
@@ -191,13 +445,82 @@ class Host(object):
         self._cache_key = cache_key
         self._proxy_ip = proxy_ip
         self._dns_resolver = dns_resolver
+        self._slice_size = slice_size
+        self._mirror_group = mirror_group
+        self._mirror_prefix = mirror_prefix or None
         self._conf = conf
         self._path = path or os.path.join(CONF_HOSTS_PATH, self.name)
         self._g = g
+        self._resolved = None
+        self._certs_path = None
 
-    @cached_property
+    def options(self):
+        """the values set in the host's own conf file, in HOST_OPTIONS order"""
+        return tuple(getattr(self, '_' + o) for o in HOST_OPTIONS)
+
+    def _inherited(self):
+        """INHERITED options with the global defaults filled in, resolved once"""
+        if self._resolved is None:
+            self._resolved = tuple(getattr(self, '_' + o) or getattr(self._g, o) for o in INHERITED)
+        return self._resolved
+
+    @property
+    def extensions(self):
+        return self._inherited()[0]
+
+    @property
+    def cache_size_limit(self):
+        return self._inherited()[1]
+
+    @property
+    def cache_expire(self):
+        return self._inherited()[2]
+
+    @property
+    def cache_key(self):
+        if self._mirror_group:
+            return MIRROR_CACHE_KEY % self._mirror_group
+        return self._inherited()[3]
+
+    @property
+    def dns_resolver(self):
+        return self._inherited()[4]
+
+    @property
+    def slice_size(self):
+        return self._inherited()[5]
+
+    @property
+    def mirror_group(self):
+        return self._mirror_group
+
+    @property
+    def mirror_prefix(self):
+        return self._mirror_prefix
+
+    @property
+    def mirror_display(self):
+        if not self._mirror_group:
+            return ''
+        return self._mirror_group + (':' + self._mirror_prefix if self._mirror_prefix else '')
+
+    def render_key(self, variables):
+        """the cache key of a request with these nginx variables, with the mirror prefix stripped from $uri"""
+        from cachefile import render_cache_key
+        prefix = self._mirror_prefix
+        if prefix and variables['uri'].startswith(prefix + '/'):
+            variables = dict(variables, uri=variables['uri'][len(prefix):])
+        return render_cache_key(self.cache_key, variables)
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
     def certs_path(self):
-        return self._g.proxy.get_host_cert_paths(self.name)
+        if self._certs_path is None:
+            self._certs_path = self._g.proxy.get_host_cert_paths(self.name)
+        return self._certs_path
 
     @property
     def pkey_path(self):
@@ -211,35 +534,67 @@ class Host(object):
         self._g.proxy.gen_and_sign_certs_for(self.name)
 
     @property
-    def extensions_reg(self):
-        exts = self._extensions or (self._g and self._g.extensions)
-        exts = re.split(r'[,|]', exts)
-        rt = []
-        for ext in exts:
-            if ext in COMMON_EXTENSIONS:
-                rt.extend(COMMON_EXTENSIONS[ext])
-            else:
-                rt.append(ext.strip())
-        return '|'.join(set(rt))
+    def extensions_regex(self):
+        return self.matcher.regex
+
+    @property
+    def matcher(self):
+        from matcher import get_matcher
+        return get_matcher(self.extensions)
 
     @property
     def extensions_display(self):
-        exts = self._extensions or (self._g and self._g.extensions)
-        exts = re.split(r'[,|]', exts)
+        exts = re.split(r'[,|]', self.extensions)
         return warp_join(',', exts, 20)
 
     @property
     def normalized_name(self):
         return self.name.replace('.', '_').replace('-', '_')
 
+    @property
+    def shared(self):
+        """
+        whether the host is cached in a zone shared with other hosts; slices and keys without $host
+        need a server block of their own, the native engine always keeps a directory per host
+        """
+        return (self._g.layout == 'shared' and self._g.mode != 'native' and not self.slice_bytes and
+                HOST_KEY_REG.search(self.cache_key) is not None)
+
+    @property
+    def hot(self):
+        """
+        whether small objects of the host are kept in the hot tier in front of its disk zone, which is
+        shared by all hosts, so the keys must tell them apart; slices are big files by design
+        """
+        return (bool(self._g.hot_cache_path) and self._g.mode != 'native' and not self.slice_bytes and
+                HOST_KEY_REG.search(self.cache_key) is not None)
+
     @property
     def cache_name(self):
+        if self._mirror_group:
+            return 'cache_mirror_' + re.sub(r'\W', '_', self._mirror_group)
+        if self.shared:
+            # the zone's inactive is per zone, hosts are grouped by cache_expire
+            return 'cache_shared_' + re.sub(r'\W', '_', self.cache_expire)
         return 'cache_' + self.normalized_name
 
     @property
     def cache_path(self):
         return os.path.join(self._g.cache_path, self.cache_name)
 
+    @property
+    def hot_cache_path(self):
+        return self._g.hot_cache_path if self.hot else None
+
+    @property
+    def access_log_path(self):
+        return os.path.join(LOG_PATH, self.name + '.access.log')
+
+    @property
+    def slice_bytes(self):
+        """slice size in bytes, 0 when big files are cached whole"""
+        return parse_size(self.slice_size) if self.slice_size else 0
+
     @property
     def proxy_ip(self):
         if self._proxy_ip == 'auto' or not self._proxy_ip:
@@ -247,6 +602,11 @@ class Host(object):
         else:
             return self._proxy_ip
 
+    @property
+    def proxy_ip_auto(self):
+        """whether proxy_ip is the one `auto` finds: loopback, or the docker bridge address on linux"""
+        return (self._proxy_ip == 'auto' or not self._proxy_ip) and self._g.proxy_ip_auto
+
     @classmethod
     def from_path(cls, path, g=None):
         cp = ConfigParser.RawConfigParser()
@@ -268,22 +628,32 @@ class Host(object):
                    cache_key=get('cache_key'),
                    proxy_ip=get('proxy_ip'),
                    dns_resolver=get('dns_resolver'),
+                   slice_size=get('slice_size'),
+                   mirror_group=get('mirror_group'),
+                   mirror_prefix=get('mirror_prefix'),
                    conf=cp,
                    path=path,
                    g=g)
 
-    def __getattr__(self, item):
-        if not hasattr(self, '_' + item):
-            raise ConfigError("'%s' object has no attribute '%s'" % (type(self), item))
-        return getattr(self, '_' + item) or getattr(self._g, item)
+    @classmethod
+    def from_snapshot(cls, name, path, options, resolved, g):
+        """a host validated when the snapshot was written, the constructor's checks are skipped"""
+        host = cls.__new__(cls)
+        host.name = name
+        for o, v in zip(HOST_OPTIONS, options):
+            setattr(host, '_' + o, v)
+        host._conf = None
+        host._path = path
+        host._g = g
+        host._resolved = resolved
+        host._certs_path = None
+        return host
 
     def save(self):
         cp = ConfigParser.RawConfigParser()
         cp.add_section(self.name)
-        self._extensions and cp.set(self.name, 'extensions', self._extensions)
-        self._cache_size_limit and cp.set(self.name, 'cache_size_limit', self._cache_size_limit)
-        self._cache_key and cp.set(self.name, 'cache_key', self._cache_key)
-        self._proxy_ip and cp.set(self.name, 'proxy_ip', self._proxy_ip)
+        for o, v in zip(HOST_OPTIONS, self.options()):
+            v and cp.set(self.name, o, v)
 
         if not os.path.exists(os.path.dirname(self._path)):
             mkdirs(os.path.dirname(self._path))
@@ -1,5 +1,6 @@
 import os
 import platform
+import sys
 from os import path
 
 from utils import find_executable
@@ -12,10 +13,23 @@ CONF_PATH = os.getenv('CONF_PATH') or '/etc/lhc'
 CONF_HOSTS_PATH = path.join(CONF_PATH, 'hosts')
 CONF_FILE_PATH = path.join(CONF_PATH, 'lhc.conf')
 NGINX_CONF_FILE_PATH = path.join(CONF_PATH, 'nginx.conf')
+CACHE_INDEX_PATH = path.join(CONF_PATH, 'index')
+# pickled host table, re-built when a file in CONF_HOSTS_PATH changes
+HOSTS_SNAPSHOT_PATH = path.join(CONF_PATH, 'hosts.snapshot')
 
 MAC_ALIAS_IP = os.getenv('MAC_ALIAS_IP') or '192.168.221.181'
 NGINX_DOCKER_IMAGE = os.getenv('NGINX_DOCKER_IMAGE') or 'daocloud.io/nginx'
 PROXY_CONTAINER_NAME = os.getenv('PROXY_DOCKER_NAME') or 'lhc-proxy'
+DOCKER_SOCK = os.getenv('DOCKER_SOCK') or '/var/run/docker.sock'
+
+LOG_PATH = os.getenv('LOG_PATH') or '/var/log/lhc'
+
+NATIVE_PID_FILE = os.getenv('NATIVE_PID_FILE') or '/var/run/lhc-native.pid'
+NATIVE_LOG_FILE = os.getenv('NATIVE_LOG_FILE') or '/var/log/lhc-native.log'
+METRICS_PID_FILE = os.getenv('METRICS_PID_FILE') or '/var/run/lhc-metrics.pid'
+METRICS_LOG_FILE = os.getenv('METRICS_LOG_FILE') or '/var/log/lhc-metrics.log'
+DNS_PID_FILE = os.getenv('DNS_PID_FILE') or '/var/run/lhc-dns.pid'
+DNS_LOG_FILE = os.getenv('DNS_LOG_FILE') or '/var/log/lhc-dns.log'
 
 CERT_FILES_PATH = path.join(CONF_PATH, 'certs')
 CA_CERT_FILES_PATH = path.join(CERT_FILES_PATH, 'ca')
@@ -42,7 +56,18 @@ DEFAULT_CONF_ITEMS = {
     'mode': 'docker',
     'proxy_ip': 'auto',
     'dns_resolver': '114.114.114.114',
-    'ssl': 'true'
+    'ssl': 'true',
+    'cert_key_type': 'ecdsa',
+    'metrics_port': 0,
+    'tuning': 'auto',
+    'slice_size': '',
+    'layout': 'per_host',
+    'dns_port': 0,
+    'dns_wildcard': 'false',
+    'peers': '',
+    'hot_cache_path': '',
+    'hot_cache_size_limit': '256m',
+    'hot_max_object_size': '1m',
 }
 
 DEFAULT_CONF = """\
@@ -62,21 +87,62 @@ http_port = {http_port}
 https_port = {https_port}
 dns_resolver = {dns_resolver}
 
-# run proxy as local process (nginx) or as docker container
-# local or docker
+# cache files in slices of this size (e.g. 1m) so range requests and aborted downloads of big files
+# are served from and kept in the cache, empty to cache whole files
+# slice_size = 1m
+
+# key type of the generated host certs, ecdsa or rsa
+cert_key_type = {cert_key_type}
+
+# per_host: a cache zone with its own max_size and a server block for every host
+# shared: hosts share a few cache zones (one per cache_expire) and a single server configured through
+# maps on $host, which keeps nginx small and fast to reload with thousands of hosts. hosts with
+# slice_size or a cache_key without $host keep their own zone and server block, hosts set with
+# `lhc set -g GROUP` keep their server block and share the zone of their mirror group
+layout = {layout}
+
+# nginx worker, connection and buffer settings: auto, small, large,
+# optionally followed by explicit values, e.g. large,worker_connections=8192
+tuning = {tuning}
+
+# run proxy as local process (nginx), as docker container or with the built-in python engine
+# local, docker or native
 mode = {mode}
 
 cache_path = {cache_path}
 
 # set it when use a outside proxy server
 proxy_ip = {proxy_ip}
+
+# serve prometheus metrics on this port, 0 to disable
+metrics_port = {metrics_port}
+
+# answer dns queries for the hosts with proxy_ip on this port (e.g. 53), so other machines and containers
+# can use the cache by pointing their resolver at this one, other names are forwarded to dns_resolver.
+# an `auto` or loopback proxy_ip is answered with the address of this machine the query came to.
+# 0 to disable, `lhc activate` still edits /etc/hosts of this machine
+dns_port = {dns_port}
+# answer and proxy every subdomain of the hosts as well
+dns_wildcard = {dns_wildcard}
+
+# other lhc nodes (address[:http_port[:https_port]], comma separated) asked for cacheable misses before the
+# origin, each url by the same one of them. list the same peers on every node, this one included
+peers = {peers}
+
+# hot tier: objects up to hot_max_object_size are also kept in this directory, which should be on a tmpfs
+# (e.g. /dev/shm/lhc.hot), so small and popular files do not wait for the disk behind big downloads.
+# hosts with slice_size or a cache_key without $host only use their disk zone. empty to disable
+hot_cache_path = {hot_cache_path}
+hot_cache_size_limit = {hot_cache_size_limit}
+hot_max_object_size = {hot_max_object_size}
 """.format(WEB=COMMON_EXTENSIONS['__WEB__'],
            PKG=COMMON_EXTENSIONS['__PKG__'],
            PIP=COMMON_EXTENSIONS['__PIP__'],
            **DEFAULT_CONF_ITEMS)
 
-MAC = 'Darwin' in platform.platform()
-LINUX = 'Linux' in platform.platform()
-AMD64 = 'x86_64' in platform.platform()
+# platform.platform() inspects the libc of the interpreter binary, too slow to run on every invocation
+MAC = sys.platform == 'darwin'
+LINUX = sys.platform.startswith('linux')
+AMD64 = platform.machine() == 'x86_64'
 REDHAT = os.path.exists('/etc/redhat-release')
 DEBIAN = find_executable('apt-get')
@@ -0,0 +1,199 @@
+# finds the bodies cached by more than one host. nginx stores the key line, the response headers and the body
+# of an entry in one file, and the headers differ between hosts (key, date, valid_sec), so the files can be
+# neither hardlinked nor reflinked: the body starts at a different, unaligned offset in each. this only reports
+# the duplicates, hosts serving the same tree stop storing it twice once they are in one mirror group
+import hashlib
+import logging
+import os
+import sqlite3
+from collections import OrderedDict, defaultdict
+from multiprocessing.pool import ThreadPool
+
+from cache_index import CacheIndex
+from cachefile import read_entry, CacheFileError
+from consts import CACHE_INDEX_PATH
+from disk_usage import DEFAULT_WORKERS
+from utils import mkdirs
+
+log = logging.getLogger('lhc')
+
+CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    zone TEXT,
+    dev INTEGER,
+    ino INTEGER,
+    size INTEGER,
+    mtime REAL,
+    body_start INTEGER,
+    body_sha TEXT
+);
+CREATE INDEX IF NOT EXISTS files_zone ON files (zone);
+'''
+
+
+class FileInfo(object):
+    __slots__ = ('path', 'zone', 'dev', 'ino', 'size', 'mtime', 'body_start', 'body_sha')
+
+    def __init__(self, path, zone):
+        self.path = path
+        self.zone = zone
+        self.body_start = self.body_sha = None
+
+    @property
+    def body_size(self):
+        return self.size - self.body_start
+
+    def same_stat(self, st):
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime) == (self.dev, self.ino, self.size, self.mtime)
+
+
+def _stat(info):
+    """fills the stat fields of info, None when the file is gone"""
+    try:
+        st = os.stat(info.path)
+    except OSError:
+        return
+    info.dev, info.ino = st.st_dev, st.st_ino
+    info.size, info.mtime = st.st_size, st.st_mtime
+    return info
+
+
+def _read_header(info):
+    try:
+        with open(info.path, 'rb') as f:
+            info.body_start = read_entry(f).body_start
+    except (IOError, CacheFileError) as e:
+        log.debug('skip %s: %s' % (info.path, e))
+        return
+    return info
+
+
+def _hash(info):
+    """sha256 of the body"""
+    body = hashlib.sha256()
+    try:
+        with open(info.path, 'rb') as f:
+            f.seek(info.body_start)
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                body.update(chunk)
+            if not info.same_stat(os.fstat(f.fileno())):
+                return
+    except IOError:
+        return
+    info.body_sha = body.hexdigest()
+    return info
+
+
+class DuplicateFinder(object):
+    """
+    finds the bodies cached under the keys of several hosts by size then sha256, hashes are kept in an sqlite
+    file so later runs only read new or changed files
+    """
+
+    def __init__(self, db_path=os.path.join(CACHE_INDEX_PATH, 'dedup.sqlite'), workers=DEFAULT_WORKERS):
+        mkdirs(os.path.dirname(db_path))
+        self.db = sqlite3.connect(db_path)
+        self.db.text_factory = str
+        self.db.executescript(SCHEMA)
+        self.workers = workers
+        self.stats = dict.fromkeys(('files', 'hashed', 'hashed_bytes', 'dup_files', 'dup_bytes'), 0)
+        # {(hostname, ...): [files, bytes]} of the bodies stored once per zone of these hosts
+        self.shared_by = defaultdict(lambda: [0, 0])
+
+    def close(self):
+        self.db.close()
+
+    def _map(self, fn, items):
+        pool = ThreadPool(self.workers)
+        try:
+            return [r for r in pool.imap_unordered(fn, items, chunksize=16) if r is not None]
+        finally:
+            pool.close()
+            pool.join()
+
+    @staticmethod
+    def zones(hosts):
+        """
+        {name: (host, [hostname])} of the places a file is stored once: the hosts of a mirror group share
+        their keys, every other host has keys of its own, also in a shared zone
+        """
+        zones = OrderedDict()
+        for host in hosts:
+            zones.setdefault(host.cache_name if host.mirror_group else host.name, (host, []))[1].append(host.name)
+        return zones
+
+    def scan(self, zones, update=True):
+        """FileInfo of every cache file of the zones, with the hashes known from earlier runs"""
+        infos = {}
+        for zone, (host, _) in zones.items():
+            index = CacheIndex.for_host(host)
+            try:
+                if update:
+                    index.update()
+                for _, _, _, _, _, name, d in index.query():
+                    path = os.path.join(host.cache_path, d, name)
+                    infos[path] = FileInfo(path, zone)
+            finally:
+                index.close()
+        infos = self._map(_stat, infos.values())
+        known = dict((row[0], row[1:]) for row in self.db.execute(
+            'SELECT path, dev, ino, size, mtime, body_start, body_sha FROM files'))
+        changed = []
+        for info in infos:
+            row = known.get(info.path)
+            if row and row[:4] == (info.dev, info.ino, info.size, info.mtime):
+                info.body_start, info.body_sha = row[4:]
+            else:
+                changed.append(info)
+        infos = [i for i in infos if i.body_start is not None] + self._map(_read_header, changed)
+        self.stats['files'] = len(infos)
+        return infos
+
+    def hash_candidates(self, infos):
+        """hashes the files that have a body size in common with a file of another zone"""
+        by_size = defaultdict(set)
+        for info in infos:
+            by_size[info.body_size].add(info.zone)
+        todo = [i for i in infos if i.body_sha is None and len(by_size[i.body_size]) > 1 and i.body_size]
+        hashed = self._map(_hash, todo)
+        self.stats['hashed'] = len(hashed)
+        self.stats['hashed_bytes'] = sum(i.size for i in hashed)
+        return [i for i in infos if i.body_sha is not None]
+
+    def save(self, zones, infos):
+        with self.db:
+            for zone in zones:
+                self.db.execute('DELETE FROM files WHERE zone = ?', (zone,))
+            self.db.executemany(
+                'INSERT OR REPLACE INTO files (path, zone, dev, ino, size, mtime, body_start, body_sha) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(i.path, i.zone, i.dev, i.ino, i.size, i.mtime, i.body_start, i.body_sha) for i in infos])
+
+    def count(self, infos, zones):
+        """counts the bodies stored in more than one zone, and the hosts of the zones holding them"""
+        by_body = defaultdict(dict)
+        for info in infos:
+            by_body[info.body_size, info.body_sha].setdefault(info.zone, info)
+        for (body_size, _), copies in by_body.items():
+            if len(copies) < 2:
+                continue
+            # one copy is needed, every other zone holds an extra one
+            self.stats['dup_files'] += len(copies) - 1
+            self.stats['dup_bytes'] += (len(copies) - 1) * body_size
+            hostnames = tuple(sorted(name for zone in copies for name in zones[zone][1]))
+            self.shared_by[hostnames][0] += 1
+            self.shared_by[hostnames][1] += (len(copies) - 1) * body_size
+
+    def run(self, hosts, update=True):
+        zones = self.zones(hosts)
+        infos = self.scan(zones, update)
+        hashed = self.hash_candidates(infos)
+        self.count(hashed, zones)
+        self.save(zones, infos)
+        return self.stats
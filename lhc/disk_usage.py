@@ -0,0 +1,116 @@
+# parallel, incremental disk usage of proxy_cache directories
+import json
+import multiprocessing
+import os
+import stat
+from multiprocessing.pool import ThreadPool
+
+from consts import CACHE_INDEX_PATH
+from utils import mkdirs
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+DEFAULT_WORKERS = min(32, multiprocessing.cpu_count() * 4)
+
+
+def _entries(path):
+    """yields (name, is_dir, st) without following symlinks"""
+    if scandir:
+        for e in scandir(path):
+            st = e.stat(follow_symlinks=False)
+            yield e.name, stat.S_ISDIR(st.st_mode), st
+    else:
+        for name in os.listdir(path):
+            st = os.lstat(os.path.join(path, name))
+            yield name, stat.S_ISDIR(st.st_mode), st
+
+
+def scan_tree(path):
+    """returns (bytes, files) below path"""
+    size = count = 0
+    try:
+        for name, is_dir, st in _entries(path):
+            if is_dir:
+                s, c = scan_tree(os.path.join(path, name))
+                size += s
+                count += c
+            else:
+                size += st.st_size
+                count += 1
+    except OSError:
+        pass
+    return size, count
+
+
+def _scan_job(args):
+    name, path = args
+    return name, scan_tree(path)
+
+
+class DiskUsage(object):
+    """keeps a {level-1 dir: [mtime, bytes, files]} summary so only changed directories are re-scanned"""
+
+    def __init__(self, cache_path, summary_path):
+        self.cache_path = cache_path
+        self.summary_path = summary_path
+
+    @classmethod
+    def for_host(cls, host):
+        return cls(host.cache_path, os.path.join(CACHE_INDEX_PATH, host.cache_name + '.du.json'))
+
+    @classmethod
+    def for_hot_tier(cls, config):
+        return cls(config.hot_cache_path, os.path.join(CACHE_INDEX_PATH, 'cache_hot.du.json'))
+
+    def _load(self):
+        try:
+            with open(self.summary_path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def _save(self, summary):
+        mkdirs(os.path.dirname(self.summary_path))
+        tmp = '%s.%d.tmp' % (self.summary_path, os.getpid())
+        with open(tmp, 'wb') as f:
+            json.dump(summary, f)
+        os.rename(tmp, self.summary_path)
+
+    def scan(self, workers=DEFAULT_WORKERS, full=False):
+        """returns (bytes, files, rescanned directories)"""
+        if not os.path.isdir(self.cache_path):
+            return 0, 0, 0
+        old = {} if full else self._load()
+        summary = {}
+        jobs = []
+        size = count = 0
+        for name, is_dir, st in _entries(self.cache_path):
+            if not is_dir:
+                size += st.st_size
+                count += 1
+                continue
+            cached = old.get(name)
+            if cached and cached[0] == st.st_mtime:
+                summary[name] = cached
+                continue
+            summary[name] = [st.st_mtime, 0, 0]
+            jobs.append((name, os.path.join(self.cache_path, name)))
+        if jobs:
+            pool = ThreadPool(min(workers, len(jobs)))
+            try:
+                for name, (s, c) in pool.imap_unordered(_scan_job, jobs):
+                    summary[name][1:] = [s, c]
+            finally:
+                pool.close()
+                pool.join()
+        for _, s, c in summary.values():
+            size += s
+            count += c
+        self._save(summary)
+        return size, count, len(jobs)
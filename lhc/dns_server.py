@@ -0,0 +1,213 @@
+# dns responder: the configured hosts resolve to the proxy for every machine pointed at it,
+# anything else is forwarded to dns_resolver through a response cache.
+# a proxy_ip only this machine can reach, `auto` (loopback, or the docker bridge address on linux) or a
+# loopback address, is replaced by the address of this machine the query came to: the proxy listens on all
+import SocketServer
+import logging
+import socket
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from consts import MAC
+from resolver import DNS_HEADER, DNS_RR, QTYPE_A, QCLASS_IN, DNSError, decode_name, exchange, parse_response, \
+    recv_exact
+
+log = logging.getLogger('lhc')
+
+QTYPE_AAAA = 28
+QTYPE_HTTPS = 65
+# answered empty for the hosts, so clients do not reach the origin over ipv6 or through address hints
+EMPTY_QTYPES = (QTYPE_AAAA, QTYPE_HTTPS)
+
+RCODE_SERVFAIL = 2
+
+FLAG_QR = 0x8000
+FLAG_AA = 0x0400
+FLAG_TC = 0x0200
+FLAG_RA = 0x0080
+# opcode and rd are copied from the query
+QUERY_FLAGS = 0x7900
+
+LOCAL_TTL = 60
+NEGATIVE_TTL = 30
+MIN_TTL = 5
+MAX_TTL = 3600
+CACHE_SIZE = 10000
+TCP_TIMEOUT = 10
+
+
+def parse_question(data):
+    """(name, type, class, offset after the question) of a query with a single question"""
+    _, flags, qdcount, _, _, _ = DNS_HEADER.unpack(data[:DNS_HEADER.size])
+    if flags & FLAG_QR or qdcount != 1:
+        raise DNSError('not a query with one question')
+    name, offset = decode_name(data, DNS_HEADER.size)
+    qtype, qclass = struct.unpack('!HH', data[offset:offset + 4])
+    return name.lower(), qtype, qclass, offset + 4
+
+
+def build_reply(query, question_end, ips=(), rcode=0):
+    """answer query with A records of ips, the question is copied and the rest of the query dropped"""
+    qid, flags = struct.unpack('!HH', query[:4])
+    flags = FLAG_QR | FLAG_RA | (flags & QUERY_FLAGS) | rcode
+    if ips:
+        flags |= FLAG_AA
+    rrs = ''.join('\xc0\x0c' + DNS_RR.pack(QTYPE_A, QCLASS_IN, LOCAL_TTL, 4) + socket.inet_aton(ip) for ip in ips)
+    return DNS_HEADER.pack(qid, flags, 1, len(ips), 0, 0) + query[DNS_HEADER.size:question_end] + rrs
+
+
+def route_address(client_ip):
+    """the address of this machine facing client_ip: the source of what is sent to it, connecting sends nothing"""
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect((client_ip, 53))
+        return s.getsockname()[0]
+    finally:
+        s.close()
+
+
+def is_loopback(ip):
+    return ip.startswith('127.')
+
+
+class ResponseCache(object):
+    """upstream responses by question, kept for the smallest ttl of their answers, least recently used dropped"""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is None or item[0] < time.time():
+                return
+            self._items[key] = item
+            return item[1]
+
+    def put(self, key, response):
+        try:
+            _, rcode, answers = parse_response(response)
+        except (DNSError, struct.error):
+            return
+        # NOERROR and NXDOMAIN, failures are asked again
+        if rcode not in (0, 3):
+            return
+        ttl = min(ttl for _, _, ttl, _ in answers) if answers else NEGATIVE_TTL
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = (time.time() + max(MIN_TTL, min(MAX_TTL, ttl)), response)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+
+class Responder(object):
+    def __init__(self, config):
+        self.config = config
+        self.upstream = config.dns_resolver
+        self.cache = ResponseCache()
+
+    def lookup(self, name, client_ip, server_ip=None):
+        """the address the client reaches the proxy of name by, None when name is no host"""
+        host = self.config.find_host(name)
+        if not host:
+            return
+        # docker for mac publishes the ports on the alias address `auto` gives only
+        if host.proxy_ip_auto and not MAC or is_loopback(host.proxy_ip or ''):
+            return server_ip or route_address(client_ip)
+        return host.proxy_ip
+
+    def handle(self, query, client_ip, server_ip=None, tcp=False):
+        """the response to a query, None to drop it; server_ip is the address the query came to when known"""
+        try:
+            name, qtype, qclass, end = parse_question(query)
+        except (DNSError, struct.error):
+            return
+        ip = self.lookup(name, client_ip, server_ip) if qclass == QCLASS_IN else None
+        if ip and qtype == QTYPE_A:
+            return build_reply(query, end, [ip])
+        if ip and qtype in EMPTY_QTYPES:
+            return build_reply(query, end)
+        key = (name, qtype, qclass)
+        cached = self.cache.get(key)
+        if cached:
+            return query[:2] + cached[2:]
+        try:
+            response = exchange(query, self.upstream, tcp=tcp)
+        except socket.error as e:
+            log.warn('forwarding %s to %s: %s' % (name, self.upstream, e))
+            return build_reply(query, end, rcode=RCODE_SERVFAIL)
+        # truncated responses are retried over tcp by the client
+        if not struct.unpack('!H', response[2:4])[0] & FLAG_TC:
+            self.cache.put(key, response)
+        return response
+
+
+class UDPHandler(SocketServer.BaseRequestHandler):
+    def handle(self):
+        data, sock = self.request
+        # a socket bound to every address does not tell which one a datagram came to
+        response = self.server.responder.handle(data, self.client_address[0])
+        if response:
+            sock.sendto(response, self.client_address)
+
+
+class TCPHandler(SocketServer.BaseRequestHandler):
+    def handle(self):
+        self.request.settimeout(TCP_TIMEOUT)
+        server_ip = self.request.getsockname()[0]
+        try:
+            while True:
+                length = struct.unpack('!H', recv_exact(self.request, 2))[0]
+                response = self.server.responder.handle(recv_exact(self.request, length), self.client_address[0],
+                                                        server_ip, tcp=True)
+                if not response:
+                    return
+                self.request.sendall(struct.pack('!H', len(response)) + response)
+        except socket.error:
+            pass
+
+
+class UDPServer(SocketServer.ThreadingMixIn, SocketServer.UDPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class TCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve_forever(config, address=''):
+    responder = Responder(config)
+    udp = UDPServer((address, config.dns_port), UDPHandler)
+    tcp = TCPServer((address, config.dns_port), TCPHandler)
+    udp.responder = tcp.responder = responder
+    t = threading.Thread(target=tcp.serve_forever)
+    t.daemon = True
+    t.start()
+    log.info('dns responder listening on :%s for %s hosts%s, forwarding to %s' % (
+        config.dns_port, len(config.hosts), ' and their subdomains' if config.dns_wildcard else '',
+        config.dns_resolver))
+    try:
+        udp.serve_forever()
+    finally:
+        tcp.shutdown()
+
+
+def main():
+    from configuration import Config
+
+    hdlr = logging.StreamHandler()
+    hdlr.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
+    log.addHandler(hdlr)
+    log.setLevel(logging.INFO)
+    serve_forever(Config.load())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
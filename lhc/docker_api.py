@@ -0,0 +1,142 @@
+# minimal client of the Docker Engine API over its unix socket, instead of forking the docker cli
+import httplib
+import json
+import socket
+import urllib
+
+from consts import DOCKER_SOCK
+from errors import ProxyError
+
+# docker 1.12+, the first version with everything used here (labels, ulimits, exec with tty)
+API_VERSION = 'v1.24'
+TIMEOUT = 60
+
+
+class DockerError(ProxyError):
+    def __init__(self, status, message):
+        ProxyError.__init__(self, message)
+        self.status = status
+
+
+class UnixHTTPConnection(httplib.HTTPConnection):
+    def __init__(self, path, timeout=TIMEOUT):
+        httplib.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.sock_path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.sock_path)
+        except socket.error:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class DockerClient(object):
+    """keeps a single keep-alive connection to the engine"""
+
+    def __init__(self, sock_path=DOCKER_SOCK, timeout=TIMEOUT):
+        self.sock_path = sock_path
+        self.timeout = timeout
+        self._conn = None
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def request(self, method, path, params=None, body=None):
+        """returns (status, response body), raises DockerError for error statuses"""
+        url = '/%s%s' % (API_VERSION, path)
+        if params:
+            url += '?' + urllib.urlencode(params)
+        headers = {}
+        data = None
+        if body is not None:
+            data = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        while True:
+            reused = self._conn is not None
+            conn = self._conn or UnixHTTPConnection(self.sock_path, self.timeout)
+            self._conn = None
+            try:
+                conn.request(method, url, data, headers)
+                resp = conn.getresponse()
+                raw = resp.read()
+            except (socket.error, httplib.HTTPException) as e:
+                conn.close()
+                # the engine may have closed the idle connection
+                if reused:
+                    continue
+                raise DockerError(None, 'can not talk to docker at %s: %s' % (self.sock_path, e))
+            break
+        if resp.will_close:
+            conn.close()
+        else:
+            self._conn = conn
+        if resp.status >= 400:
+            try:
+                message = json.loads(raw).get('message')
+            except (ValueError, AttributeError):
+                message = raw.strip()
+            raise DockerError(resp.status, message or resp.reason)
+        return resp.status, raw
+
+    def json(self, method, path, params=None, body=None):
+        _, raw = self.request(method, path, params, body)
+        return json.loads(raw) if raw else None
+
+    def ping(self):
+        return self.request('GET', '/_ping')[1] == 'OK'
+
+    def inspect(self, name):
+        """the container's inspect document, None when it does not exist"""
+        try:
+            return self.json('GET', '/containers/%s/json' % urllib.quote(name))
+        except DockerError as e:
+            if e.status == 404:
+                return
+            raise
+
+    def create(self, name, config):
+        """create a container from a `POST /containers/create` body, pulling the image when missing"""
+        try:
+            return self.json('POST', '/containers/create', {'name': name}, config)['Id']
+        except DockerError as e:
+            if e.status != 404:
+                raise
+        self.pull(config['Image'])
+        return self.json('POST', '/containers/create', {'name': name}, config)['Id']
+
+    def start(self, name):
+        self.request('POST', '/containers/%s/start' % urllib.quote(name))
+
+    def kill(self, name, signal='SIGKILL'):
+        self.request('POST', '/containers/%s/kill' % urllib.quote(name), {'signal': signal})
+
+    def remove(self, name, force=False):
+        self.request('DELETE', '/containers/%s' % urllib.quote(name), {'force': int(force), 'v': 0})
+
+    def pull(self, image):
+        name, _, tag = image.rpartition(':')
+        if not name or '/' in tag:
+            name, tag = image, 'latest'
+        _, raw = self.request('POST', '/images/create', {'fromImage': name, 'tag': tag})
+        # the progress stream only reports failures in its messages
+        for line in raw.splitlines():
+            try:
+                error = json.loads(line).get('error')
+            except ValueError:
+                continue
+            if error:
+                raise DockerError(None, 'pulling %s: %s' % (image, error))
+
+    def exec_run(self, name, cmd):
+        """run cmd in the container, returns (exit code, output)"""
+        exec_id = self.json('POST', '/containers/%s/exec' % urllib.quote(name),
+                            body={'Cmd': cmd, 'AttachStdout': True, 'AttachStderr': True, 'Tty': True})['Id']
+        # with a tty the output is not multiplexed into stdout/stderr frames
+        _, output = self.request('POST', '/exec/%s/start' % exec_id, body={'Detach': False, 'Tty': True})
+        return self.json('GET', '/exec/%s/json' % exec_id)['ExitCode'], output
@@ -2,16 +2,16 @@ from __future__ import print_function
 
 import logging
 import os
+import time
 from collections import OrderedDict
 
 import click
-import tabulate
 
 from configuration import Config
 from consts import CONF_PATH, CONF_HOSTS_PATH, CONF_FILE_PATH, NGINX_CONF_FILE_PATH, MAC_ALIAS_IP, NGINX_DOCKER_IMAGE, \
-    PROXY_CONTAINER_NAME, COMMON_EXTENSIONS, DEBUG
-from errors import handle_error
-from utils import warp_join, require_root
+    PROXY_CONTAINER_NAME, COMMON_EXTENSIONS, DEBUG, DOCKER_SOCK
+from errors import handle_error, ConfigError, ProxyError
+from utils import warp_join, require_root, cached_property
 
 log = logging.getLogger('lhc')
 hdlr = logging.StreamHandler()
@@ -43,7 +43,26 @@ def main():
     """
 
 
-config = Config.load()
+class LazyConfig(object):
+    """
+    loads the config on first use, so commands that do not need it (and --help) do not parse every host file
+    """
+
+    @cached_property
+    def loaded(self):
+        return Config.load()
+
+    def __getattr__(self, item):
+        return getattr(self.loaded, item)
+
+
+config = LazyConfig()
+
+
+def table(data, headers):
+    import tabulate
+
+    return tabulate.tabulate(data, headers)
 
 
 @main.command()
@@ -53,15 +72,18 @@ def info(verbose):
     """
     show the running status of LHC
     """
-    config = Config.load()
     running = config.proxy.running()
     print('Proxy:')
     print('    Mode: %s' % config.mode)
     print('    Status: %s' % ('Running' if running else 'Stopped'))
-    print('    CA Cert: %s' % config.proxy.ca_status())
+    health = config.proxy.health()
+    if health:
+        print('    Health: %s' % health)
+    print('    CA Cert: %s' % config.proxy.ca_status(verify=verbose))
     print('    HTTP Port: %s' % config.http_port)
     print('    HTTPS Port: %s' % config.https_port)
     print('    SSL: %s' % config.ssl)
+    print('    Layout: %s' % config.layout)
 
     print()
     print('Hosts:')
@@ -78,6 +100,18 @@ def info(verbose):
         print('    CacheExpire: %s' % config.cache_expire)
         print('    CacheKey: %s' % config.cache_key)
         print('    DnsResolver: %s' % config.dns_resolver)
+        print('    SliceSize: %s' % (config.slice_size or 'disabled'))
+        print('    MetricsPort: %s' % (config.metrics_port or 'disabled'))
+        print('    DnsPort: %s' % (config.dns_port or 'disabled'))
+        print('    DnsWildcard: %s' % config.dns_wildcard)
+        print('    Peers: %s' % (config.peers_display or 'none'))
+        print('    HotTier: %s' % ('%s, %s, objects up to %s' % (
+            config.hot_cache_path, config.hot_cache_size_limit, config.hot_max_object_size)
+                                   if config.hot_cache_path else 'disabled'))
+        print()
+        print('Tuning (%s):' % config.tuning)
+        for k, v in config.tuning_profile.items():
+            print('    %s: %s' % (k, v))
         print()
         print('Consts:')
         print('    CONF_PATH: %s' % CONF_PATH)
@@ -87,6 +121,7 @@ def info(verbose):
         print('    MAC_ALIAS_IP: %s' % MAC_ALIAS_IP)
         print('    NGINX_DOCKER_IMAGE: %s' % NGINX_DOCKER_IMAGE)
         print('    PROXY_DOCKER_NAME: %s' % PROXY_CONTAINER_NAME)
+        print('    DOCKER_SOCK: %s' % DOCKER_SOCK)
         print()
         print('Built-in extensions:')
         for k, es in COMMON_EXTENSIONS.items():
@@ -102,6 +137,7 @@ def run():
     """
     require_root()
     config.proxy.run()
+    config.proxy.start_sidecars()
 
 
 @main.command()
@@ -111,6 +147,7 @@ def stop():
     stop LHC proxy
     """
     require_root()
+    config.proxy.stop_sidecars()
     config.proxy.stop()
 
 
@@ -121,8 +158,9 @@ def reload():
     reload configurations
     """
     require_root()
-    config.proxy.stop()
-    config.proxy.run()
+    config.proxy.reload()
+    config.proxy.stop_sidecars()
+    config.proxy.start_sidecars()
 
 
 @main.command()
@@ -132,16 +170,16 @@ def ls():
     list hosts
     """
     headers = ('NAME', 'EXTENSIONS', 'LIMIT', 'EXPIRE',
-               'KEY', 'PROXY IP', 'DNS RESOLVER', 'CONF PATH')
+               'KEY', 'SLICE', 'MIRROR', 'PROXY IP', 'DNS RESOLVER', 'CONF PATH')
     fields = ('name', 'extensions_display', 'cache_size_limit', 'cache_expire',
-              'cache_key', 'proxy_ip', 'dns_resolver', 'path')
+              'cache_key', 'slice_size', 'mirror_display', 'proxy_ip', 'dns_resolver', 'path')
     data = []
     for h in config.hosts.values():
         record = []
         for f in fields:
             record.append(getattr(h, f))
         data.append(record)
-    print(tabulate.tabulate(data, headers))
+    print(table(data, headers))
 
 
 @main.command()
@@ -151,14 +189,21 @@ def ls():
 @click.option('-k', '--cache-key', help='key of the the cache file')
 @click.option('-p', '--proxy-ip', help='proxy ip of the host, you can set it if you want to use a external address')
 @click.option('-n', '--dns-resolver', help='the dns resolver to resolve the host')
+@click.option('-S', '--slice-size', help='cache files in slices of this size (e.g. 1m) to serve range requests')
+@click.option('-g', '--mirror-group', help='share one cache zone and host independent keys with this group')
+@click.option('-P', '--mirror-prefix', help='path under which the host serves the tree of its group, e.g. /centos')
 @click.argument('hostname')
 @handle_error
-def set(hostname, extensions, cache_size_limit, cache_expire, cache_key, proxy_ip, dns_resolver):
+def set(hostname, extensions, cache_size_limit, cache_expire, cache_key, proxy_ip, dns_resolver, slice_size,
+        mirror_group, mirror_prefix):
     """
     add a host
     """
     h = config.set_host(hostname=hostname, extensions=extensions, cache_size_limit=cache_size_limit,
-                        cache_expire=cache_expire, cache_key=cache_key, proxy_ip=proxy_ip, dns_resolver=dns_resolver)
+                        cache_expire=cache_expire, cache_key=cache_key, proxy_ip=proxy_ip, dns_resolver=dns_resolver,
+                        slice_size=slice_size, mirror_group=mirror_group, mirror_prefix=mirror_prefix)
+    if h.mirror_group and cache_key:
+        log.warn('the cache_key of %s is not used, hosts of a mirror group use %s' % (hostname, h.cache_key))
     log.info('OK, host config wrote to ' + h._path)
     log.info('To take effect, you need to reload proxy and activate hosts')
 
@@ -194,40 +239,459 @@ def deactivate():
     config.deactivate_hosts()
 
 
+def format_size(size, human):
+    if not human or not size:
+        return str(size)
+    import bitmath
+    bitmath.format_string = "{value:.1f} {unit}"
+    return str(bitmath.Byte(size).best_prefix(bitmath.NIST))
+
+
+def format_time(t):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))
+
+
+def get_hosts(hostnames):
+    if not hostnames:
+        return config.hosts.values()
+    for name in hostnames:
+        if name not in config.hosts:
+            raise ConfigError("hostname '%s' not found" % name)
+    return [config.hosts[name] for name in hostnames]
+
+
 @main.command()
 @click.option('-h', is_flag=True, default=False, help='human friendly size unit')
+@click.option('-j', '--jobs', type=int, help='number of directories scanned in parallel')
+@click.option('--full', is_flag=True, default=False, help='re-scan every directory instead of only changed ones')
 @handle_error
-def df(h):
+def df(h, jobs, full):
     """
     show cache file disk usage
     """
-    from utils import get_dir_size
-    import bitmath
-    bitmath.format_string = "{value:.1f} {unit}"
-    headers = ('HOST', 'CACHE PATH', 'LIMIT', 'DISK USAGE')
+    from disk_usage import DiskUsage, DEFAULT_WORKERS
+    from utils import parse_size
+    headers = ('HOST', 'CACHE PATH', 'LIMIT', 'FILES', 'DISK USAGE', 'USE%')
     data = []
+    zones = config.shared_zones()
+    zones.update(config.mirror_groups())
     for host in config.hosts.values():
-        if not os.path.exists(host.cache_path):
-            size = 0
+        in_zone = host.shared or host.mirror_group
+        if in_zone and host.cache_name not in zones:
+            continue
+        size, count, rescanned = DiskUsage.for_host(host).scan(workers=jobs or DEFAULT_WORKERS, full=full)
+        log.debug('%s: %s directories re-scanned' % (host.cache_name, rescanned))
+        if in_zone:
+            # a shared zone or mirror group is reported once, its limit is the sum of its hosts'
+            members = zones.pop(host.cache_name)
+            limit = config.zone_limits(members)[1]
+            name, limit_display = '%s (%d hosts)' % (host.cache_name, len(members)), format_size(limit, h)
         else:
-            size = get_dir_size(host.cache_path)
-        if h and size:
-            size = bitmath.Byte(size).best_prefix(bitmath.NIST)
-        data.append((host.name, host.cache_path, host.cache_size_limit, str(size)))
-    print(tabulate.tabulate(data, headers))
+            limit = parse_size(host.cache_size_limit)
+            name, limit_display = host.name, host.cache_size_limit
+        used = '%.1f%%' % (100.0 * size / limit)
+        data.append((name, host.cache_path, limit_display, count, format_size(size, h), used))
+    hot_hosts = config.hot_hosts()
+    if hot_hosts:
+        size, count, _ = DiskUsage.for_hot_tier(config).scan(workers=jobs or DEFAULT_WORKERS, full=full)
+        limit = parse_size(config.hot_cache_size_limit)
+        data.append(('hot tier (%d hosts)' % len(hot_hosts), config.hot_cache_path, config.hot_cache_size_limit,
+                     count, format_size(size, h), '%.1f%%' % (100.0 * size / limit)))
+    print(table(data, headers))
 
 
 @main.command()
+@click.option('-u', '--url', 'urls', multiple=True, help='purge only this url (scheme optional)')
+@click.option('-g', '--glob', help='purge only entries whose cache key matches this glob')
+@click.option('-r', '--regex', help='purge only entries whose cache key matches this regex')
+@click.option('-x', '--uncacheable', is_flag=True, default=False,
+              help="purge only entries whose url does not have one of the host's extensions (anymore)")
+@click.option('--scan', is_flag=True, default=False,
+              help='match --glob/--regex by reading the cache file headers instead of the cache index')
+@click.option('-h', is_flag=True, default=False, help='human friendly size unit')
 @click.argument('hostname')
 @handle_error
-def purge(hostname):
+def purge(hostname, urls, glob, regex, uncacheable, scan, h):
     """
     purge cache of a host
     """
-    config.purge(hostname)
+    removed = config.purge(hostname, urls=urls, glob=glob, regex=regex, uncacheable=uncacheable,
+                           use_index=not scan)
+    if removed is not None:
+        for key, size in removed:
+            log.debug('purged %s (%s)' % (key, size))
+        log.info('%s entries purged, %s freed' % (len(removed), format_size(sum(s for _, s in removed), h)))
     log.info('OK')
 
 
+@main.command()
+@click.option('-n', '--top', type=int, default=10, help='show the top N missed urls of each host')
+@click.option('-x', '--uncached', is_flag=True, default=False,
+              help='also show the extensions not cached by each host with the most origin traffic')
+@click.option('-h', is_flag=True, default=False, help='human friendly size unit')
+@click.argument('hostnames', nargs=-1)
+@handle_error
+def stats(hostnames, top, uncached, h):
+    """
+    show cache hit ratio and traffic from access logs
+    """
+    from access_log import HostStats, log_files
+    headers = ('HOST', 'REQUESTS', 'HOT', 'HIT', 'MISS', 'EXPIRED', 'FROM CACHE', 'FROM ORIGIN')
+    data = []
+    missed = []
+    extensions = []
+    for host in get_hosts(hostnames):
+        st = HostStats(host.name, top, host.matcher if uncached else None).feed(log_files(host.access_log_path))
+        if st.unparsed:
+            log.warn('%s: %s lines not in log_format main' % (host.name, st.unparsed))
+        ratios = tuple('%.1f%%' % st.ratio(s) for s in ('HOT', 'HIT', 'MISS', 'EXPIRED'))
+        sizes = (format_size(st.bytes_cache, h), format_size(st.bytes_origin, h))
+        data.append((host.name, st.requests) + ratios + sizes)
+        if top and st.missed.counts:
+            missed.append((host.name, st.missed.top(top)))
+        if top and st.uncached.counts:
+            extensions.append((host.name, st.uncached.top(top)))
+    print(table(data, headers))
+    for name, urls in missed:
+        print()
+        print('Top missed of %s:' % name)
+        print(table([(n, uri) for uri, n in urls], ('COUNT', 'URI')))
+    for name, exts in extensions:
+        print()
+        print('Top uncached extensions of %s:' % name)
+        print(table([(format_size(n, h), ext) for ext, n in exts], ('FROM ORIGIN', 'EXTENSION')))
+
+
+@main.command()
+@click.option('-f', '--file', 'files', multiple=True, type=click.Path(exists=True, dir_okay=False),
+              help='replay this log file instead of the logs of the host, needs one HOSTNAME, repeatable')
+@click.option('-s', '--sizes', help="cache sizes to simulate separated by ',' (default 1/8 to 8 times the limit)")
+@click.option('-t', '--inactive', help="inactive windows to simulate separated by ',', off for none "
+                                       "(default 1h,1d,3d,7d,30d)")
+@click.option('-p', '--policies', default='lru', help="lru, lfu and gdsf separated by ','")
+@click.option('--sample', type=float, default=1.0, help='replay this share of the urls, e.g. 0.01 for huge logs')
+@click.option('--target', type=float, default=0.95,
+              help='share of the best byte hit ratio the recommended limits should reach')
+@click.option('-o', '--output', help='write the curves as json to this file')
+@click.argument('hostnames', nargs=-1)
+@handle_error
+def simulate(hostnames, files, sizes, inactive, policies, sample, target, output):
+    """
+    replay access logs against simulated caches of several sizes
+    """
+    from access_log import log_files
+    from bench import save_results
+    from simulate import simulate_host, SimulateError
+    hosts = get_hosts(hostnames)
+    if files and len(hosts) != 1:
+        raise SimulateError('--file needs exactly one HOSTNAME')
+    results = []
+    for host in hosts:
+        paths = list(files) or log_files(host.access_log_path)
+        r = simulate_host(host, paths, sizes, inactive, policies.split(','), sample, target)
+        results.append(r)
+        if r['unparsed']:
+            log.warn('%s: %s lines not in log_format main' % (host.name, r['unparsed']))
+        print('%s: %s requests, %s sent, over %.1f days%s' % (
+            host.name, r['requests'], format_size(r['bytes'], True), r['seconds'] / 86400.0,
+            ', %g%% of the urls replayed' % (r['sample'] * 100) if r['sample'] < 1 else ''))
+        data = [(c['policy'], c['inactive']) +
+                tuple('%.1f / %.1f' % (ratio * 100, byte_ratio * 100)
+                      for ratio, byte_ratio in zip(c['hit_ratio'], c['byte_hit_ratio']))
+                for c in r['curves']]
+        print(table(data, ('POLICY', 'INACTIVE') + tuple(r['sizes'])))
+        current, best = r['current'], r['recommended']
+        print('hit / byte hit ratio in %%, now %s %s: %s' % (
+            current['cache_size_limit'], current['cache_expire'],
+            '%.1f / %.1f' % (current['hit_ratio'] * 100, current['byte_hit_ratio'] * 100)
+            if current['hit_ratio'] is not None else 'not simulated'))
+        print('recommended: lhc set -s %s -t %s %s (%.1f / %.1f)' % (
+            best['cache_size_limit'], best['cache_expire'], host.name, best['hit_ratio'] * 100,
+            best['byte_hit_ratio'] * 100))
+        print()
+    if output:
+        save_results({'hosts': results}, output)
+
+
+@main.command()
+@click.option('-f', '--file', 'url_file', type=click.File('rb'), help='read urls from file, - for stdin')
+@click.option('-c', '--concurrency', type=int, default=8, help='number of concurrent connections')
+@click.option('-r', '--rate', type=float, help='max requests per second to each host')
+@click.option('-p', '--proxy-ip', help='address of the proxy, defaults to the proxy ip of each host')
+@click.option('-h', is_flag=True, default=False, help='human friendly size unit')
+@click.argument('urls', nargs=-1)
+@handle_error
+def warm(urls, url_file, concurrency, rate, proxy_ip, h):
+    """
+    pre-populate the cache with urls
+    """
+    import sys
+    from warm import Warmer
+    if not config.proxy.running():
+        raise ProxyError('proxy not running')
+    if not urls and not url_file:
+        url_file = sys.stdin
+    warmer = Warmer(config, concurrency=concurrency, rate=rate, proxy_ip=proxy_ip)
+    elapsed = warmer.run(urls or url_file)
+    counts = warmer.counts
+    total = sum(counts.values())
+    print('%s urls in %.1fs: %s already cached, %s fetched, %s skipped, %s failed' % (
+        total, elapsed, counts['hit'], counts['miss'], counts['skip'], counts['error']))
+    print('%s fetched, %s/s, %.1f urls/s' % (format_size(warmer.bytes, h),
+                                             format_size(int(warmer.bytes / elapsed) if elapsed else 0, h),
+                                             total / elapsed if elapsed else 0))
+
+
+@main.command()
+@click.option('-h', is_flag=True, default=False, help='human friendly size unit')
+@click.option('-j', '--jobs', type=int, help='number of files hashed in parallel')
+@click.option('--no-update', is_flag=True, default=False, help='do not re-scan changed cache directories')
+@click.argument('hostnames', nargs=-1)
+@handle_error
+def dedup(hostnames, h, jobs, no_update):
+    """
+    report files cached by more than one host
+    """
+    from dedup import DuplicateFinder
+    from disk_usage import DEFAULT_WORKERS
+
+    # say it before the scan: nothing is reclaimed by this command
+    print('cache files of different hosts cannot share disk space, nginx keeps the key and response headers '
+          'in the same file as the body; this only reports the duplicates')
+    start = time.time()
+    finder = DuplicateFinder(workers=jobs or DEFAULT_WORKERS)
+    try:
+        stats = finder.run(get_hosts(hostnames), update=not no_update)
+    finally:
+        finder.close()
+    print('%s files, %s hashed (%s read) in %.1fs' % (stats['files'], stats['hashed'],
+                                                      format_size(stats['hashed_bytes'], h), time.time() - start))
+    print('%s bodies (%s) are stored more than once' % (stats['dup_files'], format_size(stats['dup_bytes'], h)))
+    if not finder.shared_by:
+        return
+    data = [(','.join(hostnames), files, format_size(size, h))
+            for hostnames, (files, size) in sorted(finder.shared_by.items(), key=lambda i: -i[1][1])]
+    print(table(data, ('HOSTS', 'FILES', 'DUPLICATE')))
+    print('hosts serving the same tree store it once in a mirror group: lhc set HOSTNAME -g GROUP -P PREFIX')
+
+
+@main.command()
+@click.option('-n', '--files', type=int, default=100, help='number of files of the cold and warm runs')
+@click.option('-s', '--sizes', default='16k:60,256k:30,4m:9,32m:1',
+              help="file size distribution, SIZE:WEIGHT items separated by ','")
+@click.option('-c', '--concurrency', type=int, default=16, help='number of clients')
+@click.option('-r', '--requests', type=int, help='requests of the mixed run, 4 per file by default')
+@click.option('-m', '--miss-ratio', type=float, default=0.1, help='share of the mixed run asking for new files')
+@click.option('-d', '--origin-delay', type=int, default=0, help='milliseconds the origin waits before answering')
+@click.option('-S', '--slice-size', help='cache the files in slices of this size')
+@click.option('--proxy-ip', default='127.0.0.2', help='loopback address of the engine, the origin is on 127.0.0.1')
+@click.option('--seed', type=int, default=42, help='seed of the corpus and of the request order')
+@click.option('--keep', help='keep the cache and access log in this directory')
+@click.option('-o', '--output', help='write the results as json to this file')
+@handle_error
+def bench(files, sizes, concurrency, requests, miss_ratio, origin_delay, slice_size, proxy_ip, seed, keep, output):
+    """
+    measure the native engine against a local origin
+    """
+    from bench import run_bench, save_results
+
+    results = run_bench(files=files, sizes=sizes, concurrency=concurrency, requests=requests, miss_ratio=miss_ratio,
+                        origin_delay=origin_delay, slice_size=slice_size, proxy_ip=proxy_ip, seed=seed, keep=keep)
+    headers = ('RUN', 'REQUESTS', 'ERRORS', 'REQ/S', 'MIB/S', 'P50 MS', 'P99 MS', 'P999 MS', 'CACHE STATUS')
+    data = [(name, r['requests'], r['errors'], r['requests_per_second'], r['mib_per_second'],
+             r['latency_ms']['p50'], r['latency_ms']['p99'], r['latency_ms']['p999'],
+             ' '.join('%s=%s' % item for item in r['cache_status'].items()))
+            for name, r in results['runs'].items()]
+    print(table(data, headers))
+    if output:
+        save_results(results, output)
+        log.info('results written to ' + output)
+
+
+@main.group(cls=OrderedGroup)
+def cache():
+    """
+    inspect cached objects
+    """
+
+
+def open_indexes(hosts, update):
+    from cache_index import CacheIndex
+    for host in hosts:
+        index = CacheIndex.for_host(host)
+        if update:
+            added, updated, removed = index.update()
+            log.debug('%s index: %s added, %s updated, %s removed' % (host.name, added, updated, removed))
+        yield host, index
+
+
+def print_entries(rows, human):
+    headers = ('KEY', 'SIZE', 'LAST ACCESS', 'EXPIRE', 'STATUS')
+    data = [(key, format_size(size, human), format_time(atime), format_time(expire), status)
+            for key, size, atime, expire, status, _, _ in rows]
+    print(table(data, headers))
+
+
+@cache.command('ls')
+@click.option('-h', is_flag=True, default=False, help='human friendly size unit')
+@click.option('-s', '--sort', type=click.Choice(['key', 'size', 'atime', 'expire']), default='key', help='sort by')
+@click.option('-n', '--limit', type=int, help='show at most N entries')
+@click.option('--no-update', is_flag=True, default=False, help='do not re-scan changed cache directories')
+@click.argument('hostname')
+@handle_error
+def cache_ls(hostname, h, sort, limit, no_update):
+    """
+    list cached objects of a host
+    """
+    for host, index in open_indexes(get_hosts([hostname]), not no_update):
+        print_entries(index.query(sort=sort, limit=limit), h)
+
+
+@cache.command('find')
+@click.option('-h', is_flag=True, default=False, help='human friendly size unit')
+@click.option('-r', '--regex', is_flag=True, default=False, help='PATTERN is a regular expression instead of a glob')
+@click.option('-H', '--host', 'hostnames', multiple=True, help='only search these hosts')
+@click.option('-n', '--limit', type=int, help='show at most N entries per host')
+@click.option('--no-update', is_flag=True, default=False, help='do not re-scan changed cache directories')
+@click.argument('pattern')
+@handle_error
+def cache_find(pattern, h, regex, hostnames, limit, no_update):
+    """
+    find cached objects whose key matches PATTERN
+    """
+    rows = []
+    for host, index in open_indexes(get_hosts(hostnames), not no_update):
+        rows.extend(index.find(pattern, regex=regex, limit=limit))
+    print_entries(rows, h)
+
+
+@cache.command('top')
+@click.option('-h', is_flag=True, default=False, help='human friendly size unit')
+@click.option('-s', '--sort', type=click.Choice(['size', 'atime']), default='size', help='rank by')
+@click.option('-H', '--host', 'hostnames', multiple=True, help='only rank these hosts')
+@click.option('-n', '--limit', type=int, default=20, help='show top N entries')
+@click.option('--no-update', is_flag=True, default=False, help='do not re-scan changed cache directories')
+@handle_error
+def cache_top(h, sort, hostnames, limit, no_update):
+    """
+    show the biggest or most recently used cached objects
+    """
+    rows = []
+    for host, index in open_indexes(get_hosts(hostnames), not no_update):
+        rows.extend(index.query(sort=sort, limit=limit))
+    rows.sort(key=lambda r: r[1 if sort == 'size' else 2], reverse=True)
+    print_entries(rows[:limit], h)
+
+
+@cache.command('export')
+@click.option('-h', is_flag=True, default=False, help='human friendly size unit')
+@click.option('-o', '--output', required=True, help='bundle to write, - for stdout')
+@click.option('-z', '--compress', type=click.Choice(['auto', 'zstd', 'pigz', 'gzip', 'none']), default='auto',
+              help='auto: zstd or pigz when installed, gzip otherwise')
+@click.option('--max-age', help='only objects accessed within this time, e.g. 7d')
+@click.option('--min-size', help='only objects of at least this size, e.g. 1m')
+@click.option('--max-size', help='only objects of at most this size, e.g. 4g')
+@click.option('-x', '--extensions', help="only objects with these extensions (separated by ',')")
+@click.option('-j', '--jobs', type=int, help='number of files read and hashed in parallel')
+@click.option('--no-update', is_flag=True, default=False, help='do not re-scan changed cache directories')
+@click.argument('hostnames', nargs=-1)
+@handle_error
+def cache_export(hostnames, h, output, compress, max_age, min_size, max_size, extensions, jobs, no_update):
+    """
+    write cached objects of hosts to a bundle, to seed another cache
+    """
+    from bundle import export_bundle
+    from disk_usage import DEFAULT_WORKERS
+    from utils import parse_size, parse_duration
+
+    try:
+        filters = dict(max_age=max_age and parse_duration(max_age), min_size=min_size and parse_size(min_size),
+                       max_size=max_size and parse_size(max_size))
+    except ValueError as e:
+        raise ConfigError(str(e))
+    start = time.time()
+    count, size = export_bundle(get_hosts(hostnames), output, compress=compress, jobs=jobs or DEFAULT_WORKERS,
+                                extensions=extensions, update=not no_update, **filters)
+    elapsed = time.time() - start
+    log.info('%s objects, %s exported to %s in %.1fs, %s/s' % (
+        count, format_size(size, h), output, elapsed, format_size(int(size / elapsed) if elapsed else 0, h)))
+
+
+@cache.command('import')
+@click.option('-h', is_flag=True, default=False, help='human friendly size unit')
+@click.option('-H', '--host', 'hostnames', multiple=True, help='only import objects of these hosts')
+@click.option('-c', '--check', is_flag=True, default=False, help='only verify the bundle, nothing is written')
+@click.argument('bundle')
+@handle_error
+def cache_import(bundle, h, hostnames, check):
+    """
+    verify a bundle and put its objects in the cache, - reads stdin
+    """
+    from bundle import BundleImporter
+
+    get_hosts(hostnames)
+    start = time.time()
+    stats = BundleImporter(config, hostnames, check=check).run(bundle)
+    elapsed = time.time() - start
+    log.info('%s objects %s, %s already cached, %s skipped, %s invalid; %s in %.1fs, %s/s' % (
+        stats['imported'], 'verified' if check else 'imported', stats['present'], stats['skipped'],
+        stats['invalid'], format_size(stats['bytes'], h), elapsed,
+        format_size(int(stats['bytes'] / elapsed) if elapsed else 0, h)))
+    if stats['imported'] and not check and config.mode != 'native':
+        # the cache loader of nginx only scans the cache directories when it starts
+        log.info('restart the proxy (lhc stop; lhc run) so nginx serves the imported objects')
+
+
+@main.group(cls=OrderedGroup)
+def peer():
+    """
+    manage the other lhc nodes asked before the origin
+    """
+
+
+@peer.command('add')
+@click.argument('address')
+@handle_error
+def peer_add(address):
+    """
+    add a peer, ADDRESS is address[:http_port[:https_port]]
+    """
+    from peers import format_peer
+    print(format_peer(config.add_peer(address)))
+    log.info('To take effect, you need to reload proxy')
+
+
+@peer.command('ls')
+@click.option('-c', '--check', is_flag=True, default=False, help='check that the peers accept connections')
+@handle_error
+def peer_ls(check):
+    """
+    list peers
+    """
+    from peers import check as check_peer
+    headers = ('ADDRESS', 'HTTP PORT', 'HTTPS PORT') + (('STATUS',) if check else ())
+    data = []
+    for p in config.peers:
+        record = list(p)
+        if check:
+            error = check_peer(p)
+            record.append('down (%s)' % error if error else 'up')
+        data.append(record)
+    print(table(data, headers))
+
+
+@peer.command('del')
+@click.argument('address')
+@handle_error
+def peer_del(address):
+    """
+    delete a peer
+    """
+    from peers import format_peer
+    print(format_peer(config.delete_peer(address)))
+    log.info('To take effect, you need to reload proxy')
+
+
 @main.command('gen-ca')
 @handle_error
 def gen_ca():
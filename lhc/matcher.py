@@ -0,0 +1,91 @@
+# the extensions setting of a host compiled once into an anchored regex, for nginx and the python tools
+import re
+
+from consts import COMMON_EXTENSIONS
+
+# extensions matched as plain strings, anything else is kept as a regex
+LITERAL_REG = re.compile(r'^[\w.+-]+$')
+
+_matchers = {}
+
+
+def split_extensions(spec):
+    """(sorted literal extensions, sorted regex items) of a setting like `__PKG__,whl` or `iso|deb`"""
+    literal, patterns = set(), set()
+    for item in re.split(r'[,|]', spec or ''):
+        item = item.strip()
+        if not item:
+            continue
+        for ext in COMMON_EXTENSIONS.get(item, [item]):
+            (literal if LITERAL_REG.match(ext) else patterns).add(ext)
+    return sorted(literal), sorted(patterns)
+
+
+def trie_regex(words):
+    """
+    alternation of words with common prefixes factored out, e.g. doc docx deb -> d(?:eb|ocx?),
+    branches are sorted so the same words always give the same regex
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+    return _node_regex(trie)
+
+
+def _node_regex(node):
+    optional = '' in node
+    branches = [(re.escape(ch), _node_regex(node[ch])) for ch in sorted(node) if ch]
+    if not branches:
+        return ''
+    if all(not rest for _, rest in branches) and len(branches) > 1:
+        regex = '[%s]' % ''.join(ch for ch, _ in branches)
+    elif len(branches) == 1:
+        ch, rest = branches[0]
+        regex = ch + rest
+        if optional and rest:
+            regex = '(?:%s)' % regex
+    else:
+        regex = '(?:%s)' % '|'.join(ch + rest for ch, rest in branches)
+    return regex + '?' if optional else regex
+
+
+def extensions_regex(spec):
+    """regex of uris that end with one of the extensions, what nginx matches $uri against"""
+    literal, patterns = split_extensions(spec)
+    alternatives = ([trie_regex(literal)] if literal else []) + patterns
+    if len(alternatives) == 1:
+        # a trie has no top level alternation, its branches are grouped already
+        return r'\.%s$' % alternatives[0]
+    return r'\.(?:%s)$' % '|'.join(alternatives)
+
+
+def file_extension(path):
+    """the part of the last path segment after its last dot, '' when there is none"""
+    name = path[path.rfind('/') + 1:]
+    dot = name.rfind('.')
+    return name[dot + 1:] if dot >= 0 else ''
+
+
+class ExtensionMatcher(object):
+    """the regex nginx gets, compiled for the python tools so both sides agree on what is cacheable"""
+
+    def __init__(self, spec):
+        literal, patterns = split_extensions(spec)
+        self.extensions = literal + patterns
+        self.regex = extensions_regex(spec)
+        self._search = re.compile(self.regex).search
+
+    def match(self, path):
+        """path is an uri without the query string"""
+        return self._search(path) is not None
+
+
+def get_matcher(spec):
+    """the compiled matcher of an extensions setting, shared by every host with the same one"""
+    matcher = _matchers.get(spec)
+    if matcher is None:
+        matcher = _matchers[spec] = ExtensionMatcher(spec)
+    return matcher
@@ -0,0 +1,247 @@
+# prometheus exporter fed by tailing the per-host access logs
+import BaseHTTPServer
+import SocketServer
+import logging
+import os
+import sys
+import threading
+
+from access_log import parse
+from disk_usage import DiskUsage
+
+log = logging.getLogger('lhc')
+
+TAIL_INTERVAL = 1
+CACHE_SIZE_INTERVAL = 60
+READ_SIZE = 4 * 1024 * 1024
+
+UPSTREAM_TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class LogTailer(object):
+    """reads what was appended to a log file since the last call, follows rotation and truncation"""
+
+    def __init__(self, path, from_end=True):
+        self.path = path
+        self.inode = None
+        self.offset = 0
+        self.pending = ''
+        self.from_end = from_end
+
+    def read(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            # a file created later is read from its start
+            self.from_end = False
+            return []
+        if st.st_ino != self.inode:
+            # first open or rotated: only history that existed at start is skipped
+            self.offset = st.st_size if self.from_end else 0
+            self.from_end = False
+            self.inode = st.st_ino
+            self.pending = ''
+        elif st.st_size < self.offset:
+            self.offset = 0
+            self.pending = ''
+        if st.st_size == self.offset:
+            return []
+        lines = []
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            while True:
+                data = f.read(READ_SIZE)
+                if not data:
+                    break
+                self.offset += len(data)
+                data = self.pending + data
+                end = data.rfind('\n')
+                self.pending = data[end + 1:]
+                if end >= 0:
+                    lines.extend(data[:end].split('\n'))
+        return lines
+
+
+class Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v):
+        for i, le in enumerate(self.buckets):
+            if v <= le:
+                self.counts[i] += 1
+        self.sum += v
+        self.count += 1
+
+
+class HostMetrics(object):
+    def __init__(self, host):
+        self.host = host
+        self.tailer = LogTailer(host.access_log_path)
+        self.requests = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.upstream_time = Histogram(UPSTREAM_TIME_BUCKETS)
+
+    def update(self):
+        for line in self.tailer.read():
+            record = parse(line)
+            if not record:
+                continue
+            k = (record.cache_status or 'NONE', '%dxx' % (record.status // 100))
+            self.requests[k] = self.requests.get(k, 0) + 1
+            self.bytes_in += record.request_length
+            self.bytes_out += record.bytes_sent
+            if record.upstream_response_time is not None:
+                self.upstream_time.observe(record.upstream_response_time)
+
+
+class ZoneMetrics(object):
+    """a cache directory: a host's own, or a shared zone or mirror group measured once for all its hosts"""
+
+    def __init__(self, name, hosts, limit):
+        self.name = name
+        self.hosts = hosts
+        self.limit = limit
+        self.usage = DiskUsage.for_host(hosts[0])
+        self.cache_size = 0
+        self.cache_files = 0
+
+
+def cache_zones(config):
+    """[ZoneMetrics] of the cache directories of config, each once"""
+    zones = config.shared_zones()
+    zones.update(config.mirror_groups())
+    for name in sorted(config.hosts):
+        host = config.hosts[name]
+        if not (host.shared or host.mirror_group):
+            zones[host.cache_name] = [host]
+    return [ZoneMetrics(name, members, config.zone_limits(members)[1]) for name, members in sorted(zones.items())]
+
+
+def _labels(**kwargs):
+    return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                             for k, v in sorted(kwargs.items()))
+
+
+class Exporter(object):
+    def __init__(self, config):
+        self.config = config
+        self.hosts = [HostMetrics(host) for host in config.hosts.values()]
+        self.zones = cache_zones(config)
+        self.lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def tail(self):
+        while not self._stopped.wait(TAIL_INTERVAL):
+            with self.lock:
+                for m in self.hosts:
+                    m.update()
+
+    def measure_cache_size(self):
+        while True:
+            for z in self.zones:
+                try:
+                    size, files, _ = z.usage.scan()
+                except OSError as e:
+                    log.error('cache size of %s: %s' % (z.name, e))
+                    continue
+                with self.lock:
+                    z.cache_size, z.cache_files = size, files
+            if self._stopped.wait(CACHE_SIZE_INTERVAL):
+                return
+
+    def render(self):
+        out = []
+
+        def metric(name, kind, doc):
+            out.append('# HELP %s %s' % (name, doc))
+            out.append('# TYPE %s %s' % (name, kind))
+
+        with self.lock:
+            metric('lhc_requests_total', 'counter', 'Requests by upstream cache status and response status class.')
+            for m in self.hosts:
+                for (cache_status, status), n in sorted(m.requests.items()):
+                    out.append('lhc_requests_total%s %d' % (
+                        _labels(host=m.host.name, cache_status=cache_status, status=status), n))
+            metric('lhc_received_bytes_total', 'counter', 'Bytes received from clients.')
+            for m in self.hosts:
+                out.append('lhc_received_bytes_total%s %d' % (_labels(host=m.host.name), m.bytes_in))
+            metric('lhc_sent_bytes_total', 'counter', 'Bytes sent to clients.')
+            for m in self.hosts:
+                out.append('lhc_sent_bytes_total%s %d' % (_labels(host=m.host.name), m.bytes_out))
+            metric('lhc_upstream_response_seconds', 'histogram', 'Upstream response time.')
+            for m in self.hosts:
+                h = m.upstream_time
+                for le, n in zip(h.buckets, h.counts):
+                    out.append('lhc_upstream_response_seconds_bucket%s %d' % (_labels(host=m.host.name, le=le), n))
+                out.append('lhc_upstream_response_seconds_bucket%s %d' % (_labels(host=m.host.name, le='+Inf'),
+                                                                          h.count))
+                out.append('lhc_upstream_response_seconds_sum%s %.6f' % (_labels(host=m.host.name), h.sum))
+                out.append('lhc_upstream_response_seconds_count%s %d' % (_labels(host=m.host.name), h.count))
+            # a zone of several hosts is one directory, a series per host would count it once for each
+            metric('lhc_cache_size_bytes', 'gauge', 'Disk usage of the cache zone.')
+            for z in self.zones:
+                out.append('lhc_cache_size_bytes%s %d' % (_labels(zone=z.name), z.cache_size))
+            metric('lhc_cache_files', 'gauge', 'Number of cached files in the cache zone.')
+            for z in self.zones:
+                out.append('lhc_cache_files%s %d' % (_labels(zone=z.name), z.cache_files))
+            metric('lhc_cache_size_limit_bytes', 'gauge', 'max_size of the cache zone, the sum of its hosts\' limits.')
+            for z in self.zones:
+                out.append('lhc_cache_size_limit_bytes%s %d' % (_labels(zone=z.name), z.limit))
+            metric('lhc_cache_zone_host', 'gauge', 'The cache zone of each host, always 1.')
+            for z in self.zones:
+                for host in z.hosts:
+                    out.append('lhc_cache_zone_host%s 1' % _labels(zone=z.name, host=host.name))
+        return '\n'.join(out) + '\n'
+
+    def serve_forever(self, port):
+        server = MetricsServer(('', port), MetricsHandler)
+        server.exporter = self
+        for target in (self.tail, self.measure_cache_size):
+            t = threading.Thread(target=target)
+            t.daemon = True
+            t.start()
+        log.info('metrics exporter listening on :%s' % port)
+        try:
+            server.serve_forever()
+        finally:
+            self._stopped.set()
+
+
+class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            return self.send_error(404)
+        body = self.server.exporter.render()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def main():
+    from configuration import Config
+
+    hdlr = logging.StreamHandler()
+    hdlr.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
+    log.addHandler(hdlr)
+    log.setLevel(logging.INFO)
+    config = Config.load()
+    Exporter(config).serve_forever(int(config.metrics_port))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
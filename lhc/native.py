@@ -0,0 +1,808 @@
+# built-in caching proxy engine (mode = native), for machines where docker is not available
+import BaseHTTPServer
+import SocketServer
+import contextlib
+import httplib
+import logging
+import os
+import signal
+import socket
+import ssl
+import sys
+import tempfile
+import threading
+import time
+import urllib
+from email.utils import formatdate
+
+from cachefile import cache_file_path, entry_length, is_cache_file_name, pack_header, read_entry, read_raw_headers, \
+    slice_range, CacheFileError
+from errors import LHCError
+from peers import PEER_HEADER, PEER_CONNECT_TIMEOUT, PEER_TRIES, PEER_FAIL_TIMEOUT, node_id, rank, format_peer
+from resolver import Resolver, DNSError
+from utils import mkdirs, parse_duration, parse_size, sendfile
+
+log = logging.getLogger('lhc')
+
+# same as proxy_connect_timeout / proxy_read_timeout / proxy_cache_valid in the nginx template
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60
+CACHE_VALID = 30 * 60
+
+CHUNK_SIZE = 64 * 1024
+# idle connections kept per origin address, like `keepalive` in an nginx upstream block
+ORIGIN_KEEPALIVE = 32
+ORIGIN_KEEPALIVE_TIMEOUT = 60
+CACHE_MANAGER_INTERVAL = 60
+
+HOP_BY_HOP = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'proxy-connection',
+              'te', 'trailer', 'trailers', 'transfer-encoding', 'upgrade'}
+# set by the proxy itself, nginx-cache comes with the responses of a peer
+REPLACED_HEADERS = {'date', 'server', 'nginx-cache'}
+EXPIRES_STATUS = {200, 201, 204, 206, 301, 302, 303, 304, 307, 308}
+
+
+class OriginHTTPConnection(httplib.HTTPConnection):
+    def __init__(self, ip, port, server_name, timeout=READ_TIMEOUT, connect_timeout=CONNECT_TIMEOUT):
+        httplib.HTTPConnection.__init__(self, ip, port, timeout=timeout)
+        self.server_name = server_name
+        self.connect_timeout = connect_timeout
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), self.connect_timeout)
+        self.sock.settimeout(self.timeout)
+
+
+class OriginHTTPSConnection(OriginHTTPConnection):
+    default_port = httplib.HTTPS_PORT
+    # like nginx's default `proxy_ssl_verify off`
+    context = ssl._create_unverified_context()
+
+    def connect(self):
+        OriginHTTPConnection.connect(self)
+        self.sock = self.context.wrap_socket(self.sock, server_hostname=self.server_name)
+
+
+class OriginPool(object):
+    """idle keep-alive connections to origins, keyed by (scheme, ip, port, server name)"""
+
+    def __init__(self, size=ORIGIN_KEEPALIVE, timeout=ORIGIN_KEEPALIVE_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            conns = self._idle.get(key)
+            while conns:
+                conn, since = conns.pop()
+                if now - since < self.timeout:
+                    return conn
+                conn.close()
+
+    def put(self, key, conn):
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            if len(conns) < self.size:
+                conns.append((conn, time.time()))
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            for conns in self._idle.values():
+                for conn, _ in conns:
+                    conn.close()
+            self._idle.clear()
+
+
+class OriginResponse(Exception):
+    """an origin response that can not be cached as a slice, it is relayed to the client as it is"""
+
+    def __init__(self, conn, resp):
+        Exception.__init__(self, '%d %s' % (resp.status, resp.reason))
+        self.conn = conn
+        self.resp = resp
+
+
+def open_entry(cache_file):
+    """returns (open file, entry, 'HIT') of a valid cache file, (None, entry or None, 'EXPIRED' or 'MISS') otherwise"""
+    try:
+        f = open(cache_file, 'rb')
+    except IOError:
+        return None, None, 'MISS'
+    try:
+        entry = read_entry(f)
+    except CacheFileError as e:
+        log.warn('%s: %s' % (cache_file, e))
+        f.close()
+        return None, None, 'MISS'
+    if entry.valid_sec < time.time():
+        f.close()
+        return None, entry, 'EXPIRED'
+    return f, entry, 'HIT'
+
+
+def parse_range(value, length):
+    """(first, last) of a single `bytes=` range, None to send the whole object, False when not satisfiable"""
+    if not value or not value.startswith('bytes=') or ',' in value:
+        return None
+    first, _, last = value[len('bytes='):].strip().partition('-')
+    try:
+        if not first:
+            n = int(last)
+            return (max(length - n, 0), length - 1) if n and length else False
+        first = int(first)
+        last = min(int(last), length - 1) if last else length - 1
+    except ValueError:
+        return None
+    if first >= length:
+        return False
+    if first > last:
+        return None
+    return first, last
+
+
+class CountingWriter(object):
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def write(self, data):
+        self.f.write(data)
+        self.count += len(data)
+
+    def __getattr__(self, item):
+        return getattr(self.f, item)
+
+
+class CachingHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'lhc'
+    sys_version = ''
+    # the status line and headers are written one by one, like tcp_nodelay on in nginx.conf
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        if isinstance(self.request, ssl.SSLSocket):
+            self.request.settimeout(READ_TIMEOUT)
+            self.request.do_handshake()
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.wfile = CountingWriter(self.wfile)
+
+    def log_request(self, code='-', size='-'):
+        self.status_code = code
+
+    def access_log_line(self):
+        def quote(v):
+            return (v or '-').replace('"', '\\x22')
+
+        request_length = len(self.requestline) + 4 + sum(len(l) + 1 for l in self.headers.headers)
+        request_length += int(self.headers.get('Content-Length') or 0)
+        upstream_time = '%.3f' % self.upstream_response_time if self.upstream_response_time is not None else '-'
+        return '%s - - [%s] "%s" %s %d "%s" "%s" "%s" %s %d %d %.3f "%s"' % (
+            self.headers.get('X-Forwarded-For') or '-', time.strftime('%d/%b/%Y:%H:%M:%S %z'),
+            quote(self.requestline), self.status_code, self.body_bytes_sent, quote(self.headers.get('Referer')),
+            quote(self.headers.get('User-Agent')), self.cache_status or '-', self.client_address[0],
+            request_length, self.wfile.count + self.sendfile_bytes, time.time() - self.start_time, upstream_time)
+
+    def do_GET(self):
+        self.start_time = time.time()
+        self.status_code = 0
+        self.body_bytes_sent = 0
+        self.sendfile_bytes = 0
+        self.wfile.count = 0
+        self.cache_status = None
+        self.upstream_response_time = None
+        host = self.server.engine.config.find_host((self.headers.get('Host') or '').split(':')[0].lower())
+        try:
+            self.proxy_request()
+        finally:
+            if host:
+                self.server.engine.access_log(host, self.access_log_line())
+
+    do_HEAD = do_POST = do_PUT = do_DELETE = do_OPTIONS = do_PATCH = do_GET
+
+    def proxy_request(self):
+        engine = self.server.engine
+        name = (self.headers.get('Host') or '').split(':')[0].lower()
+        host = engine.config.find_host(name)
+        if not host:
+            return self.send_error(404)
+        path, _, args = self.path.partition('?')
+        uri = urllib.unquote(path)
+        if self.command not in ('GET', 'HEAD') or not engine.cacheable(host, uri):
+            return self.forward(host, name)
+        key = host.render_key({
+            'scheme': self.server.scheme,
+            'host': name,
+            'uri': uri,
+            'args': args,
+            'is_args': '?' if args else '',
+            'request_uri': self.path,
+            'server_port': str(self.server.server_port),
+        })
+        if host.slice_bytes:
+            return self.serve_sliced(host, name, key, host.slice_bytes)
+        cache_file = cache_file_path(host.cache_path, key)
+        status = self.serve_cached(host, cache_file)
+        if status == 'HIT':
+            return
+        self.forward(host, name, key=key, cache_file=cache_file, cache_status=status)
+
+    def serve_cached(self, host, cache_file):
+        f, entry, status = open_entry(cache_file)
+        if not f:
+            return status
+        with f:
+            st = os.fstat(f.fileno())
+            size = st.st_size - entry.body_start
+            self.send_response(entry.status, entry.reason)
+            for line in read_raw_headers(f, entry):
+                k, _, v = line.partition(':')
+                if k.lower() in HOP_BY_HOP or k.lower() in ('content-length', 'date', 'server'):
+                    continue
+                if entry.status in EXPIRES_STATUS and k.lower() in ('expires', 'cache-control'):
+                    continue
+                self.send_header(k, v.strip())
+            self.send_header('Content-Length', str(size))
+            self.send_cache_headers(host, entry.status, 'HIT')
+            self.end_headers()
+            # keep access time for the cache manager's LRU, leave mtime for the indexers
+            os.utime(cache_file, (time.time(), st.st_mtime))
+            if self.command == 'HEAD':
+                return 'HIT'
+            self.wfile.flush()
+            sendfile(self.connection, f, entry.body_start, size)
+            self.body_bytes_sent = self.sendfile_bytes = size
+        return 'HIT'
+
+    def serve_sliced(self, host, name, key, slice_size):
+        """like nginx's slice module: objects are fetched from origin and cached in slice_size parts"""
+        try:
+            f, entry, status = self.load_slice(host, name, key, 0, slice_size)
+        except OriginResponse as e:
+            try:
+                self.relay(host, e.resp, None, None, 'MISS')
+            finally:
+                self.release_origin(e.conn, e.resp)
+            return
+        except (socket.error, httplib.HTTPException, DNSError, CacheFileError) as e:
+            log.error('%s %s%s: %s' % (self.command, name, self.path, e))
+            return self.send_error(502)
+        with f:
+            length = entry_length(f, entry)
+            headers = read_raw_headers(f, entry)
+        # an origin without range support answered the first slice with the whole object
+        step = slice_size if entry.status == 206 else max(length, 1)
+        rng = parse_range(self.headers.get('Range'), length)
+        if rng is False:
+            self.send_response(416)
+            self.send_header('Content-Range', 'bytes */%d' % length)
+            self.send_header('Content-Length', '0')
+            self.send_cache_headers(host, 416, status)
+            self.end_headers()
+            return
+        first, last = rng or (0, length - 1)
+        if rng:
+            self.send_response(206, 'Partial Content')
+        else:
+            self.send_response(200, 'OK')
+        for line in headers:
+            k, _, v = line.partition(':')
+            lk = k.lower()
+            if lk in HOP_BY_HOP or lk in ('content-length', 'content-range', 'date', 'server', 'expires',
+                                          'cache-control'):
+                continue
+            self.send_header(k, v.strip())
+        if rng:
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (first, last, length))
+        self.send_header('Content-Length', str(last - first + 1))
+        self.send_cache_headers(host, 206 if rng else 200, status)
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        self.wfile.flush()
+        pos = first
+        while pos <= last:
+            start = pos - pos % step
+            try:
+                f, entry, _ = self.load_slice(host, name, key, start, slice_size)
+            except OriginResponse as e:
+                e.conn.close()
+                log.error('slice %s of %s%s: %s' % (start, name, self.path, e))
+                self.close_connection = 1
+                return
+            except (socket.error, httplib.HTTPException, DNSError, CacheFileError) as e:
+                log.error('slice %s of %s%s: %s' % (start, name, self.path, e))
+                self.close_connection = 1
+                return
+            with f:
+                body = os.fstat(f.fileno()).st_size - entry.body_start
+                count = min(last + 1, start + body) - pos
+                if count <= 0:
+                    log.error('slice %s of %s%s is shorter than expected' % (start, name, self.path))
+                    self.close_connection = 1
+                    return
+                os.utime(f.name, None)
+                try:
+                    sendfile(self.connection, f, entry.body_start + pos - start, count)
+                except socket.error:
+                    self.close_connection = 1
+                    return
+            self.body_bytes_sent += count
+            self.sendfile_bytes += count
+            pos += count
+
+    def load_slice(self, host, name, key, start, slice_size):
+        """opens the cached slice at start, fetching it from origin first, returns (file, entry, cache status)"""
+        skey = key + slice_range(start, slice_size)
+        cache_file = cache_file_path(host.cache_path, skey)
+        f, entry, status = open_entry(cache_file)
+        if f:
+            return f, entry, status
+        # like proxy_cache_lock, concurrent requests for a missing slice wait for a single fetch
+        with self.server.engine.cache_lock(skey):
+            f, entry, _ = open_entry(cache_file)
+            if f:
+                return f, entry, 'HIT'
+            self.fetch_slice(host, name, skey, start, slice_size, cache_file)
+        f, entry, _ = open_entry(cache_file)
+        if not f:
+            raise CacheFileError('slice %s was not cached' % skey)
+        return f, entry, status
+
+    def fetch_slice(self, host, name, skey, start, slice_size, cache_file):
+        begin = time.time()
+        conn, resp = self.open_origin(host, name, True, method='GET',
+                                      headers={'Range': slice_range(start, slice_size)})
+        relayed = False
+        try:
+            if resp.status != 206 and not (resp.status == 200 and start == 0):
+                relayed = True
+                raise OriginResponse(conn, resp)
+            raw_headers = ['HTTP/1.1 %d %s' % (resp.status, resp.reason)]
+            for line in resp.msg.headers:
+                k, _, v = line.partition(':')
+                if k.lower() in HOP_BY_HOP or k.lower() in REPLACED_HEADERS:
+                    continue
+                raw_headers.append('%s: %s' % (k, v.strip()))
+            length = resp.getheader('Content-Length')
+            out, tmp = self.server.engine.open_cache_tmp(cache_file)
+            received = 0
+            complete = False
+            try:
+                now = int(time.time())
+                out.write(pack_header(skey, '\r\n'.join(raw_headers) + '\r\n\r\n', now + CACHE_VALID, now))
+                while True:
+                    chunk = resp.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    received += len(chunk)
+                complete = length is None or received == int(length)
+            finally:
+                out.close()
+                if not complete:
+                    os.unlink(tmp)
+            if not complete:
+                raise CacheFileError('slice %s truncated by origin' % skey)
+            os.rename(tmp, cache_file)
+        finally:
+            if not relayed:
+                self.release_origin(conn, resp)
+            self.upstream_response_time = (self.upstream_response_time or 0) + time.time() - begin
+
+    def send_cache_headers(self, host, status, cache_status):
+        if status in EXPIRES_STATUS:
+            expire = int(parse_duration(host.cache_expire))
+            self.send_header('Expires', formatdate(time.time() + expire, usegmt=True))
+            self.send_header('Cache-Control', 'max-age=%d' % expire)
+        self.cache_status = cache_status
+        self.send_header('Nginx-Cache', cache_status)
+
+    def origin_request_headers(self, name, cacheable):
+        headers = {}
+        for line in self.headers.headers:
+            k, _, v = line.partition(':')
+            if k.lower() in HOP_BY_HOP or k.lower() in ('host', 'content-length', PEER_HEADER.lower()):
+                continue
+            if cacheable and k.lower() in ('accept-encoding', 'range', 'if-range'):
+                continue
+            headers[k] = v.strip()
+        headers['Host'] = name
+        headers['X-Real-IP'] = self.client_address[0]
+        forwarded = self.headers.get('X-Forwarded-For')
+        headers['X-Forwarded-For'] = (forwarded + ', ' if forwarded else '') + self.client_address[0]
+        headers['X-Forwarded-Proto'] = self.server.scheme
+        if cacheable:
+            headers['Accept-Encoding'] = ''
+        return headers
+
+    def open_origin(self, host, name, cacheable, method=None, headers=None):
+        body = None
+        length = self.headers.get('Content-Length')
+        if length and not method:
+            body = self.rfile.read(int(length))
+        engine = self.server.engine
+        request_headers = self.origin_request_headers(name, cacheable)
+        request_headers.update(headers or {})
+        # requests from a peer are never passed on, so peers can not loop
+        if cacheable and engine.config.peers and not self.headers.get(PEER_HEADER):
+            opened = self.open_peer(name, method, body, request_headers)
+            if opened:
+                return opened
+        ip = engine.resolver.resolve(name, host.dns_resolver)
+        key = (self.server.scheme, ip, self.server.server_port, name)
+        return self.send_upstream(key, method, body, request_headers)
+
+    def open_peer(self, name, method, body, headers):
+        """(connection, response) of the first peer that answers without a server error, None when none did"""
+        engine = self.server.engine
+        headers = dict(headers)
+        headers[PEER_HEADER] = engine.node_id
+        tried = 0
+        for peer in rank(engine.config.peers, name + self.path):
+            if tried == PEER_TRIES:
+                break
+            if engine.peer_failed.get(peer, 0) > time.time():
+                continue
+            tried += 1
+            port = peer.https_port if self.server.scheme == 'https' else peer.http_port
+            key = (self.server.scheme, peer.address, port, name)
+            try:
+                conn, resp = self.send_upstream(key, method, body, headers, PEER_CONNECT_TIMEOUT)
+            except (socket.error, httplib.HTTPException) as e:
+                error = e
+            else:
+                if resp.status < 500:
+                    return conn, resp
+                error = '%d %s' % (resp.status, resp.reason)
+                conn.close()
+            log.warn('peer %s: %s, skipping it for %ss' % (format_peer(peer), error, PEER_FAIL_TIMEOUT))
+            engine.peer_failed[peer] = time.time() + PEER_FAIL_TIMEOUT
+
+    def send_upstream(self, key, method, body, headers, connect_timeout=CONNECT_TIMEOUT):
+        scheme, address, port, name = key
+        engine = self.server.engine
+        while True:
+            conn = engine.origin_pool.get(key)
+            reused = conn is not None
+            if not reused:
+                cls = OriginHTTPSConnection if scheme == 'https' else OriginHTTPConnection
+                conn = cls(address, port, name, connect_timeout=connect_timeout)
+            conn.pool_key = key
+            try:
+                conn.request(method or self.command, self.path, body, headers)
+                return conn, conn.getresponse()
+            except (socket.error, httplib.HTTPException):
+                conn.close()
+                # the origin may have closed an idle connection, retry on a new one
+                if not reused:
+                    raise
+
+    def release_origin(self, conn, resp):
+        """keep the connection for the next request when the response was read to its end"""
+        if resp.isclosed() and not resp.will_close:
+            self.server.engine.origin_pool.put(conn.pool_key, conn)
+        else:
+            conn.close()
+
+    def forward(self, host, name, key=None, cache_file=None, cache_status=None):
+        start = time.time()
+        try:
+            conn, resp = self.open_origin(host, name, cache_file is not None)
+        except (socket.error, httplib.HTTPException, DNSError) as e:
+            log.error('%s %s%s: %s' % (self.command, name, self.path, e))
+            self.upstream_response_time = time.time() - start
+            return self.send_error(502)
+        try:
+            self.relay(host, resp, key, cache_file, cache_status)
+        finally:
+            self.release_origin(conn, resp)
+            self.upstream_response_time = time.time() - start
+
+    def relay(self, host, resp, key, cache_file, cache_status):
+        store = cache_file is not None and self.command == 'GET' and resp.status == 200
+        raw_headers = ['HTTP/1.1 %d %s' % (resp.status, resp.reason)]
+        self.send_response(resp.status, resp.reason)
+        length = None
+        for line in resp.msg.headers:
+            k, _, v = line.partition(':')
+            lk = k.lower()
+            if lk in HOP_BY_HOP or lk in REPLACED_HEADERS:
+                continue
+            raw_headers.append('%s: %s' % (k, v.strip()))
+            if lk == 'content-length':
+                length = v.strip()
+            if cache_status and resp.status in EXPIRES_STATUS and lk in ('expires', 'cache-control'):
+                continue
+            self.send_header(k, v.strip())
+        if length is None:
+            self.send_header('Connection', 'close')
+            self.close_connection = 1
+        if cache_status:
+            self.send_cache_headers(host, resp.status, cache_status)
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+
+        out = tmp = None
+        if store:
+            out, tmp = self.server.engine.open_cache_tmp(cache_file)
+            now = int(time.time())
+            out.write(pack_header(key, '\r\n'.join(raw_headers) + '\r\n\r\n', now + CACHE_VALID, now))
+        client = True
+        received = 0
+        # only a body read to its end is cached, a chunked or close-delimited one cut off has no length to check
+        complete = False
+        try:
+            while True:
+                chunk = resp.read(CHUNK_SIZE)
+                if not chunk:
+                    complete = length is None or received == int(length)
+                    break
+                received += len(chunk)
+                if out:
+                    out.write(chunk)
+                if client:
+                    try:
+                        self.wfile.write(chunk)
+                        self.body_bytes_sent += len(chunk)
+                    except socket.error:
+                        # keep filling the cache for an aborted download
+                        client = False
+                        self.close_connection = 1
+                        if not out:
+                            break
+        except (socket.error, httplib.HTTPException) as e:
+            log.error('reading %s from origin: %s' % (key or self.path, e))
+            self.close_connection = 1
+        finally:
+            if out:
+                out.close()
+                if complete:
+                    os.rename(tmp, cache_file)
+                else:
+                    os.unlink(tmp)
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, engine, address, scheme, ssl_context=None):
+        BaseHTTPServer.HTTPServer.__init__(self, address, CachingHandler)
+        self.engine = engine
+        self.scheme = scheme
+        self.ssl_context = ssl_context
+
+    def server_bind(self):
+        SocketServer.TCPServer.server_bind(self)
+        self.server_name, self.server_port = self.server_address[:2]
+
+    def get_request(self):
+        sock, addr = self.socket.accept()
+        if self.ssl_context:
+            # handshake happens in the handler thread, see CachingHandler.setup
+            sock = self.ssl_context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+        return sock, addr
+
+
+class NativeEngine(object):
+    def __init__(self, config):
+        self.config = config
+        self.resolver = Resolver()
+        self.origin_pool = OriginPool()
+        self.node_id = node_id()
+        # {peer: time until which it is not asked}
+        self.peer_failed = {}
+        self.servers = []
+        self._logs = {}
+        self._retired_logs = []
+        self._logs_lock = threading.Lock()
+        self._ssl_contexts = {}
+        self._cache_locks = {}
+        self._cache_locks_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._reload_requested = threading.Event()
+
+    def cacheable(self, host, uri):
+        return host.matcher.match(uri)
+
+    def access_log(self, host, line):
+        fd = self._logs.get(host.name)
+        if fd is None:
+            with self._logs_lock:
+                fd = self._logs.get(host.name)
+                if fd is None:
+                    mkdirs(os.path.dirname(host.access_log_path))
+                    fd = os.open(host.access_log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+                    self._logs[host.name] = fd
+        # a single write on an O_APPEND fd keeps lines from concurrent requests whole
+        os.write(fd, line + '\n')
+
+    @contextlib.contextmanager
+    def cache_lock(self, key):
+        with self._cache_locks_lock:
+            lock, waiters = self._cache_locks.get(key) or (threading.Lock(), 0)
+            self._cache_locks[key] = lock, waiters + 1
+        try:
+            with lock:
+                yield
+        finally:
+            with self._cache_locks_lock:
+                lock, waiters = self._cache_locks[key]
+                if waiters == 1:
+                    del self._cache_locks[key]
+                else:
+                    self._cache_locks[key] = lock, waiters - 1
+
+    def open_cache_tmp(self, cache_file):
+        d, name = os.path.split(cache_file)
+        mkdirs(d, 0700)
+        fd, tmp = tempfile.mkstemp(prefix='.' + name, suffix='.tmp', dir=d)
+        return os.fdopen(fd, 'wb'), tmp
+
+    def host_ssl_context(self, host):
+        ctx = self._ssl_contexts.get(host.name)
+        if ctx is None:
+            ctx = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+            ctx.options |= ssl.OP_NO_SSLv2 | ssl.OP_NO_SSLv3
+            ctx.load_cert_chain(host.cert_path, host.pkey_path)
+            self._ssl_contexts[host.name] = ctx
+        return ctx
+
+    def _servername_callback(self, sock, name, ctx):
+        # the host certs cover *.name as well
+        host = self.config.find_host(name.lower()) if name else None
+        if host:
+            try:
+                sock.context = self.host_ssl_context(host)
+            except (IOError, ssl.SSLError) as e:
+                log.error('loading cert for %s: %s' % (name, e))
+                return ssl.ALERT_DESCRIPTION_INTERNAL_ERROR
+        return None
+
+    def _default_ssl_context(self):
+        ctx = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        ctx.options |= ssl.OP_NO_SSLv2 | ssl.OP_NO_SSLv3
+        ctx.set_servername_callback(self._servername_callback)
+        # presented to clients that do not send SNI
+        for name in sorted(self.config.hosts):
+            host = self.config.hosts[name]
+            if os.path.exists(host.cert_path):
+                ctx.load_cert_chain(host.cert_path, host.pkey_path)
+                break
+        return ctx
+
+    def start(self):
+        self._start_servers()
+        t = threading.Thread(target=self._cache_manager, name='cache-manager')
+        t.daemon = True
+        t.start()
+
+    def _start_servers(self):
+        self.servers = [ThreadingHTTPServer(self, ('', int(self.config.http_port)), 'http')]
+        if self.config.ssl:
+            self.servers.append(ThreadingHTTPServer(self, ('', int(self.config.https_port)), 'https',
+                                                    self._default_ssl_context()))
+        for server in self.servers:
+            t = threading.Thread(target=server.serve_forever, name='%s-server' % server.scheme)
+            t.daemon = True
+            t.start()
+        log.info('native engine listening on %s' % ', '.join('%s:%s' % (s.scheme, s.server_port)
+                                                            for s in self.servers))
+
+    def _stop_servers(self):
+        # only stops accepting, requests in flight go on in their own threads
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def stop(self):
+        self._stopped.set()
+        self._stop_servers()
+        self.origin_pool.close()
+
+    def reload(self, config):
+        """switch to a new config, the listening sockets are only re-opened when ports or ssl changed"""
+        old, self.config = self.config, config
+        self._ssl_contexts = {}
+        with self._logs_lock:
+            # closed on the next reload, when requests of removed hosts are surely finished
+            for fd in self._retired_logs:
+                os.close(fd)
+            self._retired_logs = [fd for name, fd in self._logs.items() if name not in config.hosts]
+            self._logs = dict((name, fd) for name, fd in self._logs.items() if name in config.hosts)
+        if (old.http_port, old.https_port, old.ssl) != (config.http_port, config.https_port, config.ssl):
+            self._stop_servers()
+            self._start_servers()
+        else:
+            for server in self.servers:
+                if server.ssl_context:
+                    server.ssl_context = self._default_ssl_context()
+        log.info('reloaded, %s hosts' % len(config.hosts))
+
+    def serve_forever(self, load_config=None):
+        """runs until SIGTERM or SIGINT, SIGHUP reloads the config with load_config"""
+        signal.signal(signal.SIGTERM, lambda *_: self._stopped.set())
+        signal.signal(signal.SIGINT, lambda *_: self._stopped.set())
+        if load_config:
+            signal.signal(signal.SIGHUP, lambda *_: self._reload_requested.set())
+        self.start()
+        while not self._stopped.is_set():
+            self._stopped.wait(1)
+            if self._reload_requested.is_set():
+                self._reload_requested.clear()
+                try:
+                    self.reload(load_config())
+                except (LHCError, socket.error) as e:
+                    log.error('reload failed: %s' % e)
+        self.stop()
+
+    def _cache_manager(self):
+        while not self._stopped.wait(CACHE_MANAGER_INTERVAL):
+            zones = [(h.cache_path, h.cache_expire, parse_size(h.cache_size_limit))
+                     for h in self.config.hosts.values() if not h.mirror_group]
+            # a mirror group is one directory, expired once with the limits of all its hosts
+            zones.extend((members[0].cache_path,) + self.config.zone_limits(members)
+                         for members in self.config.mirror_groups().values())
+            for cache_path, cache_expire, limit in zones:
+                try:
+                    self.expire(cache_path, cache_expire, limit)
+                except (OSError, ValueError) as e:
+                    log.error('cache manager %s: %s' % (cache_path, e))
+
+    def expire(self, cache_path, cache_expire, limit):
+        """the cache manager's job: drop entries inactive for cache_expire, then LRU down to limit bytes"""
+        inactive = parse_duration(cache_expire)
+        now = time.time()
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(cache_path):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if not is_cache_file_name(name):
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if now - st.st_atime > inactive:
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        # purged, replaced or evicted meanwhile
+                        pass
+                    continue
+                entries.append((st.st_atime, st.st_size, path))
+                total += st.st_size
+        if total <= limit:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= limit:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+
+
+def main():
+    from configuration import Config
+
+    hdlr = logging.StreamHandler()
+    hdlr.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(message)s'))
+    log.addHandler(hdlr)
+    log.setLevel(logging.INFO)
+    NativeEngine(Config.load()).serve_forever(Config.load)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,44 @@
 # coding=utf-8
-import jinja2
+import logging
+import re
+from collections import OrderedDict
 
-env = jinja2.Environment(autoescape=False)
-env.filters['append_spaces'] = lambda s, n: s and ('\n' + ' ' * n).join(s.splitlines())
+from peers import PEER_HEADER, PEER_CONNECT_TIMEOUT, PEER_TRIES, PEER_FAIL_TIMEOUT, node_id
+from resolver import Resolver, DNSError
+from utils import parse_size
 
-CONF_TMPL = env.from_string(u'''\
+log = logging.getLogger('lhc')
+
+# how long nginx caches the answers of the resolver for hosts without an upstream block
+RESOLVER_VALID = '300s'
+RESOLVE_WORKERS = 16
+# origins are written into upstream blocks only when their addresses are meant to last: nginx keeps those
+# until the next `lhc reload`. names behind a cname or with shorter ttls (CDNs rotating addresses) are
+# resolved by nginx while it runs
+PIN_MIN_TTL = 3600
+# what the proxy listens on, a request to one of them goes to the same port of the origin
+PORTS = OrderedDict([('http', 80), ('https', 443)])
+
+# shared memory reserved for the keys of a shared zone, 1m holds about 8000 keys
+SHARED_KEYS_ZONE_MB = 64
+SHARED_KEYS_ZONE_MB_PER_HOST = 1
+SHARED_KEYS_ZONE_MAX_MB = 1024
+
+# the hot tier passes its misses to the disk tier of the same nginx through this socket
+HOT_TIER_SOCKET = '/var/run/lhc-disk.sock'
+HOT_KEYS_ZONE = '32m'
+
+CONF_TMPL = u'''\
 user root;
-worker_processes  1;
+worker_processes  {{tuning.worker_processes}};
+worker_rlimit_nofile {{tuning.worker_rlimit_nofile}};
 
 error_log  /var/log/nginx-error.log;
 pid              /var/run/nginx.pid;
 
 events {
-    worker_connections  1024;
+    worker_connections  {{tuning.worker_connections}};
+    multi_accept on;
 }
 
 http {
@@ -28,15 +54,20 @@ http {
 	tcp_nodelay on;
 	   
 	keepalive_timeout 60;
+
+	open_file_cache          max={{tuning.open_file_cache}} inactive=60s;
+	open_file_cache_valid    60s;
+	open_file_cache_min_uses 2;
+	open_file_cache_errors   on;
 	   
-	client_body_buffer_size  512k;
+	client_body_buffer_size  {{tuning.client_body_buffer_size}};
 	 
 	proxy_connect_timeout         5;
 	proxy_read_timeout           60;
 	proxy_send_timeout            5;
-	proxy_buffer_size           16k;
-	proxy_buffers             4 64k;
-	proxy_busy_buffers_size    128k;
+	proxy_buffer_size           {{tuning.proxy_buffer_size}};
+	proxy_buffers             {{tuning.proxy_buffers}};
+	proxy_busy_buffers_size    {{tuning.proxy_busy_buffers_size}};
 	proxy_temp_file_write_size 128k;
 	   
 	# gzip on;
@@ -51,16 +82,18 @@ http {
 
 	log_format  main  '$http_x_forwarded_for - $remote_user [$time_local] "$request" '
                 '$status $body_bytes_sent "$http_referer" '
-                '"$http_user_agent" "$upstream_cache_status" $remote_addr';
+                '"$http_user_agent" "{{v.cache_status}}" $remote_addr '
+                '$request_length $bytes_sent $request_time "$upstream_response_time"';
 	
 	
+	# keep upstream connections alive unless the client asks for an upgrade
 	map $http_upgrade $connection_upgrade {
         default upgrade;
-        ''      close;
+        ''      '';
     }
 	    
 	server {
-        listen      80;
+        listen      {{ports.http}}{% if tuning.reuseport %} reuseport{% endif %};
         server_name _;
         
         location / {
@@ -69,17 +102,371 @@ http {
         }
 	}
 	    
-    {% for host in config.hosts.values() %}    
+	{% for host in config.hosts.values() if upstreams.get(host.name) %}
+	# origin addresses of {{host.name}} resolved through {{host.dns_resolver}} when this file was rendered, pooled with keepalive;
+	# they are kept until `lhc reload`, run it when the origin moves
+	{% for scheme, port in ports.items() %}
+	upstream lhc_{{host.normalized_name}}_{{scheme}} {
+	    {% for ip in upstreams[host.name] %}
+	    server {{ip}}:{{port}};
+	    {% endfor %}
+	    keepalive {{tuning.upstream_keepalive}};
+	}
+	{% endfor %}
+	{% endfor %}
+
+	{% if peering %}
+	# other lhc nodes, every node sends an url to the same one of them; a failed peer is skipped for a while
+	{% for scheme in ('http', 'https') %}
+	upstream lhc_peers_{{scheme}} {
+	    hash $host$request_uri consistent;
+	    {% for peer in peering.peers %}
+	    server {{peer.address}}:{{peer.http_port if scheme == 'http' else peer.https_port}} max_fails=1 fail_timeout={{peering.fail_timeout}}s;
+	    {% endfor %}
+	    keepalive {{tuning.upstream_keepalive}};
+	}
+	{% endfor %}
+	{% endif %}
+
+	{% if hot %}
+	# hot tier: objects up to {{hot.max_object_size}} are kept in {{hot.path}} in front of the disk zones,
+	# its misses come back to the disk tier of the same server over a unix socket
+	proxy_cache_path  {{hot.path}}  levels=2 keys_zone=cache_hot:{{hot.keys_zone}} inactive={{hot.inactive}} max_size={{hot.max_size}};
+
+	upstream lhc_disk {
+	    server unix:{{hot.socket}};
+	    keepalive {{tuning.upstream_keepalive}};
+	}
+
+	map $server_addr $lhc_front {
+	    ~^unix: 0;
+	    default 1;
+	}
+
+	# what the client sent, also for the requests passed on by the hot tier
+	map $http_x_lhc_scheme $lhc_hop_scheme {
+	    default http;
+	    https https;
+	}
+
+	map $lhc_front $lhc_scheme {
+	    0 $lhc_hop_scheme;
+	    default $scheme;
+	}
+
+	map $lhc_scheme $lhc_port {
+	    https 443;
+	    default 80;
+	}
+
+	map $lhc_front $lhc_real_ip {
+	    0 $http_x_real_ip;
+	    default $remote_addr;
+	}
+
+	map $lhc_front $lhc_forwarded_for {
+	    0 $http_x_forwarded_for;
+	    default $proxy_add_x_forwarded_for;
+	}
+
+	map $upstream_http_content_length $lhc_not_hot {
+	    default 1;
+	    "~^{{hot.below}}$" 0;
+	}
+
+	# hot in the locations of the hot tier, which set it, so a HIT of any other location stays a HIT
+	map $lhc_front $lhc_tier {
+	    default disk;
+	}
+
+	# HOT when served by the hot tier, the status of the disk tier when the hot tier passed the request on
+	map "$lhc_tier:$upstream_cache_status:$upstream_http_x_lhc_disk" $lhc_cache_status {
+	    default $upstream_cache_status;
+	    ~^hot:HIT:$ HOT;
+	    ~^hot:[A-Z]*:(?<disk>[A-Z]+)$ $disk;
+	}
+	{% endif %}
+
+	{% macro hot_first(location) %}
+                # the hot tier is asked first, it passes its misses back here
+                error_page 419 = {{location}};
+                if ($lhc_front) {
+                    return 419;
+                }
+	{% endmacro %}
+
+	{% macro hot_cache(key) %}
+                set $lhc_tier hot;
+                proxy_pass http://lhc_disk;
+                proxy_set_header Host $host;
+                proxy_set_header X-LHC-Scheme $scheme;
+                proxy_set_header X-Real-IP $remote_addr;
+                proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+
+				proxy_http_version 1.1;
+				proxy_set_header Connection "";
+
+                proxy_hide_header X-LHC-Disk;
+                proxy_hide_header Nginx-Cache;
+                add_header Nginx-Cache $lhc_cache_status;
+                proxy_cache               cache_hot;
+                proxy_cache_key            {{key}};
+                # small objects only, not longer than the disk tier serves them without the origin
+                proxy_no_cache            $lhc_not_hot;
+                proxy_ignore_headers      Cache-Control Expires;
+                proxy_cache_valid                 200 304 30m;
+                proxy_cache_methods                  GET HEAD;
+	{% endmacro %}
+
+	{% macro fetch(origin, fallback) %}
+                {% if peering %}
+                # misses are asked from the peers first, requests from a peer and failed peers go to the origin
+                error_page 418 = {{fallback}};
+                if ($http_x_lhc_peer) {
+                    return 418;
+                }
+                proxy_pass {{v.scheme}}://lhc_peers_{{v.scheme}};
+                proxy_set_header {{peering.header}} "{{peering.node}}";
+                proxy_hide_header Nginx-Cache;
+                proxy_connect_timeout {{peering.connect_timeout}};
+                proxy_next_upstream error timeout http_502 http_503 http_504;
+                proxy_next_upstream_tries {{peering.tries}};
+                proxy_intercept_errors on;
+                error_page 502 503 504 = {{fallback}};
+                {% else %}
+                proxy_pass {{origin}};
+                {% endif %}
+	{% endmacro %}
+
+	{% macro cache(zone, key, expire, slice_size=None, hot=False) %}
+                proxy_set_header Host $host;
+                proxy_set_header User-Agent $http_user_agent;
+                proxy_set_header Accept-Encoding "";
+                proxy_set_header X-Real-IP {{v.real_ip}}; 
+                proxy_set_header X-Forwarded-For {{v.forwarded_for}}; 
+                proxy_set_header X-Forwarded-Proto {{v.scheme}};
+
+				proxy_http_version 1.1;
+				proxy_set_header Connection "";
+
+                add_header Nginx-Cache $upstream_cache_status;
+                {% if hot %}
+                add_header X-LHC-Disk $upstream_cache_status;
+                {% endif %}
+                proxy_cache               {{zone}};
+                {% if slice_size %}
+                # fetched and cached in slices, range requests and aborted downloads are served from them
+                slice                     {{slice_size}};
+                proxy_set_header Range    $slice_range;
+                proxy_cache_key            {{key|replace('$scheme', v.scheme)}}$slice_range;
+                proxy_cache_valid             200 206 304 30m;
+                proxy_cache_lock                          on;
+                proxy_cache_lock_timeout                 30s;
+                {% else %}
+                proxy_cache_key            {{key|replace('$scheme', v.scheme)}};
+                proxy_cache_valid                 200 304 30m;
+                {% endif %}
+                proxy_cache_methods                  GET HEAD;
+                expires                 {{expire}};
+	{% endmacro %}
+
+	{% set wildcard = '.' if config.dns_wildcard else '' %}
+	{% if shared %}
+	# shared layout: the hosts below share a few cache zones and one server, their settings are looked up by $host
+	server_names_hash_max_size {{shared.hash_size}};
+	map_hash_max_size {{shared.hash_size}};
+	map_hash_bucket_size 128;
+
+	{% for zone in shared.zones %}
+	proxy_cache_path  {{zone.path}}  levels=2 keys_zone={{zone.name}}:{{zone.keys_zone}} inactive={{zone.inactive}} max_size={{zone.max_size}};
+	{% endfor %}
+
+	map $host $lhc_zone {
+	    {% if config.dns_wildcard %}hostnames;{% endif %}
+	    default {{shared.zones[0].name}};
+	    {% for host in shared.hosts %}
+	    {{wildcard}}{{host.name}} {{host.cache_name}};
+	    {% endfor %}
+	}
+
+	map $host $lhc_extensions {
+	    {% if config.dns_wildcard %}hostnames;{% endif %}
+	    default -;
+	    {% for host in shared.hosts %}
+	    {{wildcard}}{{host.name}} {{shared.extensions[host.extensions_regex]}};
+	    {% endfor %}
+	}
+
+	# 1 when the uri has one of the extensions its host caches, one regex per distinct set of extensions
+	map "$lhc_extensions:$uri" $lhc_cacheable {
+	    default 0;
+	    {% for regex, i in shared.extensions.items() %}
+	    ~^{{i}}:.*{{regex}} 1;
+	    {% endfor %}
+	}
+
+	map $host $lhc_cache_key {
+	    {% if config.dns_wildcard %}hostnames;{% endif %}
+	    default {{config.cache_key|replace('$scheme', v.scheme)}};
+	    {% for host in shared.hosts %}
+	    {{wildcard}}{{host.name}} {{host.cache_key|replace('$scheme', v.scheme)}};
+	    {% endfor %}
+	}
+
+	map $host $lhc_expires {
+	    {% if config.dns_wildcard %}hostnames;{% endif %}
+	    default {{config.cache_expire}};
+	    {% for host in shared.hosts %}
+	    {{wildcard}}{{host.name}} {{host.cache_expire}};
+	    {% endfor %}
+	}
+
+	# subdomains of the hosts go to their own address
+	map $host $lhc_origin {
+	    default $host:{{v.port}};
+	    {% for host in shared.hosts if upstreams.get(host.name) %}
+	    {{host.name}} lhc_{{host.normalized_name}}_{{v.scheme}};
+	    {% endfor %}
+	}
+
+	map $host $lhc_access_log {
+	    {% if config.dns_wildcard %}hostnames;{% endif %}
+	    default {{shared.hosts[0].access_log_path}};
+	    {% for host in shared.hosts %}
+	    {{wildcard}}{{host.name}} {{host.access_log_path}};
+	    {% endfor %}
+	}
+
+	map $ssl_server_name $lhc_cert {
+	    {% if config.dns_wildcard %}hostnames;{% endif %}
+	    default {{shared.hosts[0].cert_path}};
+	    {% for host in shared.hosts %}
+	    {{wildcard}}{{host.name}} {{host.cert_path}};
+	    {% endfor %}
+	}
+
+	map $ssl_server_name $lhc_pkey {
+	    {% if config.dns_wildcard %}hostnames;{% endif %}
+	    default {{shared.hosts[0].pkey_path}};
+	    {% for host in shared.hosts %}
+	    {{wildcard}}{{host.name}} {{host.pkey_path}};
+	    {% endfor %}
+	}
+
+    server {
+        resolver {{config.dns_resolver}} valid={{resolver_valid}} ipv6=off;
+        resolver_timeout 5s;
+        listen      {{ports.http}};
+        server_name
+            {% for host in shared.hosts %}
+            {{host.name}}{% if config.dns_wildcard %} *.{{host.name}}{% endif %}
+            {% endfor %}
+            ;
+
+        listen {{ports.https}} ssl{% if tuning.reuseport %} reuseport{% endif %};
+        {% if hot %}
+        listen unix:{{hot.socket}};
+        {% endif %}
+        # the certificate of the requested host is loaded on every handshake, needs nginx 1.15.9+
+        ssl_certificate $lhc_cert;
+        ssl_certificate_key $lhc_pkey;
+
+		add_header  X-Qequest-Time '$request_time';
+
+		access_log $lhc_access_log main{% if hot %} if=$lhc_front{% endif %};
+		open_log_file_cache max=1000 inactive=60s;
+
+		proxy_ssl_server_name on;
+		proxy_ssl_name $host;
+		proxy_ssl_session_reuse on;
+
+		location / {
+				# files with a cached extension are handled by @lhc_cache
+				error_page 418 = @lhc_cache;
+				if ($lhc_cacheable) {
+					return 418;
+				}
+				proxy_pass {{v.scheme}}://$lhc_origin;
+				proxy_http_version 1.1;
+				proxy_set_header Host $host;
+				proxy_set_header Upgrade $http_upgrade;
+				proxy_set_header Connection $connection_upgrade;
+		}
+
+        location @lhc_cache {
+                {% if peering or hot %}
+                recursive_error_pages on;
+                {% endif %}
+                {% if hot %}
+{{ hot_first('@lhc_hot') }}
+                {% endif %}
+{{ fetch(v.scheme + '://$lhc_origin', '@lhc_origin') }}
+{{ cache('$lhc_zone', '$lhc_cache_key', '$lhc_expires', hot=hot) }}
+        }
+        {% if peering %}
+
+        location @lhc_origin {
+                proxy_pass {{v.scheme}}://$lhc_origin;
+                proxy_set_header {{peering.header}} "";
+{{ cache('$lhc_zone', '$lhc_cache_key', '$lhc_expires', hot=hot) }}
+        }
+        {% endif %}
+        {% if hot %}
+
+        location @lhc_hot {
+{{ hot_cache('$lhc_cache_key') }}
+        }
+        {% endif %}
+	}
+	{% endif %}
+
+	{% if mirrors %}
+	{% for zone in mirrors.zones %}
+	# mirror group {{zone.group}}: {{zone.hosts|join(', ')}} share this zone, an url is cached once for all of them
+	proxy_cache_path  {{zone.path}}  levels=2 keys_zone={{zone.name}}:{{zone.keys_zone}} inactive={{zone.inactive}} max_size={{zone.max_size}};
+	{% endfor %}
+
+	{% for name, regex in mirrors.prefixes %}
+	map $uri $lhc_mirror_uri_{{name}} {
+	    default $uri;
+	    "~{{regex}}" $lhc_mirror_rest;
+	}
+	{% endfor %}
+	{% endif %}
+
+    {% for host in hosts %}    
+	{% if not host.mirror_group %}
 	# 缓存配置1:2表示第一级目录1个字符，第二级目录2个字符；cache1:20m表示每个缓存区域20M空间；
 	# 3d表示3天后缓存过期
 	proxy_cache_path  {{host.cache_path}}  levels=2 keys_zone={{host.cache_name}}:20m inactive={{host.cache_expire}} max_size={{host.cache_size_limit}};			   
+	{% endif %}
+	{% set key = mirrors.cache_keys[host.name] if host.mirror_group else host.cache_key %}
+
+	{% if upstreams.get(host.name) and config.dns_wildcard %}
+	{% set origin = v.scheme + '://$lhc_host_origin' %}
+	{% elif upstreams.get(host.name) %}
+	{% set origin = v.scheme + '://lhc_' + host.normalized_name + '_' + v.scheme %}
+	{% else %}
+	{% set origin = v.scheme + '://$host:' + v.port %}
+	{% endif %}
 
     server {
-        resolver {{host.dns_resolver}};
-        listen      80;
-        server_name {{host.name}};
+        resolver {{host.dns_resolver}} valid={{resolver_valid}} ipv6=off;
+        resolver_timeout 5s;
+        listen      {{ports.http}};
+        server_name {{host.name}}{% if config.dns_wildcard %} *.{{host.name}}{% endif %};
+        {% if upstreams.get(host.name) and config.dns_wildcard %}
+        # subdomains go to their own address
+        set $lhc_host_origin lhc_{{host.normalized_name}}_{{v.scheme}};
+        if ($host != {{host.name}}) {
+            set $lhc_host_origin $host:{{v.port}};
+        }
+        {% endif %}
         
-        listen 443 ssl;
+        listen {{ports.https}} ssl{% if tuning.reuseport and loop.first and not shared %} reuseport{% endif %};
+        {% if host.hot %}
+        listen unix:{{hot.socket}};
+        {% endif %}
         ssl_certificate {{host.cert_path}};
         ssl_certificate_key {{host.pkey_path}};
         
@@ -91,42 +478,205 @@ http {
 		# 	}
 
 		add_header  X-Qequest-Time '$request_time';
+
+		access_log {{host.access_log_path}} main{% if host.hot %} if=$lhc_front{% endif %};
+
+		proxy_ssl_server_name on;
+		proxy_ssl_name $host;
+		proxy_ssl_session_reuse on;
 		
 		location / {
-				proxy_pass $scheme://$host:$server_port;
+				proxy_pass {{origin}};
 				proxy_http_version 1.1;
+				proxy_set_header Host $host;
 				proxy_set_header Upgrade $http_upgrade;
-				proxy_set_header Connection "upgrade";
+				proxy_set_header Connection $connection_upgrade;
 		}
 		
 		# proxy config
 		# TODO location ~ (?<!(Packages|INDEX))\.(tar|zip|gz|apk|iso|deb|rpm)
-        location ~ \.({{ host.extensions_reg }}) {
-                proxy_pass $scheme://$host:$server_port;
-                # proxy_next_upstream http_502 http_504 error timeout invalid_header;
-                proxy_set_header Host $host;
-                proxy_set_header User-Agent $http_user_agent;
-                proxy_set_header Accept-Encoding "";
-                proxy_set_header X-Real-IP $remote_addr; 
-                proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for; 
-                proxy_set_header X-Forwarded-Proto $scheme;
+        location ~ {{ host.extensions_regex }} {
+                {% if host.hot %}
+{{ hot_first('@lhc_hot_' + host.normalized_name) }}
+                {% endif %}
+{{ fetch(origin, '@lhc_origin_' + host.normalized_name) }}
+{{ cache(host.cache_name, key, host.cache_expire, host.slice_bytes and host.slice_size, host.hot) }}
+        }
+        {% if peering %}
 
-				proxy_http_version 1.1;
-				proxy_set_header Upgrade $http_upgrade;
-				proxy_set_header Connection "upgrade";
+        location @lhc_origin_{{host.normalized_name}} {
+                proxy_pass {{origin}};
+                proxy_set_header {{peering.header}} "";
+{{ cache(host.cache_name, key, host.cache_expire, host.slice_bytes and host.slice_size, host.hot) }}
+        }
+        {% endif %}
+        {% if host.hot %}
 
-                add_header Nginx-Cache $upstream_cache_status;
-                proxy_cache               {{host.cache_name}};
-                proxy_cache_key            {{host.cache_key}};
-                proxy_cache_valid                 200 304 30m;
-                proxy_cache_methods                  GET HEAD;
-                expires                 {{host.cache_expire}};
+        location @lhc_hot_{{host.normalized_name}} {
+{{ hot_cache(key) }}
         }
+        {% endif %}
 	}
 	{% endfor %}
 }
-''')
+'''
+
+_template = None
+
+
+def get_template():
+    """jinja2 is imported and the template compiled only when a config is rendered"""
+    global _template
+    if _template is None:
+        import jinja2
+
+        env = jinja2.Environment(autoescape=False)
+        env.filters['append_spaces'] = lambda s, n: s and ('\n' + ' ' * n).join(s.splitlines())
+        _template = env.from_string(CONF_TMPL)
+    return _template
+
+
+def resolve_upstreams(config):
+    """
+    {hostname: [ip]} of the origins to pin in upstream blocks, resolved through the dns_resolver of each host so
+    names pointed at the proxy in /etc/hosts do not loop back; hosts that can not be resolved or whose answers
+    are short-lived are left to nginx's resolver
+    """
+    from multiprocessing.pool import ThreadPool
+
+    hosts = config.hosts.values()
+    if not hosts:
+        return {}
+    resolver = Resolver()
+
+    def resolve(host):
+        try:
+            ips, ttl, cname = resolver.lookup(host.name, host.dns_resolver)
+        except DNSError as e:
+            log.warn('%s, resolving it on every request instead' % e)
+            return host.name, None
+        if cname or ttl < PIN_MIN_TTL:
+            log.debug('%s: %s, ttl %ss, resolved by nginx' % (host.name, 'cname' if cname else 'a', ttl))
+            return host.name, None
+        return host.name, ips
+
+    pool = ThreadPool(min(RESOLVE_WORKERS, len(hosts)))
+    try:
+        return dict(pool.map(resolve, hosts))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def shared_layout(config):
+    """what the template needs for the hosts in shared zones, None when there are none"""
+    zones = config.shared_zones()
+    if not zones:
+        return
+    hosts = []
+    shared_zones = []
+    for name, members in zones.items():
+        hosts.extend(members)
+        shared_zones.append({
+            'name': name,
+            'path': members[0].cache_path,
+            'inactive': members[0].cache_expire,
+            'max_size': sum(parse_size(h.cache_size_limit) for h in members),
+            'keys_zone': '%dm' % min(SHARED_KEYS_ZONE_MAX_MB,
+                                     SHARED_KEYS_ZONE_MB + SHARED_KEYS_ZONE_MB_PER_HOST * len(members)),
+        })
+    extensions = OrderedDict()
+    for h in hosts:
+        extensions.setdefault(h.extensions_regex, len(extensions))
+    return {
+        'zones': shared_zones,
+        'hosts': hosts,
+        'extensions': extensions,
+        'hash_size': max(2048, len(config.hosts) * 2),
+    }
+
+
+def mirror_layout(config):
+    """what the template needs for the mirror groups, None when there are none"""
+    groups = config.mirror_groups()
+    if not groups:
+        return
+    zones, keys, prefixes = [], {}, []
+    for name, members in groups.items():
+        inactive, max_size = config.zone_limits(members)
+        zones.append({
+            'name': name,
+            'group': members[0].mirror_group,
+            'hosts': [h.name for h in members],
+            'path': members[0].cache_path,
+            'inactive': inactive,
+            'max_size': max_size,
+            'keys_zone': '%dm' % min(SHARED_KEYS_ZONE_MAX_MB,
+                                     SHARED_KEYS_ZONE_MB + SHARED_KEYS_ZONE_MB_PER_HOST * len(members)),
+        })
+        for h in members:
+            keys[h.name] = h.cache_key
+            if h.mirror_prefix:
+                # the key gets the uri below the prefix, what the python tools compute in Host.render_key
+                keys[h.name] = h.cache_key.replace('$uri', '$lhc_mirror_uri_' + h.normalized_name)
+                prefixes.append((h.normalized_name, '^%s(?<lhc_mirror_rest>/.*)$' % re.escape(h.mirror_prefix)))
+    return {'zones': zones, 'cache_keys': keys, 'prefixes': prefixes}
+
+
+def peering(config):
+    """what the template needs to ask the peers first, None when there are none"""
+    if not config.peers:
+        return
+    return {
+        'peers': config.peers,
+        'header': PEER_HEADER,
+        'node': node_id(),
+        'connect_timeout': '%ds' % PEER_CONNECT_TIMEOUT,
+        'tries': PEER_TRIES,
+        'fail_timeout': PEER_FAIL_TIMEOUT,
+    }
+
+
+def decimal_below_regex(n):
+    """regex of the decimal numbers below n, what nginx compares a content-length with"""
+    s = str(n)
+    alternatives = [r'\d{1,%d}' % (len(s) - 1) if len(s) > 2 else r'\d'] if len(s) > 1 else []
+    for i, ch in enumerate(s):
+        low = 1 if i == 0 and len(s) > 1 else 0
+        high = int(ch) - 1
+        if high < low:
+            continue
+        digit = str(low) if low == high else '[%d-%d]' % (low, high)
+        rest = len(s) - i - 1
+        alternatives.append(s[:i] + digit + (r'\d{%d}' % rest if rest > 1 else r'\d' * rest))
+    return '(?:%s)' % '|'.join(alternatives)
+
+
+def hot_tier(config):
+    """what the template needs for the hot tier, None when no host uses it"""
+    if not config.hot_hosts():
+        return
+    return {
+        'path': config.hot_cache_path,
+        'max_size': config.hot_cache_size_limit,
+        'max_object_size': config.hot_max_object_size,
+        'below': decimal_below_regex(parse_size(config.hot_max_object_size) + 1),
+        'inactive': config.cache_expire,
+        'keys_zone': HOT_KEYS_ZONE,
+        'socket': HOT_TIER_SOCKET,
+    }
 
 
 def get_nginx_conf(config):
-    return CONF_TMPL.render(config=config)
+    hosts = [h for h in config.hosts.values() if not h.shared]
+    hot = hot_tier(config)
+    # requests passed on by the hot tier arrive over a unix socket, what the client used is in maps
+    if hot:
+        v = dict(scheme='$lhc_scheme', port='$lhc_port', real_ip='$lhc_real_ip', forwarded_for='$lhc_forwarded_for',
+                 cache_status='$lhc_cache_status')
+    else:
+        v = dict(scheme='$scheme', port='$server_port', real_ip='$remote_addr',
+                 forwarded_for='$proxy_add_x_forwarded_for', cache_status='$upstream_cache_status')
+    return get_template().render(config=config, hosts=hosts, shared=shared_layout(config), tuning=config.tuning_profile,
+                                 upstreams=resolve_upstreams(config), resolver_valid=RESOLVER_VALID, ports=PORTS,
+                                 peering=peering(config), hot=hot, mirrors=mirror_layout(config), v=v)
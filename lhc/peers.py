@@ -0,0 +1,73 @@
+# other lhc nodes asked for cacheable misses before the origin, so machines sharing a network download a
+# file from the internet once; every node should list the same peers (itself included) so they agree on
+# which one of them fetches and keeps an url
+import hashlib
+import re
+import socket
+from collections import namedtuple
+
+from errors import ConfigError
+from utils import is_valid_ip, is_valid_hostname
+
+# set on requests sent to a peer, a request carrying it is fetched from the origin and never passed on
+PEER_HEADER = 'X-LHC-Peer'
+# a peer that does not accept a connection quickly is skipped, the origin is slower anyway
+PEER_CONNECT_TIMEOUT = 1
+# peers asked for an url before falling back to the origin
+PEER_TRIES = 2
+# how long a failed peer is not asked again, like max_fails=1 fail_timeout=30s of nginx
+PEER_FAIL_TIMEOUT = 30
+
+PEER_REG = re.compile(r'^([^:\s]+)(?::(\d+))?(?::(\d+))?$')
+
+Peer = namedtuple('Peer', 'address http_port https_port')
+
+
+def parse_peer(spec):
+    """a peer from `address[:http_port[:https_port]]`, the ports default to 80 and 443"""
+    m = PEER_REG.match(spec.strip())
+    if not m or not (is_valid_ip(m.group(1)) or is_valid_hostname(m.group(1))):
+        raise ConfigError("invalid peer '%s', should be address[:http_port[:https_port]]" % spec)
+    return Peer(m.group(1), int(m.group(2) or 80), int(m.group(3) or 443))
+
+
+def parse_peers(spec):
+    """the peers of a comma separated setting, in their order and without duplicates"""
+    peers = []
+    for item in (spec or '').split(','):
+        if item.strip():
+            peer = parse_peer(item)
+            if peer not in peers:
+                peers.append(peer)
+    return peers
+
+
+def format_peer(peer):
+    if peer.https_port != 443:
+        return '%s:%d:%d' % peer
+    if peer.http_port != 80:
+        return '%s:%d' % peer[:2]
+    return peer.address
+
+
+def rank(peers, key):
+    """
+    peers in the order they are asked for key (rendezvous hashing), an url keeps its peer when
+    others are added or removed
+    """
+    return sorted(peers, key=lambda p: hashlib.md5('%s:%d/%s' % (p.address, p.http_port, key)).digest(),
+                  reverse=True)
+
+
+def node_id():
+    """what this node puts in PEER_HEADER, only its presence matters to the peer"""
+    return socket.gethostname() or 'lhc'
+
+
+def check(peer, timeout=PEER_CONNECT_TIMEOUT):
+    """None when both ports of peer accept connections, the first error otherwise"""
+    for port in (peer.http_port, peer.https_port):
+        try:
+            socket.create_connection((peer.address, port), timeout).close()
+        except socket.error as e:
+            return '%s:%d: %s' % (peer.address, port, e)
@@ -1,15 +1,20 @@
+import hashlib
+import json
 import logging
 import os
 import shutil
+import signal
 import subprocess
 import sys
 import tempfile
 
 from consts import (NGINX_DOCKER_IMAGE, PROXY_CONTAINER_NAME, NGINX_CONF_FILE_PATH, MAC_ALIAS_IP,
-                    CA_CERT_FILES_PATH, CA_SUB, HOST_CERTS_FILES_PATH, MAC, DEBIAN, REDHAT, CONF_PATH)
-from errors import ProxyError, SSLError
+                    CA_CERT_FILES_PATH, CA_SUB, HOST_CERTS_FILES_PATH, MAC, DEBIAN, REDHAT, CONF_PATH,
+                    NATIVE_PID_FILE, NATIVE_LOG_FILE, DEFAULT_CONF_ITEMS, LOG_PATH, METRICS_PID_FILE,
+                    METRICS_LOG_FILE, DNS_PID_FILE, DNS_LOG_FILE)
+from errors import ConfigError, ProxyError, SSLError
 from nginx_conf import get_nginx_conf
-from utils import find_executable, mkdirs
+from utils import find_executable, mkdirs, spawn_daemon, read_pidfile, pid_alive, kill_pidfile, cached_property
 
 log = logging.getLogger('lhc')
 
@@ -17,26 +22,58 @@ CA_KEY = os.path.join(CA_CERT_FILES_PATH, 'ca.key')
 CA_CSR = os.path.join(CA_CERT_FILES_PATH, 'ca.csr')
 CA_CRT = os.path.join(CA_CERT_FILES_PATH, 'ca.crt')
 
+CONFIG_DIGEST_LABEL = 'lhc.config-digest'
+
 
 class Proxy(object):
     def __init__(self, config):
         self.config = config
 
     def run(self):
-        for host in self.config.hosts.values():
-            if not os.path.exists(host.cert_path):
-                log.info('generating cert for ' + host.name)
-                host.gen_certs()
+        missing = [host.name for host in self.config.hosts.values() if not os.path.exists(host.cert_path)]
+        if missing:
+            log.info('generating certs for ' + ', '.join(missing))
+            self.gen_and_sign_certs_for_hosts(missing)
 
     def stop(self):
         pass
 
+    def reload(self):
+        self.stop()
+        self.run()
+
     def running(self):
         pass
 
+    def health(self):
+        pass
+
     def get_ip(self):
         pass
 
+    def sidecars(self):
+        """background processes started along with the proxy: (name, module, pid file, log file)"""
+        rt = []
+        if self.config.metrics_port:
+            rt.append(('metrics exporter', 'lhc.metrics', METRICS_PID_FILE, METRICS_LOG_FILE))
+        if self.config.dns_port:
+            rt.append(('dns responder', 'lhc.dns_server', DNS_PID_FILE, DNS_LOG_FILE))
+        return rt
+
+    def start_sidecars(self):
+        for name, module, pidfile, logfile in self.sidecars():
+            if pid_alive(read_pidfile(pidfile)):
+                log.info('%s already running' % name)
+                continue
+            pid = spawn_daemon([sys.executable, '-m', module], pidfile, logfile)
+            log.info('%s started, pid %s, log file %s' % (name, pid, logfile))
+
+    def stop_sidecars(self):
+        for name, module, pidfile, logfile in self.sidecars():
+            if kill_pidfile(pidfile):
+                os.remove(pidfile)
+                log.info('%s stopped' % name)
+
     def _dumps_nginx_conf(self):
         return get_nginx_conf(self.config)
 
@@ -76,9 +113,13 @@ class Proxy(object):
             raise SSLError('ca cert files not exist')
         return self.check_cert(CA_CRT)
 
-    def ca_status(self):
+    def ca_status(self, verify=False):
+        """the ca cert path or why it is unusable, only parsed with openssl when verify is set"""
         try:
-            self.check_ca()
+            if verify:
+                self.check_ca()
+            elif not (os.path.exists(CA_CRT) and os.path.exists(CA_KEY)):
+                raise SSLError('ca cert files not exist')
             return CA_CRT
         except SSLError as e:
             return str(e)
@@ -99,7 +140,37 @@ class Proxy(object):
         CSR = os.path.join(PATH, cn + '.csr')
         return PATH, KEY, CRT, CSR
 
+    @property
+    def cert_key_type(self):
+        from certs import KEY_TYPES
+        key_type = self.config and self.config.cert_key_type or DEFAULT_CONF_ITEMS['cert_key_type']
+        if key_type not in KEY_TYPES:
+            raise ConfigError('invalid cert_key_type %s, should be one of %s' % (key_type, ', '.join(KEY_TYPES)))
+        return key_type
+
     def gen_and_sign_certs_for(self, cn):
+        self.gen_and_sign_certs_for_hosts([cn])
+
+    def gen_and_sign_certs_for_hosts(self, cns):
+        """
+        sign certs in-process across a process pool when cryptography is installed, otherwise with openssl
+        """
+        from certs import HAS_CRYPTOGRAPHY, mint_host_certs
+        key_type = self.cert_key_type
+        if not HAS_CRYPTOGRAPHY:
+            for cn in cns:
+                self.openssl_gen_and_sign_certs_for(cn)
+            return
+        self.check_ca()
+        jobs = []
+        for cn in cns:
+            PATH, KEY, CRT, CSR = self.get_host_cert_paths(cn)
+            if os.path.exists(CRT):
+                log.warn('ca cert file %s already exists' % CRT)
+            jobs.append((cn, KEY, CRT))
+        mint_host_certs(jobs, CA_KEY, CA_CRT, key_type=key_type)
+
+    def openssl_gen_and_sign_certs_for(self, cn):
         # https://my.oschina.net/itblog/blog/651434
         """
         openssl genrsa -out ca.key 2048
@@ -138,8 +209,12 @@ class Proxy(object):
             s.flush()
             f.write(req)
             f.flush()
+            if self.cert_key_type == 'ecdsa':
+                genkey = (openssl, 'ecparam', '-name', 'prime256v1', '-genkey', '-noout', '-out', KEY)
+            elif self.cert_key_type == 'rsa':
+                genkey = (openssl, 'genrsa', '-out', KEY, '2048')
             cmds = (
-                (openssl, 'genrsa', '-out', KEY, '2048'),
+                genkey,
                 (openssl, 'req', '-new', '-subj', SUB, '-reqexts', 'SAN', '-config', f.name, '-key', KEY, '-out', CSR),
                 (openssl, 'x509', '-req', '-days', '3560', '-sha256', '-CAcreateserial', '-extfile', s.name,
                  '-CA', CA_CRT,
@@ -214,43 +289,117 @@ class ProxyLocal(Proxy):
             print('LHC installation failed')
 
 
+class ProxyNative(Proxy):
+    def __init__(self, config):
+        super(ProxyNative, self).__init__(config)
+
+    def install(self):
+        print('Native engine needs no installation')
+        print('OK')
+
+    def running(self):
+        return pid_alive(read_pidfile(NATIVE_PID_FILE))
+
+    def get_ip(self):
+        return '127.0.0.1'
+
+    def run(self):
+        super(ProxyNative, self).run()
+        if self.running():
+            raise ProxyError('Already Running')
+        print('starting native proxy engine')
+        pid = spawn_daemon([sys.executable, '-m', 'lhc.native'], NATIVE_PID_FILE, NATIVE_LOG_FILE)
+        log.info('pid %s, log file %s' % (pid, NATIVE_LOG_FILE))
+        print('OK')
+
+    def stop(self):
+        if not kill_pidfile(NATIVE_PID_FILE):
+            raise ProxyError('native proxy engine not running')
+        os.remove(NATIVE_PID_FILE)
+
+    def reload(self):
+        """the engine re-reads the config on SIGHUP, requests in flight are finished with the old one"""
+        if not self.running():
+            return self.run()
+        Proxy.run(self)
+        kill_pidfile(NATIVE_PID_FILE, signal.SIGHUP)
+        print('OK')
+
+
 class ProxyDocker(Proxy):
     def __init__(self, config):
         super(ProxyDocker, self).__init__(config)
+        self._inspected = None
+
+    @cached_property
+    def docker(self):
+        from docker_api import DockerClient
+        return DockerClient()
 
     def install(self):
         try:
-            subprocess.check_output('docker info', shell=True)
-        except subprocess.CalledProcessError:
-            raise ProxyError('Docker executable not found, make sure you have docker installed')
+            self.docker.ping()
+        except ProxyError as e:
+            raise ProxyError('%s, make sure you have docker installed and running' % e)
         try:
             print('pulling image')
-            subprocess.check_call('docker pull %s' % NGINX_DOCKER_IMAGE, shell=True)
+            self.docker.pull(NGINX_DOCKER_IMAGE)
             print('OK')
-        except subprocess.CalledProcessError:
-            print('LHC installation failed')
+        except ProxyError as e:
+            print('LHC installation failed: %s' % e)
             sys.exit(1)
 
+    def inspect(self):
+        """the container's inspect document ({} when not created), remembered until the container changes"""
+        if self._inspected is None:
+            self._inspected = self.docker.inspect(PROXY_CONTAINER_NAME) or {}
+        return self._inspected
+
     def status(self):
-        try:
-            return subprocess.check_output("docker container inspect %s -f '{{.State.Status}}'" % PROXY_CONTAINER_NAME,
-                                           shell=True, stderr=subprocess.PIPE).strip().lower()
-        except subprocess.CalledProcessError:
-            return
+        status = self.inspect().get('State', {}).get('Status')
+        return status and status.lower()
 
     def running(self):
         return self.status() == 'running'
 
+    def health(self):
+        health = self.inspect().get('State', {}).get('Health')
+        return health and health.get('Status')
+
     def get_ip(self):
+        info = self.inspect()
         if MAC and self.running():
             return MAC_ALIAS_IP
-        else:
-            try:
-                return subprocess.check_output(
-                    "docker container inspect %s -f '{{.NetworkSettings.Networks.bridge.IPAddress}}'" % PROXY_CONTAINER_NAME,
-                    shell=True, stderr=subprocess.PIPE).strip()
-            except subprocess.CalledProcessError:
-                return RuntimeError('proxy not running')
+        if not info:
+            return RuntimeError('proxy not running')
+        networks = (info.get('NetworkSettings') or {}).get('Networks') or {}
+        return (networks.get('bridge') or {}).get('IPAddress', '')
+
+    def container_config(self):
+        """the `POST /containers/create` body, only changed by re-creating the container"""
+        ports = (self.config.http_port, self.config.https_port)
+        # TODO
+        host_ip = MAC_ALIAS_IP if MAC else ''
+        return {
+            'Image': NGINX_DOCKER_IMAGE,
+            'ExposedPorts': dict(('%s/tcp' % p, {}) for p in ports),
+            'HostConfig': {
+                'Binds': [NGINX_CONF_FILE_PATH + ':/etc/nginx/nginx.conf'] +
+                         ['{0}:{0}'.format(p) for p in (self.config.cache_path, CONF_PATH, LOG_PATH)] +
+                         ['{0}:{0}'.format(p) for p in (self.config.hot_cache_path,) if p],
+                'PortBindings': dict(('%s/tcp' % p, [{'HostIp': host_ip, 'HostPort': str(p)}]) for p in ports),
+                'Ulimits': [{'Name': 'nofile', 'Soft': int(self.config.tuning_profile['worker_rlimit_nofile']),
+                             'Hard': int(self.config.tuning_profile['worker_rlimit_nofile'])}],
+                'Dns': [self.config.dns_resolver],
+                'RestartPolicy': {'Name': 'always'},
+            },
+        }
+
+    def container_config_digest(self):
+        return hashlib.sha1(json.dumps(self.container_config(), sort_keys=True)).hexdigest()
+
+    def container_label(self, label):
+        return ((self.inspect().get('Config') or {}).get('Labels') or {}).get(label)
 
     def run(self):
         super(ProxyDocker, self).run()
@@ -258,40 +407,63 @@ class ProxyDocker(Proxy):
         if status == 'running':
             raise ProxyError('Already Running')
         if status:
-            subprocess.check_call('docker rm -f ' + PROXY_CONTAINER_NAME, shell=True)
+            self._remove()
         self.dump_nginx_conf()
-        docker = find_executable('docker')
-        if not docker:
-            raise ProxyError('Need docker client executable')
-        cmd = [docker, 'run', '--name', PROXY_CONTAINER_NAME, '-d', '--restart', 'always',
-               '-v', NGINX_CONF_FILE_PATH + ':/etc/nginx/nginx.conf',
-               '-v', '{0}:{0}'.format(self.config.cache_path),
-               '-v', '{0}:{0}'.format(CONF_PATH),
-               '--dns', self.config.dns_resolver]
+        mkdirs(LOG_PATH)
+        config = self.container_config()
+        config['Labels'] = {CONFIG_DIGEST_LABEL: self.container_config_digest()}
         if MAC:
             print('configure port binding ip')
             subprocess.check_call('sudo ifconfig lo0 alias %s/24' % MAC_ALIAS_IP, shell=True)
-            # TODO
-            portmapping = ['-p', MAC_ALIAS_IP + ':{0}:{0}'.format(self.config.http_port),
-                           '-p', MAC_ALIAS_IP + ':{0}:{0}'.format(self.config.https_port)]
-        else:
-            portmapping = ['-p', '{0}:{0}'.format(self.config.http_port),
-                           '-p', '{0}:{0}'.format(self.config.https_port)]
-        cmd += portmapping
-        cmd += [NGINX_DOCKER_IMAGE]
         print('staring proxy container')
-        print(' '.join(cmd))
+        self._inspected = None
         try:
-            subprocess.check_call(cmd)
+            self.docker.create(PROXY_CONTAINER_NAME, config)
+            self.docker.start(PROXY_CONTAINER_NAME)
             print('OK')
-        except subprocess.CalledProcessError:
-            print('fail running proxy container')
+        except ProxyError as e:
+            print('fail running proxy container: %s' % e)
             sys.exit(1)
 
+    def _remove(self):
+        self._inspected = None
+        self.docker.remove(PROXY_CONTAINER_NAME, force=True)
+
     def stop(self):
         if not self.status():
             raise ProxyError('proxy container not created')
-        subprocess.check_call('docker rm -f ' + PROXY_CONTAINER_NAME, shell=True)
+        self._remove()
+
+    def reload(self):
+        """
+        validate the new nginx.conf with `nginx -t` in the running container and signal nginx to reload it,
+        the container is only re-created when its configuration (ports, volumes, dns, ...) changed
+        """
+        if not self.running():
+            return self.run()
+        if self.container_label(CONFIG_DIGEST_LABEL) != self.container_config_digest():
+            log.info('container configuration changed, re-creating proxy container')
+            self.stop()
+            return self.run()
+        Proxy.run(self)
+        conf = self._dumps_nginx_conf().encode('utf-8')
+        new = NGINX_CONF_FILE_PATH + '.new'
+        with open(new, 'wb') as f:
+            f.write(conf)
+        try:
+            # CONF_PATH is mounted at the same path in the container
+            code, output = self.docker.exec_run(PROXY_CONTAINER_NAME, ['nginx', '-t', '-q', '-c', new])
+        finally:
+            os.remove(new)
+        if code:
+            raise ProxyError('new nginx.conf is invalid, proxy not reloaded:\n' + output.strip())
+        # rewrite in place, the single file bind mount would keep showing the old inode after a rename
+        with open(NGINX_CONF_FILE_PATH, 'r+b') as f:
+            f.write(conf)
+            f.truncate()
+        mkdirs(LOG_PATH)
+        self.docker.kill(PROXY_CONTAINER_NAME, 'SIGHUP')
+        print('OK')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,159 @@
+# remove selected entries from a host's proxy_cache directory
+import fnmatch
+import logging
+import os
+import re
+from multiprocessing.pool import ThreadPool
+
+from cache_index import CacheIndex
+from cachefile import cache_file_path, is_cache_file_name, read_entry_at, slice_keys, url_variables, \
+    host_key_regex, CacheFileError
+from disk_usage import DEFAULT_WORKERS
+
+log = logging.getLogger('lhc')
+
+
+def url_keys(host, url):
+    """cache keys a url is stored under; both schemes are tried when the url does not name one"""
+    if '://' not in url:
+        url = host.name + '/' + url.lstrip('/')
+        schemes = ('http', 'https')
+    else:
+        schemes = (url.split('://', 1)[0],)
+        url = url.split('://', 1)[1]
+    keys = []
+    for scheme in schemes:
+        key = host.render_key(url_variables(scheme + '://' + url))
+        if key not in keys:
+            keys.append(key)
+    return keys
+
+
+def _unlink(path):
+    try:
+        size = os.path.getsize(path)
+        os.unlink(path)
+    except OSError:
+        return 0
+    return size
+
+
+def purge_urls(host, urls):
+    """returns [(key, bytes)] of the removed entries"""
+    removed = []
+    for url in urls:
+        keys = url_keys(host, url)
+        if host.slice_bytes:
+            keys = [k for key in keys for k in slice_keys(host.cache_path, key, host.slice_bytes)]
+        for key in keys:
+            size = _unlink(cache_file_path(host.cache_path, key))
+            if size:
+                removed.append((key, size))
+    return removed
+
+
+def key_matcher(glob=None, regex=None):
+    if glob:
+        return lambda key: fnmatch.fnmatchcase(key, glob)
+    reg = re.compile(regex)
+    return lambda key: reg.search(key) is not None
+
+
+def uncacheable_matcher(host):
+    """keys whose url does not have one of the extensions of host (anymore), for keys ending with $uri$is_args$args"""
+    return lambda key: not host.matcher.match(key.partition('?')[0])
+
+
+def _scan_job(args):
+    path, match = args
+    found = []
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return found
+    for name in names:
+        if not is_cache_file_name(name):
+            continue
+        fp = os.path.join(path, name)
+        try:
+            key = read_entry_at(fp).key
+        except (IOError, CacheFileError):
+            continue
+        if match(key):
+            found.append((fp, key))
+    return found
+
+
+def scan_keys(cache_path, match, workers=DEFAULT_WORKERS):
+    """read the header of every cache file, level-1 directories in parallel, yields (path, key) that match"""
+    if not os.path.isdir(cache_path):
+        return
+    jobs = [(os.path.join(cache_path, d), match) for d in os.listdir(cache_path)
+            if os.path.isdir(os.path.join(cache_path, d))]
+    if not jobs:
+        return
+    pool = ThreadPool(min(workers, len(jobs)))
+    try:
+        for found in pool.imap_unordered(_scan_job, jobs):
+            for item in found:
+                yield item
+    finally:
+        pool.close()
+        pool.join()
+
+
+def purge_hot(host, urls=None, glob=None, regex=None, match=None, workers=DEFAULT_WORKERS):
+    """
+    removes the copies of a host's entries from the hot tier: of urls / whose key matches glob, regex or the
+    predicate match / all of them when nothing is given. returns [(key, bytes)]
+    """
+    removed = []
+    for url in urls or ():
+        for key in url_keys(host, url):
+            size = _unlink(cache_file_path(host.hot_cache_path, key))
+            if size:
+                removed.append((key, size))
+    predicates = [p for p in ((glob or regex) and key_matcher(glob, regex), match) if p]
+    if urls and not predicates:
+        return removed
+    # the hot tier is small and shared by all hosts, it is scanned instead of indexed
+    own = re.compile(host_key_regex(host)).match
+    wanted = lambda key: own(key) is not None and (not predicates or any(p(key) for p in predicates))
+    for path, key in scan_keys(host.hot_cache_path, wanted, workers):
+        size = _unlink(path)
+        if size:
+            removed.append((key, size))
+    return removed
+
+
+def purge_matching(host, glob=None, regex=None, match=None, use_index=True, workers=DEFAULT_WORKERS):
+    """removes the entries whose key matches glob, regex or the predicate match, returns [(key, bytes)]"""
+    removed = []
+    if use_index:
+        index = CacheIndex.for_host(host)
+        try:
+            index.update()
+            if match:
+                rows = [row for row in index.query() if match(row[0])]
+            else:
+                rows = list(index.find(glob or regex, regex=not glob))
+            names = []
+            for key, _, _, _, _, name, d in rows:
+                size = _unlink(os.path.join(host.cache_path, d, name))
+                names.append(name)
+                if size:
+                    removed.append((key, size))
+            index.remove(names)
+        finally:
+            index.close()
+        return removed
+    match = match or key_matcher(glob, regex)
+    if host.shared:
+        # a shared zone holds the entries of other hosts as well, the index filters them by itself
+        own, wanted = re.compile(host_key_regex(host)).match, match
+        match = lambda key: own(key) is not None and wanted(key)
+    for path, key in scan_keys(host.cache_path, match, workers):
+        size = _unlink(path)
+        if size:
+            removed.append((key, size))
+    return removed
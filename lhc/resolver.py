@@ -0,0 +1,145 @@
+# minimal DNS client, used to reach origins that /etc/hosts points at the proxy itself
+import logging
+import random
+import socket
+import struct
+import threading
+import time
+
+from errors import LHCError
+
+log = logging.getLogger('lhc')
+
+QTYPE_A = 1
+QTYPE_CNAME = 5
+QCLASS_IN = 1
+
+DNS_HEADER = struct.Struct('!HHHHHH')
+DNS_RR = struct.Struct('!HHIH')
+
+
+class DNSError(LHCError):
+    pass
+
+
+def encode_name(name):
+    labels = [l for l in name.rstrip('.').split('.') if l]
+    return ''.join(chr(len(l)) + l for l in labels) + '\0'
+
+
+def decode_name(data, offset):
+    """returns (name, offset after the name), following compression pointers"""
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        if offset >= len(data):
+            raise DNSError('malformed dns message')
+        length = ord(data[offset])
+        if length & 0xc0 == 0xc0:
+            if end is None:
+                end = offset + 2
+            jumps += 1
+            if jumps > 64:
+                raise DNSError('dns compression loop')
+            offset = struct.unpack('!H', data[offset:offset + 2])[0] & 0x3fff
+            continue
+        offset += 1
+        if not length:
+            break
+        labels.append(data[offset:offset + length])
+        offset += length
+    return '.'.join(labels), end if end is not None else offset
+
+
+def build_query(name, qtype=QTYPE_A, qid=None):
+    qid = random.randint(0, 0xffff) if qid is None else qid
+    return DNS_HEADER.pack(qid, 0x0100, 1, 0, 0, 0) + encode_name(name) + struct.pack('!HH', qtype, QCLASS_IN)
+
+
+def parse_response(data):
+    """returns (id, rcode, [(name, type, ttl, rdata)]) of the answer section"""
+    if len(data) < DNS_HEADER.size:
+        raise DNSError('short dns message')
+    qid, flags, qdcount, ancount, _, _ = DNS_HEADER.unpack(data[:DNS_HEADER.size])
+    offset = DNS_HEADER.size
+    for _ in range(qdcount):
+        _, offset = decode_name(data, offset)
+        offset += 4
+    answers = []
+    for _ in range(ancount):
+        name, offset = decode_name(data, offset)
+        rtype, _, ttl, rdlength = DNS_RR.unpack(data[offset:offset + DNS_RR.size])
+        offset += DNS_RR.size
+        answers.append((name, rtype, ttl, data[offset:offset + rdlength]))
+        offset += rdlength
+    return qid, flags & 0xf, answers
+
+
+def recv_exact(sock, n):
+    data = ''
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise socket.error('connection closed')
+        data += chunk
+    return data
+
+
+def exchange(packet, server, timeout=2, port=53, tcp=False):
+    """send a dns message as is, returns the response with the same id"""
+    if tcp:
+        sock = socket.create_connection((server, port), timeout)
+        try:
+            sock.sendall(struct.pack('!H', len(packet)) + packet)
+            return recv_exact(sock, struct.unpack('!H', recv_exact(sock, 2))[0])
+        finally:
+            sock.close()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(timeout)
+    try:
+        sock.sendto(packet, (server, port))
+        while True:
+            data, _ = sock.recvfrom(65535)
+            if data[:2] == packet[:2]:
+                return data
+    finally:
+        sock.close()
+
+
+def query(name, server, qtype=QTYPE_A, timeout=2, port=53):
+    try:
+        return exchange(build_query(name, qtype), server, timeout, port)
+    except socket.error as e:
+        raise DNSError('query %s from %s failed: %s' % (name, server, e))
+
+
+class Resolver(object):
+    def __init__(self, min_ttl=30):
+        self.min_ttl = min_ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, name, server):
+        return random.choice(self.resolve_all(name, server))
+
+    def resolve_all(self, name, server):
+        """all the ipv4 addresses of name"""
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get((name, server))
+        if cached and cached[0] > now:
+            return cached[1]
+        ips, ttl, _ = self.lookup(name, server)
+        with self._lock:
+            self._cache[(name, server)] = (now + max(self.min_ttl, ttl), ips)
+        return ips
+
+    def lookup(self, name, server):
+        """(ipv4 addresses, shortest ttl of them, whether the answer went through a cname), not cached"""
+        _, rcode, answers = parse_response(query(name, server))
+        ips = [socket.inet_ntoa(rdata) for _, rtype, _, rdata in answers if rtype == QTYPE_A and len(rdata) == 4]
+        if rcode or not ips:
+            raise DNSError('can not resolve %s (rcode %s)' % (name, rcode))
+        ttl = min(ttl for _, rtype, ttl, _ in answers if rtype == QTYPE_A)
+        return ips, ttl, any(rtype == QTYPE_CNAME for _, rtype, _, _ in answers)
@@ -0,0 +1,395 @@
+# replay of access logs against simulated caches, to size cache_size_limit and cache_expire from real traffic.
+# nginx keeps a zone in LRU order: the cache manager removes what was not used within inactive and then the
+# least recently used files while the zone is over max_size. with that policy an object is still cached when
+# it was used within inactive and the objects used since, itself included, fit max_size: one pass computing
+# that byte distance answers every size and inactive window at once (Mattson's stack algorithm). other
+# policies have no such property and get one simulated cache per size
+import bisect
+import heapq
+import logging
+import zlib
+from collections import OrderedDict
+
+from access_log import iter_lines, parse, parse_time_local
+from errors import LHCError
+from utils import parse_size, parse_duration
+
+log = logging.getLogger('lhc')
+
+POLICIES = ('lru', 'lfu', 'gdsf')
+DEFAULT_SIZE_FACTORS = (0.125, 0.25, 0.5, 1, 2, 4, 8)
+DEFAULT_WINDOWS = '1h,1d,3d,7d,30d'
+# the window of caches without inactive
+NO_INACTIVE = 'off'
+# statuses of responses that are cached
+CACHED_STATUSES = (200, 206)
+MIN_POSITIONS = 1 << 16
+HASH_SPACE = 1 << 32
+
+
+class SimulateError(LHCError):
+    pass
+
+
+def parse_sizes(spec):
+    try:
+        sizes = sorted(set(parse_size(s.strip()) for s in spec.split(',') if s.strip()))
+    except ValueError as e:
+        raise SimulateError(str(e))
+    if not sizes or not sizes[0]:
+        raise SimulateError('sizes should be positive')
+    return sizes
+
+
+def parse_windows(spec):
+    """the inactive windows in seconds, off for none is inf"""
+    windows = set()
+    for w in spec.split(','):
+        w = w.strip()
+        if not w:
+            continue
+        try:
+            windows.add(float('inf') if w == NO_INACTIVE else parse_duration(w))
+        except ValueError as e:
+            raise SimulateError(str(e))
+    if not windows:
+        raise SimulateError('no inactive window')
+    return sorted(windows)
+
+
+def format_nginx_size(n):
+    for unit in ('t', 'g', 'm', 'k'):
+        scale = parse_size('1' + unit)
+        if n >= scale and not n % scale:
+            return '%d%s' % (n // scale, unit)
+    return '%dk' % -(-n // 1024) if n > 1024 else str(n)
+
+
+def format_duration(seconds):
+    if seconds == float('inf'):
+        return NO_INACTIVE
+    for unit, scale in (('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds >= scale and not seconds % scale:
+            return '%d%s' % (seconds // scale, unit)
+    return '%ds' % seconds
+
+
+class StackLRU(object):
+    """
+    nginx's LRU with inactive for all sizes and windows: hits are counted by the smallest size that holds
+    the object and every window it was used within; a fenwick tree over the recency positions sums the bytes
+    used since an object's last request
+    """
+
+    def __init__(self, sizes, windows):
+        self.sizes = sizes
+        self.windows = windows
+        self.hits = [[0] * len(sizes) for _ in windows]
+        self.hit_bytes = [[0] * len(sizes) for _ in windows]
+        # key: [position, size, time of the last request]
+        self.objects = {}
+        self._reset(MIN_POSITIONS)
+
+    def _reset(self, capacity):
+        self.capacity = capacity
+        self.tree = [0] * (capacity + 1)
+        self.next = 1
+        self.total = 0
+
+    def _after(self, position):
+        """bytes of the objects used after position"""
+        tree = self.tree
+        s = 0
+        while position:
+            s += tree[position]
+            position &= position - 1
+        return self.total - s
+
+    def _add(self, position, size):
+        tree, capacity = self.tree, self.capacity
+        while position <= capacity:
+            tree[position] += size
+            position += position & -position
+        self.total += size
+
+    def size_of(self, key):
+        obj = self.objects.get(key)
+        return obj[1] if obj else 0
+
+    def access(self, key, size, nbytes, now):
+        obj = self.objects.pop(key, None)
+        if obj is not None:
+            position, old_size, last = obj
+            i = bisect.bisect_left(self.sizes, self._after(position) + size)
+            if i < len(self.sizes):
+                for w in range(bisect.bisect_left(self.windows, now - last), len(self.windows)):
+                    self.hits[w][i] += 1
+                    self.hit_bytes[w][i] += nbytes
+            self._add(position, -old_size)
+        if self.next > self.capacity:
+            self._compact(now)
+        self._add(self.next, size)
+        self.objects[key] = [self.next, size, now]
+        self.next += 1
+
+    def _compact(self, now):
+        """
+        renumbers the positions, dropping the objects that are gone from every simulated cache: their next
+        request is a miss whether they are known or not, and only older objects counted their bytes
+        """
+        horizon = now - self.windows[-1]
+        live = sorted((obj for obj in self.objects.iteritems() if obj[1][2] >= horizon),
+                      key=lambda obj: obj[1][0], reverse=True)
+        used = 0
+        for n, (_, obj) in enumerate(live):
+            used += obj[1]
+            if used > self.sizes[-1]:
+                del live[n:]
+                break
+        live.reverse()
+        self.objects = dict(live)
+        self._reset(max(MIN_POSITIONS, len(live) * 2))
+        tree = self.tree
+        for position, (_, obj) in enumerate(live, 1):
+            obj[0] = position
+            tree[position] = obj[1]
+            self.total += obj[1]
+        # every node passes its sum on to its parent, the empty ones above the objects too
+        for position in xrange(1, self.capacity + 1):
+            parent = position + (position & -position)
+            if parent <= self.capacity:
+                tree[parent] += tree[position]
+        self.next = len(live) + 1
+
+    def curves(self):
+        """cumulative hits and hit bytes by window and size"""
+        def cumulate(row):
+            out, s = [], 0
+            for v in row:
+                s += v
+                out.append(s)
+            return out
+        return [cumulate(row) for row in self.hits], [cumulate(row) for row in self.hit_bytes]
+
+
+class HeapCache(object):
+    """one cache size of a policy removing the lowest priority first, outdated heap entries are skipped"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.used = 0
+        # key: [priority, size, requests]
+        self.entries = {}
+        self.heap = []
+        self.clock = 0.0
+        self.seq = 0
+
+    def priority(self, requests, size):
+        raise NotImplementedError
+
+    def access(self, key, size):
+        self.seq += 1
+        entry = self.entries.get(key)
+        hit = entry is not None
+        if hit:
+            entry[2] += 1
+            if size > entry[1]:
+                self.used += size - entry[1]
+                entry[1] = size
+        elif size > self.capacity:
+            return False
+        else:
+            entry = self.entries[key] = [None, size, 1]
+            self.used += size
+        entry[0] = self.priority(entry[2], entry[1])
+        heapq.heappush(self.heap, (entry[0], key))
+        self._evict()
+        return hit
+
+    def _evict(self):
+        heap, entries = self.heap, self.entries
+        while self.used > self.capacity:
+            priority, key = heapq.heappop(heap)
+            entry = entries.get(key)
+            if entry is None or entry[0] != priority:
+                continue
+            del entries[key]
+            self.used -= entry[1]
+            self.clock = priority[0]
+        if len(heap) > len(entries) * 4 + 1024:
+            self.heap = [(entry[0], key) for key, entry in entries.iteritems()]
+            heapq.heapify(self.heap)
+
+
+class LFUCache(HeapCache):
+    """the least requested since it was cached goes first, the least recent of those"""
+
+    def priority(self, requests, size):
+        return requests, self.seq
+
+
+class GDSFCache(HeapCache):
+    """greedy dual size frequency: requests per byte, aged by the priority of the last removed object"""
+
+    def priority(self, requests, size):
+        return self.clock + float(requests) / max(size, 1), self.seq
+
+
+CACHES = {'lfu': LFUCache, 'gdsf': GDSFCache}
+
+
+class Simulation(object):
+    """
+    replays the cacheable requests of a host's logs: GET with a 200 or 206 of the urls its extensions match,
+    an object is a uri with its arguments and as large as the largest body sent for it. with sample below 1
+    only that share of the uris is replayed and every cache shrunk by it (SHARDS spatial sampling), the
+    ratios stay close at a fraction of the memory and time
+    """
+
+    def __init__(self, host, sizes, windows, policies=('lru',), sample=1.0):
+        unknown = set(policies) - set(POLICIES)
+        if unknown:
+            raise SimulateError('unknown policies %s, should be some of %s' % (', '.join(unknown), ', '.join(POLICIES)))
+        if not 0 < sample <= 1:
+            raise SimulateError('sample should be in (0, 1]')
+        self.host = host
+        self.matcher = host.matcher
+        self.sizes = sizes
+        self.windows = windows
+        self.policies = [p for p in POLICIES if p in policies]
+        self.sample = sample
+        self.threshold = int(sample * HASH_SPACE)
+        scaled = [max(1, int(s * sample)) for s in sizes]
+        self.lru = StackLRU(scaled, windows)
+        self.caches = [(p, [CACHES[p](s) for s in scaled]) for p in self.policies if p != 'lru']
+        self.hits = dict((p, [0] * len(sizes)) for p, _ in self.caches)
+        self.hit_bytes = dict((p, [0] * len(sizes)) for p, _ in self.caches)
+        self.lines = self.unparsed = self.requests = self.bytes = 0
+        self.first = self.last = None
+        self._minute = self._minute_time = None
+
+    def feed(self, paths):
+        sampled = self.threshold < HASH_SPACE
+        for path in paths:
+            log.debug('replaying %s' % path)
+            for line in iter_lines(path):
+                self.lines += 1
+                if sampled:
+                    # the request is the first quoted field, skipped lines are not worth the regex
+                    request = line.split('"', 2)[1:2]
+                    if request:
+                        request = request[0].split(' ')
+                        if zlib.crc32(request[1] if len(request) > 1 else request[0]) & 0xffffffff >= self.threshold:
+                            continue
+                record = parse(line)
+                if record:
+                    self.add(record)
+                else:
+                    self.unparsed += 1
+        return self
+
+    def add(self, record):
+        if record.method != 'GET' or record.status not in CACHED_STATUSES:
+            return
+        key = record.uri
+        if not self.matcher.match(key.partition('?')[0]):
+            return
+        # the date is parsed once a minute, the seconds added to it
+        time_local = record.time_local
+        minute = time_local[:17] + time_local[20:]
+        if minute != self._minute:
+            self._minute, self._minute_time = minute, parse_time_local(time_local[:17] + ':00' + time_local[20:])
+        now = self._minute_time + int(time_local[18:20])
+        if self.first is None:
+            self.first = now
+        self.last = now
+        nbytes = record.body_bytes_sent
+        size = max(nbytes, self.lru.size_of(key))
+        self.requests += 1
+        self.bytes += nbytes
+        self.lru.access(key, size, nbytes, now)
+        for policy, caches in self.caches:
+            hits, hit_bytes = self.hits[policy], self.hit_bytes[policy]
+            for i, cache in enumerate(caches):
+                if cache.access(key, size):
+                    hits[i] += 1
+                    hit_bytes[i] += nbytes
+
+    def _ratios(self, hits, hit_bytes):
+        return ([round(float(h) / self.requests, 4) if self.requests else 0.0 for h in hits],
+                [round(float(b) / self.bytes, 4) if self.bytes else 0.0 for b in hit_bytes])
+
+    def curves(self):
+        """[(policy, window, hit ratios by size, byte hit ratios by size)], lru for every window"""
+        out = []
+        hits, hit_bytes = self.lru.curves()
+        for w, window in enumerate(self.windows):
+            out.append(('lru', window) + self._ratios(hits[w], hit_bytes[w]))
+        for policy, _ in self.caches:
+            out.append((policy, float('inf')) + self._ratios(self.hits[policy], self.hit_bytes[policy]))
+        return out
+
+    def recommend(self, target=0.95):
+        """
+        (size, window, hit ratio, byte hit ratio) of the smallest lru size, then shortest window, that reaches
+        target of the best byte hit ratio simulated, nginx needs an inactive
+        """
+        lru = [c for c in self.curves() if c[0] == 'lru' and c[1] != float('inf')] or \
+            [c for c in self.curves() if c[0] == 'lru']
+        best = max(max(c[3]) for c in lru)
+        for i, size in enumerate(self.sizes):
+            for _, window, ratios, byte_ratios in lru:
+                if byte_ratios[i] >= best * target:
+                    return size, window, ratios[i], byte_ratios[i]
+
+    def at(self, size, window):
+        """(hit ratio, byte hit ratio) of lru at a simulated size and window"""
+        i = self.sizes.index(size)
+        for policy, w, ratios, byte_ratios in self.curves():
+            if policy == 'lru' and w == window:
+                return ratios[i], byte_ratios[i]
+
+    def results(self, target=0.95):
+        host = self.host
+        size, window, ratio, byte_ratio = self.recommend(target)
+        current = (parse_size(host.cache_size_limit), parse_duration(host.cache_expire))
+        now = self.at(*current) if current[0] in self.sizes and current[1] in self.windows else (None, None)
+        return OrderedDict([
+            ('host', host.name),
+            ('lines', self.lines),
+            ('unparsed', self.unparsed),
+            ('requests', self.requests),
+            ('bytes', self.bytes),
+            ('sample', self.sample),
+            ('seconds', (self.last - self.first) if self.first is not None else 0),
+            ('sizes', [format_nginx_size(s) for s in self.sizes]),
+            ('curves', [OrderedDict([('policy', c[0]), ('inactive', format_duration(c[1])),
+                                     ('hit_ratio', c[2]), ('byte_hit_ratio', c[3])]) for c in self.curves()]),
+            ('current', OrderedDict([('cache_size_limit', host.cache_size_limit),
+                                     ('cache_expire', host.cache_expire),
+                                     ('hit_ratio', now[0]), ('byte_hit_ratio', now[1])])),
+            ('recommended', OrderedDict([('cache_size_limit', format_nginx_size(size)),
+                                         ('cache_expire', format_duration(window)),
+                                         ('hit_ratio', ratio), ('byte_hit_ratio', byte_ratio)])),
+        ])
+
+
+def simulate_host(host, paths, sizes=None, windows=None, policies=('lru',), sample=1.0, target=0.95):
+    """
+    the results of replaying paths for host, sizes default to fractions and multiples of its cache_size_limit
+    and the windows to a few from an hour to a month, its current cache_size_limit and cache_expire included
+    """
+    limit = parse_size(host.cache_size_limit)
+    sizes = parse_sizes(sizes) if sizes else [max(1, int(limit * f)) for f in DEFAULT_SIZE_FACTORS]
+    windows = parse_windows(windows or DEFAULT_WINDOWS)
+    sizes = sorted(set(sizes) | {limit})
+    windows = set(windows) | {parse_duration(host.cache_expire)}
+    if set(policies) - {'lru'}:
+        # the other policies have no inactive, lru without it is what they compare to
+        windows.add(float('inf'))
+    windows = sorted(windows)
+    sim = Simulation(host, sizes, windows, policies, sample)
+    sim.feed(paths)
+    if not sim.requests:
+        raise SimulateError('%s: no cacheable requests in %s' % (host.name, ', '.join(paths) or 'no log files'))
+    return sim.results(target)
@@ -0,0 +1,119 @@
+# nginx worker/connection/buffer settings derived from the machine the config is rendered on
+import multiprocessing
+import os
+import resource
+from collections import OrderedDict
+
+from errors import ConfigError
+
+MB = 1024 * 1024
+GB = 1024 * MB
+
+MAX_NOFILE = 1048576
+
+# every proxied request holds a client socket, an upstream socket and a cache file
+FDS_PER_CONNECTION = 3
+CONNECTION_MEMORY = 256 * 1024
+
+PROFILES = {
+    'small': OrderedDict([
+        ('worker_processes', 1),
+        ('worker_connections', 1024),
+        ('worker_rlimit_nofile', 4096),
+        ('open_file_cache', 1000),
+        ('reuseport', False),
+        ('proxy_buffer_size', '16k'),
+        ('proxy_buffers', '4 64k'),
+        ('proxy_busy_buffers_size', '128k'),
+        ('client_body_buffer_size', '512k'),
+        ('upstream_keepalive', 16),
+    ]),
+    'large': OrderedDict([
+        ('worker_processes', 'auto'),
+        ('worker_connections', 16384),
+        ('worker_rlimit_nofile', 65536),
+        ('open_file_cache', 100000),
+        ('reuseport', True),
+        ('proxy_buffer_size', '32k'),
+        ('proxy_buffers', '16 128k'),
+        ('proxy_busy_buffers_size', '256k'),
+        ('client_body_buffer_size', '1m'),
+        ('upstream_keepalive', 64),
+    ]),
+}
+TUNING_KEYS = tuple(PROFILES['small'])
+
+
+def detect():
+    """(cpu count, physical memory in bytes, hard limit of open files)"""
+    cpus = multiprocessing.cpu_count()
+    try:
+        mem = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError):
+        mem = 0
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or hard > MAX_NOFILE:
+        hard = MAX_NOFILE
+    return cpus, mem, hard
+
+
+def auto_profile(cpus, mem, nofile):
+    if mem >= 16 * GB:
+        buffers = ('32k', '16 128k', '256k', '1m')
+    elif mem >= 4 * GB:
+        buffers = ('16k', '8 64k', '128k', '512k')
+    else:
+        buffers = ('8k', '4 32k', '64k', '128k')
+    # proxied misses hold proxy_buffers while cache hits need none, allow half of the memory at this average
+    by_mem = mem // 2 // CONNECTION_MEMORY // cpus if mem else 1024
+    by_fds = nofile // FDS_PER_CONNECTION
+    connections = max(min(512, by_fds), min(65535, by_fds, by_mem))
+    return OrderedDict([
+        ('worker_processes', cpus),
+        ('worker_connections', connections),
+        ('worker_rlimit_nofile', min(nofile, max(connections * FDS_PER_CONNECTION, 4096))),
+        ('open_file_cache', max(1000, min(200000, mem // MB * 10))),
+        ('reuseport', cpus > 1),
+        ('proxy_buffer_size', buffers[0]),
+        ('proxy_buffers', buffers[1]),
+        ('proxy_busy_buffers_size', buffers[2]),
+        ('client_body_buffer_size', buffers[3]),
+        ('upstream_keepalive', 64 if mem >= 4 * GB else 16),
+    ])
+
+
+def _value(key, v):
+    if key == 'reuseport':
+        return v.lower() in ('y', 'yes', 'on', '1', 'true')
+    if key in ('worker_connections', 'worker_rlimit_nofile', 'open_file_cache', 'upstream_keepalive'):
+        return int(v)
+    if key == 'worker_processes' and v != 'auto':
+        return int(v)
+    return v
+
+
+def get_tuning(spec):
+    """
+    spec is a profile name (auto, small, large), optionally followed by explicit values:
+    `auto`, `large,worker_connections=8192` or `worker_processes=4,reuseport=off`
+    """
+    items = [i.strip() for i in (spec or 'auto').split(',') if i.strip()]
+    name = 'auto'
+    if items and '=' not in items[0]:
+        name = items.pop(0)
+    if name == 'auto':
+        tuning = auto_profile(*detect())
+    elif name in PROFILES:
+        tuning = OrderedDict(PROFILES[name])
+    else:
+        raise ConfigError("unknown tuning profile '%s', should be one of auto, %s" % (name, ', '.join(PROFILES)))
+    for item in items:
+        key, _, v = item.partition('=')
+        key = key.strip()
+        if key not in TUNING_KEYS:
+            raise ConfigError("unknown tuning key '%s', should be one of %s" % (key, ', '.join(TUNING_KEYS)))
+        try:
+            tuning[key] = _value(key, v.strip())
+        except ValueError:
+            raise ConfigError("invalid tuning value %s" % item)
+    return tuning
@@ -1,10 +1,10 @@
+import errno
 import os
 import re
+import signal
 import subprocess
 import sys
 
-import ipaddress
-
 
 def require_root():
     from consts import DEBUG
@@ -24,6 +24,8 @@ def is_valid_hostname(h):
 
 
 def is_valid_ip(ip):
+    import ipaddress
+
     try:
         ipaddress.ip_address(unicode(ip))
     except ValueError:
@@ -134,3 +136,101 @@ def s2b(s):
     if s in ('n', 'no', 'off', '0', 'false', 'f'):
         return False
     raise ValueError('Unknown flag %s' % s)
+
+
+SIZE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+SIZE_REG = re.compile(r'^\s*(\d+)\s*([kmgt]?)b?\s*$', flags=re.I)
+
+TIME_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400,
+              'M': 30 * 86400, 'y': 365 * 86400}
+TIME_REG = re.compile(r'(\d+)(ms|[smhdwMy]?)')
+
+
+def parse_size(s):
+    """parse nginx style size (e.g. 512k, 10g) into bytes"""
+    if isinstance(s, (int, long)):
+        return s
+    m = SIZE_REG.match(s)
+    if not m:
+        raise ValueError('invalid size %s' % s)
+    return int(m.group(1)) * SIZE_UNITS[m.group(2).lower()]
+
+
+def parse_duration(s):
+    """parse nginx style time (e.g. 3d, 1h30m) into seconds"""
+    if isinstance(s, (int, long, float)):
+        return s
+    s = s.strip()
+    if not s or TIME_REG.sub('', s).strip():
+        raise ValueError('invalid time %s' % s)
+    return sum(int(n) * TIME_UNITS[u or 's'] for n, u in TIME_REG.findall(s))
+
+
+def read_pidfile(path):
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (IOError, ValueError):
+        return
+
+
+def pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def spawn_daemon(args, pidfile, logfile=os.devnull):
+    """start args as a detached background process and record its pid"""
+    mkdirs(os.path.dirname(pidfile))
+    if logfile != os.devnull:
+        mkdirs(os.path.dirname(logfile))
+    with open(os.devnull) as stdin, open(logfile, 'ab') as out:
+        p = subprocess.Popen(args, stdin=stdin, stdout=out, stderr=out, close_fds=True, preexec_fn=os.setsid)
+    with open(pidfile, 'wb') as f:
+        f.write(str(p.pid))
+    return p.pid
+
+
+def kill_pidfile(path, sig=signal.SIGTERM):
+    pid = read_pidfile(path)
+    if not pid_alive(pid):
+        return False
+    os.kill(pid, sig)
+    return True
+
+
+try:  # pysendfile on python 2
+    from sendfile import sendfile as _sendfile
+except ImportError:
+    _sendfile = getattr(os, 'sendfile', None)
+
+
+def sendfile(sock, f, offset, count, bufsize=64 * 1024):
+    """send count bytes of file f from offset to sock, zero-copy when the platform allows it"""
+    import ssl
+
+    if _sendfile and not isinstance(sock, ssl.SSLSocket):
+        while count > 0:
+            try:
+                sent = _sendfile(sock.fileno(), f.fileno(), offset, count)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    continue
+                raise
+            if not sent:
+                break
+            offset += sent
+            count -= sent
+        return
+    f.seek(offset)
+    while count > 0:
+        buf = f.read(min(bufsize, count))
+        if not buf:
+            break
+        sock.sendall(buf)
+        count -= len(buf)
@@ -0,0 +1,140 @@
+# pre-populate the cache by fetching urls through the running proxy
+import httplib
+import logging
+import socket
+import ssl
+import threading
+import time
+import urlparse
+from multiprocessing.pool import ThreadPool
+
+from access_log import CACHE_SERVED
+
+log = logging.getLogger('lhc')
+
+CHUNK_SIZE = 256 * 1024
+TIMEOUT = 300
+
+
+class RateLimiter(object):
+    """token bucket allowing `rate` requests per second"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.time()
+            wait = self.next - now
+            self.next = max(now, self.next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class ProxyHTTPSConnection(httplib.HTTPSConnection):
+    # the proxy presents certs signed by the LHC CA for the host name, not for its ip
+    context = ssl._create_unverified_context()
+
+    def __init__(self, ip, port, server_name, timeout=TIMEOUT):
+        httplib.HTTPSConnection.__init__(self, ip, port, timeout=timeout)
+        self.server_name = server_name
+
+    def connect(self):
+        sock = socket.create_connection((self.host, self.port), self.timeout)
+        self.sock = self.context.wrap_socket(sock, server_hostname=self.server_name)
+
+
+class Warmer(object):
+    def __init__(self, config, concurrency=8, rate=None, proxy_ip=None):
+        self.config = config
+        self.concurrency = concurrency
+        self.rate = rate
+        self.proxy_ip = proxy_ip
+        self.limiters = {}
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.counts = {'hit': 0, 'miss': 0, 'skip': 0, 'error': 0}
+        self.bytes = 0
+
+    def _limiter(self, name):
+        with self.lock:
+            if name not in self.limiters:
+                self.limiters[name] = RateLimiter(self.rate)
+            return self.limiters[name]
+
+    def cacheable(self, host, path):
+        return host.matcher.match(path)
+
+    def _connection(self, scheme, host):
+        conns = self.local.__dict__.setdefault('conns', {})
+        conn = conns.get((scheme, host.name))
+        if conn is None:
+            ip = self.proxy_ip or host.proxy_ip
+            if scheme == 'https':
+                conn = ProxyHTTPSConnection(ip, int(self.config.https_port), host.name)
+            else:
+                conn = httplib.HTTPConnection(ip, int(self.config.http_port), timeout=TIMEOUT)
+            conns[(scheme, host.name)] = conn
+        return conn
+
+    def _request(self, method, scheme, host, path):
+        conn = self._connection(scheme, host)
+        for retry in (True, False):
+            try:
+                conn.request(method, path, headers={'Host': host.name})
+                return conn.getresponse()
+            except (socket.error, httplib.HTTPException):
+                # the proxy closed an idle keep-alive connection
+                conn.close()
+                if not retry:
+                    raise
+
+    def warm(self, url):
+        """returns (url, result, bytes) where result is one of hit/miss/skip/error"""
+        url = url.strip()
+        u = urlparse.urlsplit(url if '://' in url else 'http://' + url)
+        host = self.config.hosts.get((u.hostname or '').lower())
+        path = (u.path or '/') + ('?' + u.query if u.query else '')
+        if not host:
+            log.warn('skip %s: host not configured' % url)
+            return url, 'skip', 0
+        if not self.cacheable(host, u.path):
+            log.warn('skip %s: extension not cached for %s' % (url, host.name))
+            return url, 'skip', 0
+        if self.rate:
+            self._limiter(host.name).acquire()
+        try:
+            resp = self._request('HEAD', u.scheme, host, path)
+            resp.read()
+            # HOT is a hit of the hot tier in front of the disk zone
+            if resp.getheader('Nginx-Cache') in CACHE_SERVED:
+                return url, 'hit', 0
+            resp = self._request('GET', u.scheme, host, path)
+            received = 0
+            while True:
+                chunk = resp.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                received += len(chunk)
+            if resp.status != 200:
+                log.warn('%s: %s %s' % (url, resp.status, resp.reason))
+                return url, 'error', received
+            return url, 'miss', received
+        except (socket.error, httplib.HTTPException) as e:
+            log.error('%s: %s' % (url, e))
+            return url, 'error', 0
+
+    def run(self, urls):
+        start = time.time()
+        pool = ThreadPool(self.concurrency)
+        try:
+            for url, result, received in pool.imap_unordered(self.warm, (u for u in urls if u.strip())):
+                log.debug('%s %s %s' % (result.upper(), received, url))
+                self.counts[result] += 1
+                self.bytes += received
+        finally:
+            pool.close()
+            pool.join()
+        return time.time() - start
@@ -0,0 +1,49 @@
+import os
+import struct
+import sys
+import unittest
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lhc'))
+
+from cachefile import HEADER_STRUCT, pack_header, read_entry  # noqa: E402
+
+# offsets in ngx_http_file_cache_header_t of nginx on 64-bit platforms: six 8-byte fields before crc32,
+# then valid_msec, header_start and body_start; the KEY line of every nginx cache file starts at 336
+CRC32_OFFSET = 48
+HEADER_START_OFFSET = 54
+NGX_HEADER_SIZE = 336
+
+# the check value of crc-32, what ngx_crc32_short and ngx_crc32_long give for this key
+CHECK_KEY = '123456789'
+CHECK_CRC32 = 0xcbf43926
+
+
+class PackHeaderTest(unittest.TestCase):
+    raw_headers = 'HTTP/1.1 200 OK\r\nContent-Length: 4\r\n\r\n'
+
+    def test_layout_is_the_one_of_nginx(self):
+        self.assertEqual(HEADER_STRUCT.size, NGX_HEADER_SIZE)
+        data = pack_header('example.com/a.rpm', self.raw_headers, 100, 50)
+        self.assertEqual(data[NGX_HEADER_SIZE:NGX_HEADER_SIZE + 6], '\nKEY: ')
+        header_start, = struct.unpack_from('<H', data, HEADER_START_OFFSET)
+        self.assertEqual(data[header_start:], self.raw_headers)
+
+    def test_crc32_of_the_key(self):
+        # nginx compares it with the crc32 of the key it looks up, a mismatch is an md5 collision, a miss
+        data = pack_header(CHECK_KEY, self.raw_headers, 100, 50)
+        self.assertEqual(struct.unpack_from('<I', data, CRC32_OFFSET)[0], CHECK_CRC32)
+        # zlib.crc32 of this key is negative on python 2
+        data = pack_header('example.com/pub/4.rpm', self.raw_headers, 100, 50)
+        self.assertEqual(struct.unpack_from('<I', data, CRC32_OFFSET)[0], 0xb5a4923d)
+
+    def test_round_trip(self):
+        data = pack_header('example.com/a.rpm', self.raw_headers, 100, 50, last_modified=20, etag='"x"')
+        entry = read_entry(StringIO(data + 'body'))
+        self.assertEqual((entry.key, entry.status, entry.reason), ('example.com/a.rpm', 200, 'OK'))
+        self.assertEqual((entry.valid_sec, entry.date, entry.last_modified), (100, 50, 20))
+        self.assertEqual((data + 'body')[entry.body_start:], 'body')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+import BaseHTTPServer
+import SocketServer
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+import urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lhc'))
+
+from docker_api import API_VERSION, DockerClient, DockerError  # noqa: E402
+
+
+class FakeEngineHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """answers from the canned responses of the server, in order, and records every request"""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+            self.connection_number = self.server.connections
+
+    def handle_one_request(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.handle_one_request(self)
+        if self.server.close_after_response:
+            self.close_connection = 1
+
+    def _respond(self):
+        url = urlparse.urlparse(self.path)
+        length = int(self.headers.getheader('Content-Length') or 0)
+        body = self.rfile.read(length) if length else ''
+        self.server.requests.append((self.command, url.path, dict(urlparse.parse_qsl(url.query)),
+                                     json.loads(body) if body else None, self.connection_number))
+        status, payload = self.server.responses.pop(0)
+        raw = payload if isinstance(payload, str) else json.dumps(payload)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    do_GET = do_POST = do_DELETE = _respond
+
+    def address_string(self):
+        return 'unix'
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeEngine(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        SocketServer.UnixStreamServer.__init__(self, path, FakeEngineHandler)
+        self.responses = []
+        self.requests = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.close_after_response = False
+
+
+class DockerClientTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='lhc-test-')
+        self.sock_path = os.path.join(self.tmp, 'docker.sock')
+        self.engine = FakeEngine(self.sock_path)
+        thread = threading.Thread(target=self.engine.serve_forever, args=(0.05,))
+        thread.daemon = True
+        thread.start()
+        self.client = DockerClient(self.sock_path, timeout=5)
+
+    def tearDown(self):
+        self.client.close()
+        self.engine.shutdown()
+        self.engine.server_close()
+        shutil.rmtree(self.tmp)
+
+    def reply(self, *responses):
+        self.engine.responses.extend(responses)
+
+    def paths(self):
+        return [(method, path) for method, path, _, _, _ in self.engine.requests]
+
+    def test_inspect(self):
+        self.reply((200, {'Id': 'abc', 'State': {'Running': True}}))
+        doc = self.client.inspect('lhc-proxy')
+        self.assertEqual(doc['Id'], 'abc')
+        self.assertEqual(self.paths(), [('GET', '/%s/containers/lhc-proxy/json' % API_VERSION)])
+
+    def test_inspect_missing(self):
+        self.reply((404, {'message': 'No such container: lhc-proxy'}))
+        self.assertIsNone(self.client.inspect('lhc-proxy'))
+
+    def test_inspect_error(self):
+        self.reply((500, {'message': 'server error'}))
+        with self.assertRaises(DockerError) as ctx:
+            self.client.inspect('lhc-proxy')
+        self.assertEqual(ctx.exception.status, 500)
+        self.assertEqual(str(ctx.exception), 'server error')
+
+    def test_create(self):
+        self.reply((201, {'Id': 'abc', 'Warnings': None}))
+        config = {'Image': 'nginx:1.25', 'Labels': {'lhc': '1'}}
+        self.assertEqual(self.client.create('lhc-proxy', config), 'abc')
+        method, path, params, body, _ = self.engine.requests[0]
+        self.assertEqual((method, path), ('POST', '/%s/containers/create' % API_VERSION))
+        self.assertEqual(params, {'name': 'lhc-proxy'})
+        self.assertEqual(body, config)
+
+    def test_create_pulls_missing_image(self):
+        self.reply((404, {'message': 'No such image: nginx:1.25'}),
+                   (200, '{"status":"Pulling from library/nginx"}\r\n{"status":"Download complete"}\r\n'),
+                   (201, {'Id': 'abc'}))
+        self.assertEqual(self.client.create('lhc-proxy', {'Image': 'nginx:1.25'}), 'abc')
+        self.assertEqual(self.paths(), [('POST', '/%s/containers/create' % API_VERSION),
+                                        ('POST', '/%s/images/create' % API_VERSION),
+                                        ('POST', '/%s/containers/create' % API_VERSION)])
+        self.assertEqual(self.engine.requests[1][2], {'fromImage': 'nginx', 'tag': '1.25'})
+
+    def test_create_pull_failure(self):
+        self.reply((404, {'message': 'No such image: nginx:nope'}),
+                   (200, '{"status":"Pulling"}\r\n{"error":"manifest unknown"}\r\n'))
+        with self.assertRaises(DockerError) as ctx:
+            self.client.create('lhc-proxy', {'Image': 'nginx:nope'})
+        self.assertIn('manifest unknown', str(ctx.exception))
+
+    def test_kill(self):
+        self.reply((204, ''))
+        self.client.kill('lhc-proxy', 'SIGHUP')
+        method, path, params, body, _ = self.engine.requests[0]
+        self.assertEqual((method, path), ('POST', '/%s/containers/lhc-proxy/kill' % API_VERSION))
+        self.assertEqual(params, {'signal': 'SIGHUP'})
+        self.assertIsNone(body)
+
+    def test_kill_not_running(self):
+        self.reply((409, {'message': 'Container abc is not running'}))
+        with self.assertRaises(DockerError) as ctx:
+            self.client.kill('lhc-proxy')
+        self.assertEqual(ctx.exception.status, 409)
+        self.assertEqual(self.engine.requests[0][2], {'signal': 'SIGKILL'})
+
+    def test_exec_run(self):
+        self.reply((201, {'Id': 'e1'}),
+                   (200, 'nginx: configuration file /tmp/x test failed\r\n'),
+                   (200, {'ExitCode': 1, 'Running': False}))
+        code, output = self.client.exec_run('lhc-proxy', ['nginx', '-t', '-q', '-c', '/tmp/x'])
+        self.assertEqual(code, 1)
+        self.assertIn('test failed', output)
+        self.assertEqual(self.paths(), [('POST', '/%s/containers/lhc-proxy/exec' % API_VERSION),
+                                        ('POST', '/%s/exec/e1/start' % API_VERSION),
+                                        ('GET', '/%s/exec/e1/json' % API_VERSION)])
+        self.assertEqual(self.engine.requests[0][3]['Cmd'], ['nginx', '-t', '-q', '-c', '/tmp/x'])
+        self.assertEqual(self.engine.requests[1][3], {'Detach': False, 'Tty': True})
+
+    def test_keep_alive(self):
+        self.reply((200, {'Id': 'a'}), (204, ''), (200, {'Id': 'a'}))
+        self.client.inspect('lhc-proxy')
+        self.client.kill('lhc-proxy', 'SIGHUP')
+        self.client.inspect('lhc-proxy')
+        self.assertEqual([r[4] for r in self.engine.requests], [1, 1, 1])
+
+    def test_reconnects_after_engine_closed_connection(self):
+        self.engine.close_after_response = True
+        self.reply((200, {'Id': 'a'}), (200, {'Id': 'b'}))
+        self.assertEqual(self.client.inspect('lhc-proxy')['Id'], 'a')
+        self.assertEqual(self.client.inspect('lhc-proxy')['Id'], 'b')
+        self.assertEqual([r[4] for r in self.engine.requests], [1, 2])
+
+    def test_no_engine(self):
+        client = DockerClient(os.path.join(self.tmp, 'missing.sock'), timeout=1)
+        with self.assertRaises(DockerError) as ctx:
+            client.ping()
+        self.assertIsNone(ctx.exception.status)
+
+
+if __name__ == '__main__':
+    unittest.main()
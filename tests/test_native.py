@@ -0,0 +1,115 @@
+import BaseHTTPServer
+import SocketServer
+import httplib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lhc'))
+
+from bench import free_port  # noqa: E402
+from cachefile import cache_file_path, read_entry_at  # noqa: E402
+from configuration import Config, Host  # noqa: E402
+from native import NativeEngine, ThreadingHTTPServer, CachingHandler  # noqa: E402
+
+HOST = 'example.com'
+ORIGIN_IP = '127.0.0.1'
+ENGINE_IP = '127.0.0.2'
+BODY = 'x' * 5000
+
+
+class ChunkedOriginHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """sends BODY chunked, /cut/ paths stop in the middle of the body and close the connection"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        half = len(BODY) / 2
+        self.wfile.write('%x\r\n%s\r\n' % (half, BODY[:half]))
+        if self.path.startswith('/cut/'):
+            self.wfile.write('%x\r\n%s' % (half, BODY[half:half + 100]))
+            self.close_connection = 1
+            return
+        self.wfile.write('%x\r\n%s\r\n0\r\n\r\n' % (len(BODY) - half, BODY[half:]))
+
+    def log_message(self, *args):
+        pass
+
+
+class Origin(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class TestEngine(NativeEngine):
+    def __init__(self, config):
+        super(TestEngine, self).__init__(config)
+        self.resolver.resolve = lambda name, server: ORIGIN_IP
+
+    def access_log(self, host, line):
+        pass
+
+
+class RelayTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='lhc-test-')
+        port = free_port([ORIGIN_IP, ENGINE_IP])
+        self.origin = Origin((ORIGIN_IP, port), ChunkedOriginHandler)
+        config = Config(extensions='rpm', cache_path=os.path.join(self.tmp, 'cache'), cache_size_limit='1g',
+                        cache_expire='1d', cache_key='$host$uri$is_args$args', mode='native', proxy_ip=ENGINE_IP,
+                        dns_resolver=ORIGIN_IP, ssl=False)
+        self.host = config.hosts[HOST] = Host(HOST, g=config)
+        CachingHandler.log_message = lambda *args: None
+        self.engine = ThreadingHTTPServer(TestEngine(config), (ENGINE_IP, port), 'http')
+        self.servers = [self.engine, self.origin]
+        for server in self.servers:
+            t = threading.Thread(target=server.serve_forever, args=(0.05,))
+            t.daemon = True
+            t.start()
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.engine.engine.origin_pool.close()
+        shutil.rmtree(self.tmp)
+
+    def get(self, path):
+        conn = httplib.HTTPConnection(ENGINE_IP, self.engine.server_port, timeout=10)
+        try:
+            conn.request('GET', path, headers={'Host': HOST})
+            resp = conn.getresponse()
+            try:
+                return resp.read()
+            except httplib.IncompleteRead as e:
+                return e.partial
+        finally:
+            conn.close()
+
+    def cache_file(self, path):
+        return cache_file_path(self.host.cache_path, HOST + path)
+
+    def cached_files(self):
+        return [name for _, _, names in os.walk(self.host.cache_path) for name in names]
+
+    def test_chunked_body_is_cached(self):
+        self.assertEqual(self.get('/pub/a.rpm'), BODY)
+        with open(self.cache_file('/pub/a.rpm'), 'rb') as f:
+            data = f.read()
+        self.assertEqual(data[read_entry_at(self.cache_file('/pub/a.rpm')).body_start:], BODY)
+
+    def test_body_cut_off_by_the_origin_is_not_cached(self):
+        self.assertNotEqual(self.get('/cut/a.rpm'), BODY)
+        self.assertFalse(os.path.exists(self.cache_file('/cut/a.rpm')))
+        # nor is the temporary file left behind
+        self.assertEqual(self.cached_files(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lhc'))
+
+import nginx_conf  # noqa: E402
+from configuration import Config, Host  # noqa: E402
+
+VAR_REG = re.compile(r'\$(\w+)')
+
+
+def render(config):
+    resolve_upstreams = nginx_conf.resolve_upstreams
+    nginx_conf.resolve_upstreams = lambda config: {}
+    try:
+        return nginx_conf.get_nginx_conf(config)
+    finally:
+        nginx_conf.resolve_upstreams = resolve_upstreams
+
+
+def nginx_map(conf, variable):
+    """(source, [(pattern, value)]) of the map block defining variable"""
+    lines = [line.strip() for line in conf.splitlines()]
+    start = [i for i, line in enumerate(lines) if line.startswith('map ') and line.endswith(' %s {' % variable)][0]
+    source = lines[start].split()[1].strip('"')
+    entries = []
+    for line in lines[start + 1:lines.index('}', start)]:
+        pattern, value = line.rstrip(';').split(None, 1)
+        entries.append((pattern, value))
+    return source, entries
+
+
+def evaluate(conf, variable, variables):
+    """what nginx gives for the map of variable: exact strings first, then the regexes in order"""
+    source, entries = nginx_map(conf, variable)
+    value = VAR_REG.sub(lambda m: variables.get(m.group(1), ''), source)
+    exact = dict(e for e in entries if not e[0].startswith('~'))
+    if value in exact:
+        return exact[value]
+    for pattern, result in entries:
+        if pattern.startswith('~'):
+            # named groups are written the pcre way
+            m = re.search(pattern[1:].replace('(?<', '(?P<'), value)
+            if m:
+                groups = dict(variables, **m.groupdict())
+                return VAR_REG.sub(lambda v: groups.get(v.group(1), ''), result)
+    return VAR_REG.sub(lambda m: variables.get(m.group(1), ''), exact['default'])
+
+
+class HotTierStatusTest(unittest.TestCase):
+    def setUp(self):
+        config = Config(extensions='rpm', cache_path='/tmp/lhc-test-cache', cache_size_limit='1g',
+                        cache_expire='1d', cache_key='$host$uri$is_args$args', mode='docker',
+                        dns_resolver='127.0.0.1', ssl=False, hot_cache_path='/tmp/lhc-test-hot',
+                        hot_cache_size_limit='1g', hot_max_object_size='1m')
+        config.hosts['hot.org'] = Host('hot.org', g=config)
+        # slices are never kept in the hot tier
+        config.hosts['plain.org'] = Host('plain.org', g=config, slice_size='1m')
+        self.conf = render(config)
+
+    def status(self, upstream_cache_status, disk_status='', tier=None):
+        variables = {'upstream_cache_status': upstream_cache_status, 'upstream_http_x_lhc_disk': disk_status}
+        variables['lhc_tier'] = tier or evaluate(self.conf, '$lhc_tier', {})
+        return evaluate(self.conf, '$lhc_cache_status', variables)
+
+    def test_hit_of_a_host_without_hot_tier_stays_hit(self):
+        self.assertEqual(self.status('HIT'), 'HIT')
+        self.assertEqual(self.status('MISS'), 'MISS')
+
+    def test_hit_of_the_hot_tier_is_hot(self):
+        self.assertEqual(self.status('HIT', tier='hot'), 'HOT')
+
+    def test_miss_of_the_hot_tier_is_the_status_of_the_disk_tier(self):
+        self.assertEqual(self.status('MISS', 'HIT', tier='hot'), 'HIT')
+        self.assertEqual(self.status('MISS', 'MISS', tier='hot'), 'MISS')
+
+    def test_only_the_hot_tier_sets_the_tier(self):
+        lines = [line.strip() for line in self.conf.splitlines()]
+        sets = [i for i, line in enumerate(lines) if line == 'set $lhc_tier hot;']
+        self.assertTrue(sets)
+        for i in sets:
+            location = [line for line in reversed(lines[:i]) if line.startswith('location ')][0]
+            self.assertTrue(location.startswith('location @lhc_hot_'), location)
+            self.assertIn('proxy_cache               cache_hot;', lines[i:lines.index('}', i)])
+
+
+if __name__ == '__main__':
+    unittest.main()
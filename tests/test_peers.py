@@ -0,0 +1,194 @@
+import BaseHTTPServer
+import SocketServer
+import httplib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lhc'))
+
+import nginx_conf  # noqa: E402
+from bench import free_port  # noqa: E402
+from configuration import Config, Host  # noqa: E402
+from native import NativeEngine, ThreadingHTTPServer, CachingHandler  # noqa: E402
+from peers import PEER_HEADER, Peer, parse_peers, rank  # noqa: E402
+
+URLS = ['example.com/pub/%d.rpm' % i for i in range(3000)]
+HOST = 'example.com'
+ORIGIN_IP = '127.0.0.1'
+ENGINE_IP = '127.0.0.2'
+
+
+def owners(peers):
+    return dict((url, rank(peers, url)[0]) for url in URLS)
+
+
+class RankTest(unittest.TestCase):
+    peers = parse_peers('10.0.0.1,10.0.0.2:8080,10.0.0.3,10.0.0.4')
+
+    def test_same_order_on_every_node(self):
+        shuffled = [self.peers[2], self.peers[0], self.peers[3], self.peers[1]]
+        for url in URLS[:100]:
+            self.assertEqual(rank(self.peers, url), rank(shuffled, url))
+
+    def test_urls_spread_over_peers(self):
+        counts = {}
+        for peer in owners(self.peers).values():
+            counts[peer] = counts.get(peer, 0) + 1
+        self.assertEqual(set(counts), set(self.peers))
+        for n in counts.values():
+            self.assertTrue(abs(n - len(URLS) / 4.0) < len(URLS) * 0.05, counts)
+
+    def test_added_peer_only_takes_urls(self):
+        before = owners(self.peers)
+        added = Peer('10.0.0.5', 80, 443)
+        after = owners(self.peers + [added])
+        moved = [url for url in URLS if after[url] != before[url]]
+        self.assertTrue(all(after[url] == added for url in moved))
+        self.assertTrue(abs(len(moved) - len(URLS) / 5.0) < len(URLS) * 0.05, len(moved))
+
+    def test_removed_peer_only_gives_its_urls(self):
+        before = owners(self.peers)
+        removed = self.peers[1]
+        after = owners([p for p in self.peers if p != removed])
+        for url in URLS:
+            if before[url] == removed:
+                # what it had goes to the peer ranked next for the url
+                self.assertEqual(after[url], rank(self.peers, url)[1])
+            else:
+                self.assertEqual(after[url], before[url])
+
+    def test_ports_are_part_of_a_peer(self):
+        other_port = [Peer(p.address, p.http_port + 1, p.https_port) for p in self.peers]
+        self.assertNotEqual([rank(self.peers, url)[0].address for url in URLS[:200]],
+                            [rank(other_port, url)[0].address for url in URLS[:200]])
+
+
+class RecordingHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        body = 'from %s' % self.server.name
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RecordingServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, name):
+        BaseHTTPServer.HTTPServer.__init__(self, address, RecordingHandler)
+        self.name = name
+        self.requests = []
+
+
+class TestEngine(NativeEngine):
+    def __init__(self, config):
+        super(TestEngine, self).__init__(config)
+        self.resolver.resolve = lambda name, server: ORIGIN_IP
+
+    def access_log(self, host, line):
+        pass
+
+
+class PeerLoopTest(unittest.TestCase):
+    """a native engine with one peer: misses go to the peer, unless the request came from a peer"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix='lhc-test-')
+        port = free_port([ORIGIN_IP, ENGINE_IP])
+        self.origin = RecordingServer((ORIGIN_IP, port), 'origin')
+        self.peer = RecordingServer((ORIGIN_IP, 0), 'peer')
+        peer_spec = '%s:%d:%d' % (ORIGIN_IP, self.peer.server_port, free_port([ORIGIN_IP]))
+        config = Config(extensions='rpm', cache_path=os.path.join(self.tmp, 'cache'), cache_size_limit='1g',
+                        cache_expire='1d', cache_key='$host$uri$is_args$args', mode='native', proxy_ip=ENGINE_IP,
+                        dns_resolver=ORIGIN_IP, ssl=False, peers=peer_spec)
+        config.hosts[HOST] = Host(HOST, g=config)
+        CachingHandler.log_message = lambda *args: None
+        self.engine = ThreadingHTTPServer(TestEngine(config), (ENGINE_IP, port), 'http')
+        self.servers = [self.engine, self.origin, self.peer]
+        for server in self.servers:
+            t = threading.Thread(target=server.serve_forever, args=(0.05,))
+            t.daemon = True
+            t.start()
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+            if server is self.engine:
+                # lets the handlers of the pooled keep-alive connections end
+                server.engine.origin_pool.close()
+        shutil.rmtree(self.tmp)
+
+    def get(self, path, headers=None):
+        conn = httplib.HTTPConnection(ENGINE_IP, self.engine.server_port, timeout=10)
+        try:
+            h = {'Host': HOST}
+            h.update(headers or {})
+            conn.request('GET', path, headers=h)
+            resp = conn.getresponse()
+            return resp.status, resp.read()
+        finally:
+            conn.close()
+
+    def test_miss_is_asked_from_the_peer(self):
+        self.assertEqual(self.get('/pub/a.rpm'), (200, 'from peer'))
+        self.assertEqual(self.origin.requests, [])
+        path, headers = self.peer.requests[0]
+        self.assertEqual(path, '/pub/a.rpm')
+        self.assertTrue(headers.get(PEER_HEADER.lower()))
+
+    def test_request_from_a_peer_is_never_forwarded(self):
+        self.assertEqual(self.get('/pub/b.rpm', {PEER_HEADER: 'other-node'}), (200, 'from origin'))
+        self.assertEqual(self.peer.requests, [])
+        path, headers = self.origin.requests[0]
+        self.assertEqual(path, '/pub/b.rpm')
+        # the origin does not see the header either
+        self.assertNotIn(PEER_HEADER.lower(), headers)
+
+    def test_uncacheable_requests_skip_the_peer(self):
+        self.assertEqual(self.get('/index.html'), (200, 'from origin'))
+        self.assertEqual(self.peer.requests, [])
+
+
+class NginxPeerGuardTest(unittest.TestCase):
+    def test_requests_from_peers_go_to_the_origin(self):
+        config = Config(extensions='rpm', cache_path='/tmp/lhc-test-cache', cache_size_limit='1g',
+                        cache_expire='1d', cache_key='$host$uri$is_args$args', mode='docker',
+                        dns_resolver=ORIGIN_IP, ssl=False, peers='10.0.0.1,10.0.0.2')
+        config.hosts[HOST] = Host(HOST, g=config)
+        resolve_upstreams = nginx_conf.resolve_upstreams
+        nginx_conf.resolve_upstreams = lambda config: {}
+        try:
+            conf = nginx_conf.get_nginx_conf(config)
+        finally:
+            nginx_conf.resolve_upstreams = resolve_upstreams
+        lines = [line.strip() for line in conf.splitlines()]
+        to_peers = [i for i, line in enumerate(lines) if line.startswith('proxy_pass') and 'lhc_peers_' in line]
+        self.assertTrue(to_peers)
+        for i in to_peers:
+            # every location sending to the peers first diverts requests carrying the header
+            guard = lines[i - 3:i]
+            self.assertEqual(guard, ['if ($http_x_lhc_peer) {', 'return 418;', '}'])
+        fallbacks = [i for i, line in enumerate(lines) if line.startswith('location @lhc_origin_')]
+        self.assertTrue(fallbacks)
+        for i in fallbacks:
+            block = lines[i:lines.index('}', i)]
+            self.assertIn('proxy_set_header %s "";' % PEER_HEADER, block)
+            self.assertFalse([line for line in block if 'lhc_peers_' in line])
+
+
+if __name__ == '__main__':
+    unittest.main()